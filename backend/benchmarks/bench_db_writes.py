@@ -0,0 +1,91 @@
+"""Chat persistence write-concurrency benchmark.
+
+Runs 1, 8 and 32 concurrent writers that each persist chat turns the way the
+chat endpoints do (user and assistant message plus a session update in one
+commit). It compares a default engine, which is what ``db.dbo`` used before,
+with the tuned engine from ``db.dbo.create_database_engine``. It reports
+throughput, commit latency and "database is locked" failures.
+
+Each engine writes to a fresh database in a temporary folder, so the
+application database is never touched. No Ollama is needed. Run from the
+``backend`` folder:
+
+    python -m benchmarks.bench_db_writes --turns 50
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from benchmarks.stats import summarize
+from db import models
+from db.dbo import Base, create_database_engine
+from fast_api_app.router.chat import new_turn
+
+ANSWER = "The AQI is computed from the concentrations of eight pollutants. " * 8
+
+
+async def setup(db_engine):
+    async with db_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    session_factory = sessionmaker(db_engine, expire_on_commit=False, class_=AsyncSession)
+    async with session_factory() as db:
+        user = models.User(email="bench@example.com", username="bench")
+        db.add(user)
+        await db.flush()
+        session = models.Session(user_id=user.id, name="New Session")
+        db.add(session)
+        await db.commit()
+        return session_factory, session.id
+
+
+async def writer(session_factory, session_id, turns, latencies, errors):
+    for i in range(turns):
+        start = time.perf_counter()
+        try:
+            async with session_factory() as db:
+                session = await db.get(models.Session, session_id)
+                db.add_all(new_turn(session_id, f"question {i}", ANSWER))
+                session.name = f"Session {i}"
+                await db.commit()
+        except OperationalError:
+            errors.append(i)
+            continue
+        latencies.append(time.perf_counter() - start)
+
+
+async def run_level(db_engine, writers, turns):
+    session_factory, session_id = await setup(db_engine)
+    latencies, errors = [], []
+    start = time.perf_counter()
+    await asyncio.gather(*(writer(session_factory, session_id, turns, latencies, errors) for _ in range(writers)))
+    elapsed = time.perf_counter() - start
+    await db_engine.dispose()
+    return summarize(latencies), len(latencies) / elapsed, len(errors)
+
+
+async def main(levels, turns):
+    engines = {
+        "default": lambda url: create_async_engine(url, future=True, echo=False),
+        "tuned": lambda url: create_database_engine(url, pool_size=max(levels), max_overflow=0),
+    }
+    with tempfile.TemporaryDirectory() as folder:
+        for name, make_engine in engines.items():
+            for writers in levels:
+                url = f"sqlite+aiosqlite:///{os.path.join(folder, f'{name}_{writers}.db')}"
+                stats, throughput, errors = await run_level(make_engine(url), writers, turns)
+                print(f"{name:>7} | writers={writers:>3} | {throughput:7.1f} turns/s | p50={stats['p50'] * 1000:7.1f} ms "
+                      f"| p99={stats['p99'] * 1000:7.1f} ms | locked={errors}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--turns", type=int, default=50, help="chat turns persisted by each writer")
+    args = parser.parse_args()
+    asyncio.run(main(args.levels, args.turns))
@@ -0,0 +1,334 @@
+"""End-to-end benchmark suite, runnable without Ollama or a GPU.
+
+Generates a synthetic PDF corpus, starts the fake Ollama server
+(``benchmarks.fake_ollama``) and the API with uvicorn, all in a temporary
+folder so the real vector store, database and embedding cache are left alone.
+Scenarios:
+
+- ``ingest``: full and unchanged (incremental) ingestion, in pages and chunks per second
+- ``latency``: sequential /chat and /chat/stream requests, p50/p95/p99, time to
+  first token and the mean time of each RAG stage from /metrics
+- ``load``: concurrent /chat requests at each ``--concurrency`` level,
+  p50/p95/p99, requests per second, 503s and LLM queue wait
+
+The results are written as JSON with the git commit, so runs on two commits
+can be compared with ``--compare``. Run from the ``backend`` folder:
+
+    python -m benchmarks.bench_e2e --files 20 --pages 10 --concurrency 1 8 32
+    python -m benchmarks.bench_e2e --compare benchmarks/results/<previous>.json
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from benchmarks.bench_startup import free_port, wait_for
+from benchmarks.stats import summarize
+from benchmarks.synthetic_pdfs import generate_corpus, generate_questions
+
+RESULTS_FOLDER = os.path.join(os.path.dirname(__file__), "results")
+SAMPLE_RE = re.compile(r'^(\w+)\{(\w+)="([^"]*)"\} (\S+)$')
+
+
+def git_commit():
+    """Current commit and whether the tree has uncommitted changes."""
+    def git(*args):
+        result = subprocess.run(["git", *args], capture_output=True, text=True)
+        return result.stdout.strip() if result.returncode == 0 else ""
+    return git("rev-parse", "HEAD") or None, bool(git("status", "--porcelain", "--untracked-files=no"))
+
+
+def start(args, env):
+    return subprocess.Popen(args, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, env=env)
+
+
+def stop(process):
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def parse_metrics(text, metric):
+    """Map label value -> value of the single-label samples of a metric in Prometheus text format."""
+    values = {}
+    for line in text.splitlines():
+        match = SAMPLE_RE.match(line)
+        if match and match.group(1) == metric:
+            values[match.group(3)] = float(match.group(4))
+    return values
+
+
+async def histogram_means(client, metric, before):
+    """Mean observed value per label of a histogram since the ``before`` snapshot, in seconds."""
+    text = (await client.get("/metrics/")).text
+    sums, counts = parse_metrics(text, metric + "_sum"), parse_metrics(text, metric + "_count")
+    means = {}
+    for label, count in counts.items():
+        new = count - before.get("counts", {}).get(label, 0.0)
+        if new > 0:
+            means[label] = (sums[label] - before.get("sums", {}).get(label, 0.0)) / new
+    return means, {"sums": sums, "counts": counts}
+
+
+async def histogram_snapshot(client, metric):
+    return (await histogram_means(client, metric, {}))[1]
+
+
+def ms(stats):
+    return {key: value * 1000 if key != "count" else value for key, value in stats.items()}
+
+
+def bench_ingest(folder, persist_directory, pages):
+    from data_ingestion.data_ingest import ingest_data
+    from db.dbo import get_vector_store
+
+    start_time = time.perf_counter()
+    ingest_data(folder, persist_directory, incremental=False)
+    full = time.perf_counter() - start_time
+    start_time = time.perf_counter()
+    ingest_data(folder, persist_directory)
+    unchanged = time.perf_counter() - start_time
+    chunks = get_vector_store(persist_directory)._collection.count()  # type: ignore[attr-defined]
+    size_mb = sum(os.path.getsize(os.path.join(folder, name)) for name in os.listdir(folder)) / 1e6
+    result = {
+        "full_seconds": full, "unchanged_seconds": unchanged, "pages": pages, "chunks": chunks,
+        "pages_per_second": pages / full, "chunks_per_second": chunks / full, "mb_per_second": size_mb / full,
+    }
+    print(f" ingest | full={full:7.2f} s | {result['pages_per_second']:7.1f} pages/s | {result['chunks_per_second']:7.1f} chunks/s "
+          f"| unchanged={unchanged:6.2f} s | chunks={chunks}")
+    return result
+
+
+async def new_session(client, user_id):
+    response = await client.post("/sessions/", json={"user_id": user_id})
+    response.raise_for_status()
+    return response.json()["id"]
+
+
+async def bench_latency(client, user_id, questions):
+    before = await histogram_snapshot(client, "rag_stage_duration_seconds")
+    chat = []
+    for question in questions:
+        session_id = await new_session(client, user_id)
+        start_time = time.perf_counter()
+        response = await client.post("/chat/", json={"user_id": user_id, "session_id": session_id, "query": question})
+        response.raise_for_status()
+        chat.append(time.perf_counter() - start_time)
+    stages, _ = await histogram_means(client, "rag_stage_duration_seconds", before)
+
+    first_tokens, totals = [], []
+    for question in questions:
+        session_id = await new_session(client, user_id)
+        payload = {"user_id": user_id, "session_id": session_id, "query": question + " (streamed)"}
+        start_time = time.perf_counter()
+        first = None
+        async with client.stream("POST", "/chat/stream", json=payload) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if first is None and line == "event: token":
+                    first = time.perf_counter() - start_time
+        totals.append(time.perf_counter() - start_time)
+        if first is not None:
+            first_tokens.append(first)
+
+    result = {
+        "chat_ms": ms(summarize(chat)),
+        "stream_first_token_ms": ms(summarize(first_tokens)),
+        "stream_total_ms": ms(summarize(totals)),
+        "stages_mean_ms": {stage: seconds * 1000 for stage, seconds in sorted(stages.items())},
+    }
+    for name in ("chat_ms", "stream_first_token_ms", "stream_total_ms"):
+        stats = result[name]
+        print(f"latency | {name:<21} | p50={stats['p50']:8.1f} ms | p95={stats['p95']:8.1f} ms | p99={stats['p99']:8.1f} ms")
+    for stage, mean in result["stages_mean_ms"].items():
+        print(f"  {stage:<20} mean={mean:8.1f} ms")
+    return result
+
+
+async def bench_load(client, user_id, questions, concurrency, requests):
+    sessions = [await new_session(client, user_id) for _ in range(concurrency)]
+    pending = iter(questions[:requests])
+    latencies, statuses = [], {}
+
+    async def worker(session_id):
+        for question in pending:
+            start_time = time.perf_counter()
+            try:
+                response = await client.post("/chat/", json={"user_id": user_id, "session_id": session_id, "query": question})
+                status = str(response.status_code)
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            statuses[status] = statuses.get(status, 0) + 1
+            if status == "200":
+                latencies.append(time.perf_counter() - start_time)
+
+    before = await histogram_snapshot(client, "llm_queue_wait_seconds")
+    start_time = time.perf_counter()
+    await asyncio.gather(*(worker(session_id) for session_id in sessions))
+    elapsed = time.perf_counter() - start_time
+    queue_wait, _ = await histogram_means(client, "llm_queue_wait_seconds", before)
+    stats = ms(summarize(latencies))
+    result = {
+        "concurrency": concurrency, "requests": sum(statuses.values()), "statuses": statuses,
+        "rps": len(latencies) / elapsed, "latency_ms": stats,
+        "llm_queue_wait_mean_ms": {priority: seconds * 1000 for priority, seconds in queue_wait.items()},
+    }
+    print(f"   load | concurrency={concurrency:>3} | {result['rps']:6.2f} req/s | p50={stats['p50']:8.1f} ms "
+          f"| p95={stats['p95']:8.1f} ms | p99={stats['p99']:8.1f} ms | 503={statuses.get('503', 0)}")
+    return result
+
+
+async def run_api_scenarios(args, base_url, questions):
+    results = {}
+    limits = httpx.Limits(max_connections=max(args.concurrency) + 8)
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.request_timeout, limits=limits) as client:
+        name = f"bench-{int(time.time() * 1000)}"
+        user = await client.post("/user/", json={"email": f"{name}@example.com", "username": name})
+        user.raise_for_status()
+        user_id = user.json()["id"]
+        # One untimed request loads the collection, the models and the caches
+        await client.post("/chat/", json={"user_id": user_id, "session_id": await new_session(client, user_id),
+                                          "query": "warm up"})
+        offset = 0
+        if "latency" in args.scenarios:
+            results["latency"] = await bench_latency(client, user_id, questions[:args.latency_requests])
+            offset += args.latency_requests
+        if "load" in args.scenarios:
+            results["load"] = []
+            for concurrency in args.concurrency:
+                level_questions = questions[offset:offset + args.load_requests]
+                offset += args.load_requests
+                results["load"].append(await bench_load(client, user_id, level_questions, concurrency, args.load_requests))
+    return results
+
+
+def flatten(data, prefix=""):
+    """Numeric leaves of nested results as {"a.b.c": value}; load levels are keyed by concurrency."""
+    values = {}
+    if isinstance(data, dict):
+        for key, value in data.items():
+            values |= flatten(value, f"{prefix}{key}.")
+    elif isinstance(data, list):
+        for item in data:
+            values |= flatten(item, f"{prefix}c{item.get('concurrency', '?')}.")
+    elif isinstance(data, (int, float)) and not isinstance(data, bool):
+        values[prefix.rstrip(".")] = data
+    return values
+
+
+def compare(previous, current):
+    """Print the change of every metric present in both result files."""
+    old, new = flatten(previous["results"]), flatten(current["results"])
+    print(f"\nCompared with {previous.get('commit') or 'unknown commit'} ({previous.get('timestamp')}):")
+    for key in sorted(old.keys() & new.keys()):
+        if key.endswith((".count", ".concurrency")):
+            continue
+        change = (new[key] - old[key]) / old[key] * 100 if old[key] else 0.0
+        print(f"  {key:<50} {old[key]:12.2f} -> {new[key]:12.2f}  ({change:+6.1f}%)")
+
+
+def main(args):
+    workdir = args.workdir or tempfile.mkdtemp(prefix="rag-bench-")
+    corpus_folder = os.path.join(workdir, "pdfs")
+    persist_directory = os.path.join(workdir, "chroma")
+    generate_corpus(corpus_folder, args.files, args.pages, args.seed)
+    questions = generate_questions(args.latency_requests + args.load_requests * len(args.concurrency) + 1, args.seed)
+
+    ollama_port = free_port()
+    ollama_url = f"http://127.0.0.1:{ollama_port}"
+    # Set before the app modules are imported, the constants read them once
+    os.environ.update({
+        "OLLAMA_HOST": ollama_url,
+        "PERSIST_DIRECTORY": persist_directory,
+        "DATABASE_URL": f"sqlite+aiosqlite:///{os.path.join(workdir, 'rag.db')}",
+        "EMBEDDING_CACHE_PATH": "",
+        "ANONYMIZED_TELEMETRY": "False",
+        "LOG_LEVEL": os.environ.get("LOG_LEVEL", "WARNING"),
+    })
+    env = dict(os.environ)
+    fake = start([
+        sys.executable, "-m", "benchmarks.fake_ollama", "--port", str(ollama_port), "--dim", str(args.dim),
+        "--embed-latency", str(args.embed_latency), "--embed-latency-per-text", str(args.embed_latency_per_text),
+        "--prompt-tokens-per-second", str(args.prompt_tokens_per_second),
+        "--tokens-per-second", str(args.tokens_per_second), "--answer-tokens", str(args.answer_tokens),
+        "--parallel", str(args.parallel),
+    ], env)
+    api = None
+    results = {}
+    try:
+        if wait_for(f"{ollama_url}/api/version", time.perf_counter() + 30) is None:
+            raise SystemExit("The fake Ollama server did not start")
+        ingest = bench_ingest(corpus_folder, persist_directory, args.files * args.pages)
+        if "ingest" in args.scenarios:
+            results["ingest"] = ingest
+        if {"latency", "load"} & set(args.scenarios):
+            api_port = free_port()
+            api = start([sys.executable, "-m", "uvicorn", "main:app", "--port", str(api_port), "--log-level", "warning"], env)
+            base_url = f"http://127.0.0.1:{api_port}"
+            if wait_for(f"{base_url}/health/ready", time.perf_counter() + args.startup_timeout) is None:
+                raise SystemExit(f"The API was not ready within {args.startup_timeout}s")
+            results |= asyncio.run(run_api_scenarios(args, base_url, questions))
+    finally:
+        for process in (api, fake):
+            if process is not None:
+                stop(process)
+        if not args.workdir and not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    commit, dirty = git_commit()
+    report = {
+        "commit": commit,
+        "dirty": dirty,
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "compare", "workdir", "keep")},
+        "results": results,
+    }
+    output = args.output
+    if output is None:
+        stamp = datetime.datetime.now(datetime.timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+        output = os.path.join(RESULTS_FOLDER, f"{stamp}_{(commit or 'nogit')[:10]}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {output}")
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", nargs="+", choices=["ingest", "latency", "load"], default=["ingest", "latency", "load"])
+    parser.add_argument("--files", type=int, default=10, help="synthetic PDFs to ingest")
+    parser.add_argument("--pages", type=int, default=5, help="pages per PDF")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency-requests", type=int, default=20, help="sequential requests of the latency scenario")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32], help="parallel clients of the load scenario")
+    parser.add_argument("--load-requests", type=int, default=64, help="requests per concurrency level")
+    parser.add_argument("--request-timeout", type=float, default=120.0)
+    parser.add_argument("--startup-timeout", type=float, default=120.0)
+    # Fake Ollama settings
+    parser.add_argument("--dim", type=int, default=1024, help="embedding dimension")
+    parser.add_argument("--embed-latency", type=float, default=0.01, help="seconds per embedding request")
+    parser.add_argument("--embed-latency-per-text", type=float, default=0.002, help="extra seconds per embedded text")
+    parser.add_argument("--prompt-tokens-per-second", type=float, default=500.0)
+    parser.add_argument("--tokens-per-second", type=float, default=30.0)
+    parser.add_argument("--answer-tokens", type=int, default=60)
+    parser.add_argument("--parallel", type=int, default=1, help="generations the fake Ollama serves at once")
+    # Output
+    parser.add_argument("--output", help="results file, defaults to benchmarks/results/<time>_<commit>.json")
+    parser.add_argument("--compare", help="previous results file to compare with")
+    parser.add_argument("--workdir", help="folder for the corpus, vector store and database (kept), defaults to a temporary one")
+    parser.add_argument("--keep", action="store_true", help="keep the temporary folder")
+    main(parser.parse_args())
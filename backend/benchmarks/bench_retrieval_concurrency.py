@@ -0,0 +1,70 @@
+"""Retrieval concurrency benchmark.
+
+Fires 1, 8 and 32 parallel retrievals at the configured vector store and reports
+p50/p99 latency for the old blocking path (``_retriever.invoke`` called on the
+event loop) and the thread-pool path used by ``rag.rag.retrieve``. Every
+request asks a question never asked before, so it calls the embedding model
+instead of being answered by the embedding cache.
+
+Needs the Ollama embedding model and an ingested Chroma directory. Run from the
+``backend`` folder:
+
+    python -m benchmarks.bench_retrieval_concurrency --rounds 5
+"""
+import argparse
+import asyncio
+import itertools
+import time
+
+from benchmarks.stats import summarize
+from rag import rag
+
+QUESTIONS = [
+    "What is AQI?",
+    "What are the PM2.5 limits?",
+    "How did air quality change during Deepawali?",
+    "What is the national action plan for climate change?",
+]
+_request_ids = itertools.count()
+
+
+def unique_question(i):
+    """The i-th question with a suffix that makes its text, and so its embedding cache key, new."""
+    return f"{QUESTIONS[i % len(QUESTIONS)]} (request {next(_request_ids)})"
+
+
+async def blocking_retrieve(question):
+    # What run_rag did before: a synchronous call inside the coroutine
+    return rag.get_rag_retriever().invoke(question)
+
+
+async def timed(fn, question, submitted):
+    # Measured from submission so time spent queued behind a blocked loop counts
+    await fn(question)
+    return time.perf_counter() - submitted
+
+
+async def run_level(fn, parallel, rounds):
+    latencies = []
+    for _ in range(rounds):
+        submitted = time.perf_counter()
+        tasks = [timed(fn, unique_question(i), submitted) for i in range(parallel)]
+        latencies.extend(await asyncio.gather(*tasks))
+    return latencies
+
+
+async def main(levels, rounds):
+    # Warm the embedding client and the index before measuring
+    await rag.retrieve(QUESTIONS[0])
+    for name, fn in (("blocking", blocking_retrieve), ("executor", rag.retrieve)):
+        for parallel in levels:
+            stats = summarize(await run_level(fn, parallel, rounds))
+            print(f"{name:>9} | parallel={parallel:>3} | p50={stats['p50'] * 1000:8.1f} ms | p99={stats['p99'] * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+    asyncio.run(main(args.levels, args.rounds))
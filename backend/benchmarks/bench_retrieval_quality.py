@@ -0,0 +1,69 @@
+"""Retrieval quality and latency benchmark.
+
+Runs a small set of labelled questions through dense (Chroma), lexical (BM25),
+hybrid (reciprocal rank fusion) and reranked hybrid retrieval and reports
+hit@k, MRR, the average number of passages kept and latency. A hit is a
+retrieved chunk whose source file name contains the expected fragment.
+
+Needs an ingested corpus (with its BM25 index) and the embedding model. Run
+from the ``backend`` folder:
+
+    python -m benchmarks.bench_retrieval_quality --k 4
+"""
+import argparse
+import time
+
+from utils.constants import HYBRID_FETCH_K
+from benchmarks.stats import summarize
+from db.dbo import get_vector_store
+from rag.retrievers import HybridRetriever, load_bm25_index
+
+# (question, fragment of the expected source file name)
+LABELLED_QUESTIONS = [
+    ("PM2.5 levels on Deepawali 2010", "Deepawali_2010"),
+    ("PM10 and NO2 during Deepawali 2018", "Deepawali-2018"),
+    ("Noise levels on Diwali night 2019", "Deepawali-2019"),
+    ("SO2 concentration Deepawali 2016", "Deepawali_2016"),
+    ("Air quality during Janta Curfew", "jantacurfew"),
+    ("National Action Plan on Climate Change missions", "national action plan"),
+    ("National Clean Air Programme targets", "npac"),
+    ("Monitoring locations AQI 2021", "Location_data_2021"),
+]
+
+
+def evaluate(name, search, k):
+    hits, reciprocal_ranks, latencies, kept = 0, [], [], 0
+    for question, expected in LABELLED_QUESTIONS:
+        start = time.perf_counter()
+        docs = search(question)[:k]
+        latencies.append(time.perf_counter() - start)
+        kept += len(docs)
+        rank = next((i + 1 for i, d in enumerate(docs) if expected in d.metadata.get("source", "")), None)
+        hits += rank is not None
+        reciprocal_ranks.append(1 / rank if rank else 0.0)
+    stats = summarize(latencies)
+    print(f"{name:>7} | hit@{k}={hits / len(LABELLED_QUESTIONS):.2f} | MRR={sum(reciprocal_ranks) / len(reciprocal_ranks):.2f} "
+          f"| kept={kept / len(LABELLED_QUESTIONS):.1f} | p50={stats['p50'] * 1000:7.1f} ms | p99={stats['p99'] * 1000:7.1f} ms")
+
+
+def main(k, fetch_k):
+    vectordb = get_vector_store()
+    index = load_bm25_index()
+    if index is None:
+        raise SystemExit("No BM25 index found, run data ingestion first")
+    hybrid = HybridRetriever(vectorstore=vectordb, k=k, fetch_k=fetch_k, reranker="none")
+    reranked = HybridRetriever(vectorstore=vectordb, k=k, fetch_k=fetch_k)
+    # Warm up the embedding client and the index
+    vectordb.similarity_search(LABELLED_QUESTIONS[0][0], k=1)
+    evaluate("dense", lambda q: vectordb.similarity_search(q, k=k), k)
+    evaluate("bm25", lambda q: index.get_documents(q, k=k), k)
+    evaluate("hybrid", hybrid.invoke, k)
+    evaluate("rerank", reranked.invoke, k)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--fetch-k", type=int, default=HYBRID_FETCH_K)
+    args = parser.parse_args()
+    main(args.k, args.fetch_k)
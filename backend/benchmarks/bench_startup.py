@@ -0,0 +1,113 @@
+"""Import-time and cold-start benchmark.
+
+Measures how long ``import main`` takes (and which top-level imports cost the
+most, from ``python -X importtime``), then starts the API with uvicorn and
+reports the time until ``/health/live`` first answers 200 (the server
+accepts traffic) and until ``/health/ready`` does (the RAG components are
+loaded).
+
+Readiness needs Ollama and the vector store; without them only the liveness
+time is meaningful. Run from the ``backend`` folder:
+
+    python -m benchmarks.bench_startup --runs 3
+"""
+import argparse
+import os
+import re
+import socket
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+from benchmarks.stats import summarize
+
+IMPORTTIME_RE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def import_profile():
+    """Return the cumulative import time of main and its direct imports, in seconds."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        capture_output=True, text=True, env=os.environ | {"ANONYMIZED_TELEMETRY": "False"},
+    )
+    modules = {}
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_RE.match(line)
+        if match:
+            _, cumulative, indent, name = match.groups()
+            # Depth 0 is main itself, depth 1 its direct imports
+            depth = (len(indent) - 1) // 2
+            if depth <= 1:
+                modules[name] = int(cumulative) / 1e6
+    return modules
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for(url, deadline):
+    while time.perf_counter() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=1) as response:
+                if response.status == 200:
+                    return time.perf_counter()
+        except (urllib.error.URLError, ConnectionError, OSError):
+            pass
+        time.sleep(0.01)
+    return None
+
+
+def cold_start(timeout):
+    """Start uvicorn and return the seconds until /health/live and /health/ready answer 200."""
+    port = free_port()
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, env=os.environ | {"ANONYMIZED_TELEMETRY": "False"},
+    )
+    try:
+        deadline = start + timeout
+        live = wait_for(f"http://127.0.0.1:{port}/health/live", deadline)
+        ready = wait_for(f"http://127.0.0.1:{port}/health/ready", deadline)
+    finally:
+        server.terminate()
+        server.wait()
+    return (live - start if live else None), (ready - start if ready else None)
+
+
+def main(runs, timeout, top):
+    imports = [import_profile() for _ in range(runs)]
+    totals = [profile.get("main", 0.0) for profile in imports]
+    stats = summarize(totals)
+    print(f"import main     | p50={stats['p50'] * 1000:7.1f} ms | max={stats['max'] * 1000:7.1f} ms")
+    slowest = sorted(((name, t) for name, t in imports[-1].items() if name != "main"), key=lambda item: item[1], reverse=True)
+    for name, seconds in slowest[:top]:
+        print(f"  {name:<40} {seconds * 1000:7.1f} ms")
+
+    lives, readies = [], []
+    for _ in range(runs):
+        live, ready = cold_start(timeout)
+        if live is not None:
+            lives.append(live)
+        if ready is not None:
+            readies.append(ready)
+    for name, values in (("first 200", lives), ("ready", readies)):
+        if not values:
+            print(f"{name:<15} | not reached within {timeout}s")
+            continue
+        stats = summarize(values)
+        print(f"{name:<15} | p50={stats['p50'] * 1000:7.1f} ms | max={stats['max'] * 1000:7.1f} ms | runs={len(values)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--timeout", type=float, default=60.0, help="seconds to wait for the server to become ready")
+    parser.add_argument("--top", type=int, default=10, help="number of slowest direct imports to list")
+    args = parser.parse_args()
+    main(args.runs, args.timeout, args.top)
@@ -0,0 +1,128 @@
+"""Stand-in for the Ollama HTTP API, to benchmark without a GPU or models.
+
+Serves ``/api/embed`` and ``/api/chat`` (streamed or not) with configurable
+latencies. Embeddings are hashed bags of words, normalized, so texts sharing
+words are close and retrieval still behaves like retrieval. Generation waits
+for the prompt to be "read" at ``--prompt-tokens-per-second``, then emits
+``--answer-tokens`` tokens at ``--tokens-per-second``, with at most
+``--parallel`` generations at once like a single Ollama instance.
+
+Point the app at it with ``OLLAMA_HOST``. Run from the ``backend`` folder:
+
+    python -m benchmarks.fake_ollama --port 11435 --tokens-per-second 30
+    OLLAMA_HOST=http://127.0.0.1:11435 uvicorn main:app
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import re
+import time
+
+import numpy as np
+from fastapi import FastAPI, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse
+
+WORD_RE = re.compile(r"\w+")
+CHARS_PER_TOKEN = 4
+
+
+def embed(text, dim):
+    vector = np.zeros(dim, dtype=np.float32)
+    for word in WORD_RE.findall(text.lower()):
+        vector[int.from_bytes(hashlib.blake2b(word.encode(), digest_size=8).digest(), "little") % dim] += 1.0
+    norm = np.linalg.norm(vector)
+    return (vector / norm if norm else vector).tolist()
+
+
+def create_app(dim=1024, embed_latency=0.01, embed_latency_per_text=0.002, prompt_tokens_per_second=500.0,
+               tokens_per_second=30.0, answer_tokens=60, parallel=1):
+    """Build the fake Ollama app.
+
+    Args:
+        dim (int, optional): Embedding dimension. Defaults to 1024 (mxbai-embed-large).
+        embed_latency (float, optional): Seconds per embedding request. Defaults to 0.01.
+        embed_latency_per_text (float, optional): Extra seconds per embedded text. Defaults to 0.002.
+        prompt_tokens_per_second (float, optional): Prompt processing speed, 0 to skip it. Defaults to 500.
+        tokens_per_second (float, optional): Generation speed. Defaults to 30.
+        answer_tokens (int, optional): Tokens per answer. Defaults to 60.
+        parallel (int, optional): Generations served at once, the others wait. Defaults to 1.
+    """
+    app = FastAPI()
+    slots = asyncio.Semaphore(parallel)
+    words = "Based on the context the reported level was within the expected range for that period".split()
+
+    @app.get("/")
+    async def root():
+        return PlainTextResponse("Ollama is running")
+
+    @app.get("/api/version")
+    async def version():
+        return {"version": "0.0.0-fake"}
+
+    @app.get("/api/tags")
+    async def tags():
+        return {"models": []}
+
+    @app.post("/api/show")
+    async def show():
+        return {}
+
+    @app.post("/api/embed")
+    async def embed_texts(request: Request):
+        body = await request.json()
+        texts = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        await asyncio.sleep(embed_latency + embed_latency_per_text * len(texts))
+        return {"model": body["model"], "embeddings": [embed(text, dim) for text in texts]}
+
+    @app.post("/api/chat")
+    async def chat(request: Request):
+        body = await request.json()
+        prompt_tokens = sum(len(m.get("content") or "") for m in body["messages"]) // CHARS_PER_TOKEN
+        tokens = [words[i % len(words)] + " " for i in range(answer_tokens)]
+
+        def message(content, done):
+            data = {"model": body["model"], "created_at": "1970-01-01T00:00:00Z",
+                    "message": {"role": "assistant", "content": content}, "done": done}
+            if done:
+                data |= {"done_reason": "stop", "prompt_eval_count": prompt_tokens, "eval_count": answer_tokens}
+            return data
+
+        async def generate():
+            async with slots:
+                if prompt_tokens_per_second:
+                    await asyncio.sleep(prompt_tokens / prompt_tokens_per_second)
+                start = time.perf_counter()
+                for i, token in enumerate(tokens):
+                    # Paced against the start so the sleep overhead does not add up
+                    await asyncio.sleep(max(0.0, start + (i + 1) / tokens_per_second - time.perf_counter()))
+                    yield token
+
+        if body.get("stream", True):
+            async def stream():
+                async for token in generate():
+                    yield json.dumps(message(token, False)) + "\n"
+                yield json.dumps(message("", True)) + "\n"
+            return StreamingResponse(stream(), media_type="application/x-ndjson")
+        return message("".join([token async for token in generate()]), True)
+
+    return app
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--dim", type=int, default=1024)
+    parser.add_argument("--embed-latency", type=float, default=0.01, help="seconds per embedding request")
+    parser.add_argument("--embed-latency-per-text", type=float, default=0.002, help="extra seconds per embedded text")
+    parser.add_argument("--prompt-tokens-per-second", type=float, default=500.0, help="0 skips prompt processing")
+    parser.add_argument("--tokens-per-second", type=float, default=30.0)
+    parser.add_argument("--answer-tokens", type=int, default=60)
+    parser.add_argument("--parallel", type=int, default=1, help="generations served at once")
+    args = parser.parse_args()
+    fake = create_app(args.dim, args.embed_latency, args.embed_latency_per_text, args.prompt_tokens_per_second,
+                      args.tokens_per_second, args.answer_tokens, args.parallel)
+    uvicorn.run(fake, host=args.host, port=args.port, log_level="warning")
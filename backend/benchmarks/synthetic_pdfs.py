@@ -0,0 +1,193 @@
+"""Synthetic PDF corpus generator.
+
+Writes air quality reports made of prose paragraphs and ruled tables of
+pollutant readings, so both the text and the table extraction paths of the
+ingestion are exercised. The PDFs are written directly (Helvetica text and
+line drawings, no extra dependency) and are the same for a given seed.
+
+Run from the ``backend`` folder:
+
+    python -m benchmarks.synthetic_pdfs /tmp/corpus --files 20 --pages 10
+"""
+import argparse
+import os
+import random
+
+CITIES = ["Delhi", "Mumbai", "Kolkata", "Chennai", "Bengaluru", "Hyderabad", "Lucknow", "Patna", "Jaipur", "Pune",
+          "Ahmedabad", "Kanpur", "Nagpur", "Indore", "Bhopal", "Varanasi", "Agra", "Ludhiana", "Amritsar", "Guwahati"]
+POLLUTANTS = ["PM2.5", "PM10", "NO2", "SO2", "CO", "O3", "NH3", "benzene"]
+YEARS = list(range(2010, 2024))
+EVENTS = ["Deepawali", "winter inversion", "crop residue burning", "monsoon onset", "lockdown", "dust storm"]
+SENTENCES = [
+    "The {pollutant} concentration in {city} averaged {value} ug/m3 during {event} {year}.",
+    "Monitoring stations in {city} recorded {pollutant} above the national standard on {days} days in {year}.",
+    "Compared with {year}, the {event} period showed a {change} percent change in {pollutant} levels in {city}.",
+    "The air quality index of {city} stayed in the {category} category for most of {event} {year}.",
+    "Emission inventories attribute the {pollutant} load in {city} mainly to {source}.",
+    "The National Clean Air Programme targets a reduction of {change} percent in {pollutant} for {city} by {year}.",
+]
+CATEGORIES = ["good", "satisfactory", "moderate", "poor", "very poor", "severe"]
+SOURCES = ["vehicular traffic", "industrial stacks", "road dust", "biomass burning", "construction activity"]
+
+PAGE_WIDTH, PAGE_HEIGHT = 612, 792
+MARGIN = 50
+FONT_SIZE = 10
+LINE_HEIGHT = 14
+CHARS_PER_LINE = 95
+ROW_HEIGHT = 18
+
+
+def sentence(rng):
+    return rng.choice(SENTENCES).format(
+        pollutant=rng.choice(POLLUTANTS), city=rng.choice(CITIES), year=rng.choice(YEARS), event=rng.choice(EVENTS),
+        value=rng.randint(20, 450), days=rng.randint(5, 200), change=rng.randint(5, 60),
+        category=rng.choice(CATEGORIES), source=rng.choice(SOURCES),
+    )
+
+
+def wrap(text, width=CHARS_PER_LINE):
+    lines, line = [], ""
+    for word in text.split():
+        if line and len(line) + 1 + len(word) > width:
+            lines.append(line)
+            line = word
+        else:
+            line = f"{line} {word}" if line else word
+    if line:
+        lines.append(line)
+    return lines
+
+
+def escape_text(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def text_op(x, y, text):
+    return f"BT /F1 {FONT_SIZE} Tf {x} {y} Td ({escape_text(text)}) Tj ET"
+
+
+def table_ops(top, rows):
+    """Drawing operators of a ruled table whose top edge is at ``top``, and the y below it."""
+    columns = len(rows[0])
+    width = (PAGE_WIDTH - 2 * MARGIN) / columns
+    bottom = top - ROW_HEIGHT * len(rows)
+    ops = ["0.5 w"]
+    for i in range(len(rows) + 1):
+        y = top - i * ROW_HEIGHT
+        ops.append(f"{MARGIN} {y} m {PAGE_WIDTH - MARGIN} {y} l S")
+    for j in range(columns + 1):
+        x = MARGIN + j * width
+        ops.append(f"{x:.1f} {top} m {x:.1f} {bottom} l S")
+    for i, row in enumerate(rows):
+        for j, cell in enumerate(row):
+            ops.append(text_op(round(MARGIN + j * width + 4, 1), top - (i + 1) * ROW_HEIGHT + 5, cell))
+    return ops, bottom
+
+
+def page_content(rng, title, table_every):
+    """PDF drawing operators of one report page."""
+    y = PAGE_HEIGHT - MARGIN
+    ops = [text_op(MARGIN, y, title)]
+    y -= 2 * LINE_HEIGHT
+    paragraph = 0
+    while y > MARGIN + 4 * LINE_HEIGHT:
+        paragraph += 1
+        if table_every and paragraph % table_every == 0:
+            pollutants = rng.sample(POLLUTANTS, 4)
+            rows = [["City", "Year"] + pollutants]
+            for _ in range(rng.randint(3, 8)):
+                rows.append([rng.choice(CITIES), str(rng.choice(YEARS))] + [str(rng.randint(5, 450)) for _ in pollutants])
+            if y - ROW_HEIGHT * len(rows) < MARGIN:
+                break
+            table, y = table_ops(y, rows)
+            ops.extend(table)
+            y -= LINE_HEIGHT
+            continue
+        for line in wrap(" ".join(sentence(rng) for _ in range(rng.randint(3, 6)))):
+            if y < MARGIN:
+                break
+            ops.append(text_op(MARGIN, y, line))
+            y -= LINE_HEIGHT
+        y -= LINE_HEIGHT
+    return "\n".join(ops)
+
+
+def write_pdf(path, contents):
+    """Write a PDF with one page per content stream, in Helvetica."""
+    # Objects 1-3 are the catalog, the page tree and the font, then a page and its content stream per page
+    pages = len(contents)
+    kids = " ".join(f"{4 + 2 * i} 0 R" for i in range(pages))
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        f"<< /Type /Pages /Kids [{kids}] /Count {pages} >>".encode(),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+    ]
+    for i, content in enumerate(contents):
+        stream = content.encode("latin-1", errors="replace")
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {PAGE_WIDTH} {PAGE_HEIGHT}] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {5 + 2 * i} 0 R >>".encode()
+        )
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n".encode() + stream + b"\nendstream")
+    data = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(data))
+        data += f"{number} 0 obj\n".encode() + body + b"\nendobj\n"
+    xref = len(data)
+    data += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    data += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode()
+    data += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def generate_corpus(folder, files=10, pages=5, seed=0, table_every=3):
+    """Write ``files`` reports of ``pages`` pages to ``folder``.
+
+    Args:
+        folder (str): Output folder, created if needed.
+        files (int, optional): Number of PDFs. Defaults to 10.
+        pages (int, optional): Pages per PDF. Defaults to 5.
+        seed (int, optional): Random seed, the same seed writes the same corpus. Defaults to 0.
+        table_every (int, optional): Every n-th block of a page is a table, 0 for text only. Defaults to 3.
+
+    Returns:
+        list: The paths of the written PDFs.
+    """
+    os.makedirs(folder, exist_ok=True)
+    rng = random.Random(seed)
+    paths = []
+    for n in range(files):
+        city, year = rng.choice(CITIES), rng.choice(YEARS)
+        title = f"Air quality report {n + 1}: {city} {year}"
+        contents = [page_content(rng, f"{title} - page {p + 1}", table_every) for p in range(pages)]
+        path = os.path.join(folder, f"report_{n + 1:04d}_{city}_{year}.pdf")
+        write_pdf(path, contents)
+        paths.append(path)
+    return paths
+
+
+def generate_questions(count, seed=0):
+    """Distinct questions about the synthetic corpus, so the answer cache does not serve them."""
+    rng = random.Random(seed)
+    limit = min(count, len(POLLUTANTS) * len(CITIES) * len(EVENTS) * len(YEARS))
+    questions, seen = [], set()
+    while len(questions) < limit:
+        question = (f"What was the {rng.choice(POLLUTANTS)} level in {rng.choice(CITIES)} during "
+                    f"{rng.choice(EVENTS)} {rng.choice(YEARS)}?")
+        if question not in seen:
+            seen.add(question)
+            questions.append(question)
+    return questions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("folder")
+    parser.add_argument("--files", type=int, default=10)
+    parser.add_argument("--pages", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--table-every", type=int, default=3, help="every n-th block of a page is a table, 0 for none")
+    args = parser.parse_args()
+    written = generate_corpus(args.folder, args.files, args.pages, args.seed, args.table_every)
+    print(f"Wrote {len(written)} PDFs of {args.pages} pages to {args.folder}")
@@ -1,21 +1,43 @@
 import sys
 sys.path.append(r"C:\Users\SHUBHAM\projects\udemy-KN\2_rag\backend")
-from utils.constants import PERSIST_DIRECTORY, DATA_FOLDER
+from utils.constants import (PERSIST_DIRECTORY, DATA_FOLDER, INGEST_WORKERS, INGEST_PAGES_PER_TASK, INGEST_PDF_ENGINE,
+                             INGEST_MANIFEST_FILE, EMBED_BATCH_SIZE, EMBED_MAX_IN_FLIGHT, BM25_INDEX_FILE,
+                             TABLE_CHUNK_SIZE, CHUNKER_VERSION, CHROMA_COLLECTION, RETRIEVAL_BACKEND)
 from utils.utils import get_embedding_model, get_logger, timeit
+from db.dbo import AsyncSessionLocal, bump_corpus_version, collection_directory, engine, get_corpus_version, open_chroma
+from db.models import CollectionAccess
+from rag.bm25 import BM25Index
+from rag.snapshot import SnapshotIndex
 
-from langchain_community.document_loaders import PyPDFLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain.schema import Document
-from langchain_chroma import Chroma
 
 
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import islice
+import argparse
+from pdfminer.pdfdocument import PDFNoPageLabels
+import asyncio
+import hashlib
+import json
 import time
 import pdfplumber
+import pypdf
 import os
 
 logger = get_logger()
 
 
+def markdown_row(cells):
+    """Format one table row as a Markdown line.
+
+    Empty cells (None) become blank and line breaks inside a cell are
+    flattened, so every row stays on one line.
+    """
+    return "| " + " | ".join("" if c is None else str(c).replace("\n", " ").replace("|", "\\|") for c in cells) + " |\n"
+
+
 def table_to_markdown(table):
     """Convert a table (list of lists) to a Markdown table.
 
@@ -25,56 +47,262 @@ def table_to_markdown(table):
     Returns:
         str: The Markdown representation of the table.
     """
-    markdown = "| " + " | ".join(map(str, table[0])) + " |\n"
-    markdown += "| " + " | ".join(["---"] * len(table[0])) + " |\n"
-    for row in table[1:]:
-        markdown += "| " + " | ".join(map(str, row)) + " |\n"
-    return markdown
+    lines = [markdown_row(table[0]), markdown_row(["---"] * len(table[0]))]
+    lines.extend(markdown_row(row) for row in table[1:])
+    return "".join(lines)
 
 
-@timeit
-def extract_text_and_tables(pdf_path):
-    """Extract text and tables from a PDF file.
+def split_table(table, chunk_size=TABLE_CHUNK_SIZE):
+    """Split a table into Markdown chunks of whole rows, each repeating the header.
+
+    Rows are grouped until a chunk would exceed ``chunk_size`` characters; a
+    single row longer than that still gets a chunk of its own.
+
+    Args:
+        table (list): A list of lists representing the table, header row first.
+        chunk_size (int, optional): Maximum characters per chunk. Defaults to TABLE_CHUNK_SIZE.
+
+    Returns:
+        list: Tuples of (Markdown chunk, first row, last row), rows numbered from 1 after the header.
+    """
+    header = markdown_row(table[0]) + markdown_row(["---"] * len(table[0]))
+    chunks = []
+    rows, size, first = [], len(header), 1
+    for number, row in enumerate(table[1:], start=1):
+        line = markdown_row(row)
+        if rows and size + len(line) > chunk_size:
+            chunks.append((header + "".join(rows), first, number - 1))
+            rows, size, first = [], len(header), number
+        rows.append(line)
+        size += len(line)
+    if rows or not chunks:
+        chunks.append((header + "".join(rows), first, first + len(rows) - 1))
+    return chunks
+
+
+def count_pages(pdf_path):
+    """Return the number of pages of a PDF file, read from its page tree without parsing the pages."""
+    return len(pypdf.PdfReader(pdf_path).pages)
+
+
+def iter_pdf_pages(pdf_path, start=0, stop=None, total_pages=None):
+    """Walk the pages of a PDF file once, yielding each page's text and tables.
+
+    Text and tables come from the same pdfplumber parse of the page. Only the
+    pages of the range are loaded, and each page's parsed objects are released
+    before moving on, so only one page is held in memory at a time.
+
+    Args:
+        pdf_path (str): The path to the PDF file.
+        start (int, optional): Index of the first page (0-based). Defaults to 0.
+        stop (int, optional): Index after the last page. Defaults to the end of the document.
+        total_pages (int, optional): Number of pages of the file, counted if not given.
+
+    Yields:
+        tuple: The page text Document and the list of tables found on the page.
+    """
+    if total_pages is None:
+        total_pages = count_pages(pdf_path)
+    stop = total_pages if stop is None else min(stop, total_pages)
+    if start >= stop:
+        return
+    with pdfplumber.open(pdf_path, pages=range(start + 1, stop + 1)) as pdf:
+        try:
+            page_labels = list(islice(pdf.doc.get_page_labels(), start, stop))
+        except PDFNoPageLabels:
+            page_labels = [str(i + 1) for i in range(start, stop)]
+        for offset, page in enumerate(pdf.pages):
+            text_doc = Document(
+                page_content=(page.extract_text() or "").strip(),
+                metadata={
+                    "source": pdf_path,
+                    "total_pages": total_pages,
+                    "page": page.page_number - 1,
+                    "page_label": page_labels[offset],
+                },
+            )
+            tables = [{"table": table, "page": page.page_number, "index": index, "source": pdf_path}
+                      for index, table in enumerate(page.extract_tables())]
+            page.close()
+            yield text_doc, tables
+
+
+def extract_page_range(pdf_path, start=0, stop=None, total_pages=None, engine=INGEST_PDF_ENGINE):
+    """Extract text and tables from a range of pages of a PDF file.
 
     Args:
         pdf_path (str): The path to the PDF file.
+        start (int, optional): Index of the first page (0-based). Defaults to 0.
+        stop (int, optional): Index after the last page. Defaults to the end of the document.
+        total_pages (int, optional): Number of pages of the file, counted if not given.
+        engine (str, optional): "pdfplumber" for a single pass, "pypdf" for separate text and table passes. Defaults to INGEST_PDF_ENGINE.
 
     Returns:
         tuple: A tuple containing the extracted text documents and tables.
     """
-    # Text extraction
-    loader = PyPDFLoader(pdf_path)
-    text_docs = loader.load()
+    if engine == "pdfplumber":
+        text_docs, tables = [], []
+        for text_doc, page_tables in iter_pdf_pages(pdf_path, start, stop, total_pages):
+            text_docs.append(text_doc)
+            tables.extend(page_tables)
+        return text_docs, tables
+
+    # Text extraction, one Document per page like PyPDFLoader
+    reader = pypdf.PdfReader(pdf_path)
+    if total_pages is None:
+        total_pages = len(reader.pages)
+    stop = total_pages if stop is None else min(stop, total_pages)
+    if start >= stop:
+        return [], []
+    # Computed for the whole file on every access
+    page_labels = reader.page_labels
+    text_docs = []
+    for page_number in range(start, stop):
+        text_docs.append(Document(
+            page_content=reader.pages[page_number].extract_text().strip(),
+            metadata={
+                "source": pdf_path,
+                "total_pages": total_pages,
+                "page": page_number,
+                "page_label": page_labels[page_number],
+            },
+        ))
 
     # Table extraction
-    with pdfplumber.open(pdf_path) as pdf:
+    with pdfplumber.open(pdf_path, pages=range(start + 1, stop + 1)) as pdf:
         tables = []
         for page in pdf.pages:
-            for table in page.extract_tables():
-                tables.append({"table": table, "page": page.page_number})
+            for index, table in enumerate(page.extract_tables()):
+                tables.append({"table": table, "page": page.page_number, "index": index, "source": pdf_path})
     return text_docs, tables
 
 
 @timeit
-def read_all_data(path_to_data_folder):
+def extract_text_and_tables(pdf_path):
+    """Extract text and tables from a PDF file.
+
+    Args:
+        pdf_path (str): The path to the PDF file.
+
+    Returns:
+        tuple: A tuple containing the extracted text documents and tables.
+    """
+    return extract_page_range(pdf_path)
+
+
+def plan_extraction_tasks(pdf_paths, pages_per_task=INGEST_PAGES_PER_TASK):
+    """Split PDF files into (pdf_path, start, stop, total_pages) page range tasks.
+
+    Args:
+        pdf_paths (list): The paths to the PDF files.
+        pages_per_task (int, optional): Maximum number of pages per task. Defaults to INGEST_PAGES_PER_TASK.
+
+    Returns:
+        list: The tasks, ordered by file and page.
+    """
+    tasks = []
+    for pdf_path in pdf_paths:
+        total_pages = count_pages(pdf_path)
+        for start in range(0, max(total_pages, 1), pages_per_task):
+            tasks.append((pdf_path, start, min(start + pages_per_task, total_pages), total_pages))
+    return tasks
+
+
+def list_pdf_files(path_to_data_folder):
+    """List the PDF files of a folder, sorted by name.
+
+    Args:
+        path_to_data_folder (str): The path to the folder containing PDF files.
+
+    Returns:
+        list: The paths to the PDF files.
+    """
+    return [
+        os.path.join(path_to_data_folder, file_name)
+        for file_name in sorted(os.listdir(path_to_data_folder))
+        if file_name.endswith(".pdf")
+    ]
+
+
+@timeit
+def read_all_data(path_to_data_folder, workers=INGEST_WORKERS):
     """Read all PDF files in a folder and extract text and tables.
 
     Args:
         path_to_data_folder (str): The path to the folder containing PDF files.
+        workers (int, optional): Number of worker processes. Defaults to INGEST_WORKERS.
+
+    Returns:
+        tuple: A tuple containing all extracted text documents and tables.
+    """
+    return read_pdf_files(list_pdf_files(path_to_data_folder), workers)
+
+
+def iter_extracted_files(pdf_paths, workers=INGEST_WORKERS):
+    """Extract PDF files page range by page range, yielding each range as soon as it is done.
+
+    Files, and page ranges of large files, are parsed in a process pool when
+    ``workers`` is greater than one. At most ``2 * workers`` tasks are in
+    flight, and ranges are yielded in file and page order, so the output does
+    not depend on the number of workers and the ranges of a file are
+    consecutive. At most INGEST_PAGES_PER_TASK pages of a file are held at once.
+
+    Args:
+        pdf_paths (list): The paths to the PDF files.
+        workers (int, optional): Number of worker processes. Defaults to INGEST_WORKERS.
+
+    Yields:
+        tuple: The PDF path, and the text documents and tables of one of its page ranges.
+    """
+    tasks = plan_extraction_tasks(pdf_paths)
+    logger.info(f"Processing {len(pdf_paths)} files as {len(tasks)} tasks with {workers} worker(s)")
+    if workers > 1 and len(tasks) > 1:
+        executor = ProcessPoolExecutor(max_workers=min(workers, len(tasks)))
+        pending = deque()
+        task_iter = iter(tasks)
+
+        def results():
+            for task in task_iter:
+                pending.append((task, executor.submit(extract_page_range, *task)))
+                if len(pending) >= 2 * workers:
+                    head, future = pending.popleft()
+                    yield head, future.result()
+            while pending:
+                head, future = pending.popleft()
+                yield head, future.result()
+    else:
+        executor = None
+
+        def results():
+            for task in tasks:
+                yield task, extract_page_range(*task)
+
+    try:
+        for (pdf_path, start, stop, total_pages), (text_docs, tables) in results():
+            logger.info(f"Extracted {len(text_docs)} text documents and {len(tables)} tables from "
+                        f"{os.path.basename(pdf_path)} (pages {start + 1}-{stop} of {total_pages})")
+            yield pdf_path, text_docs, tables
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+
+@timeit
+def read_pdf_files(pdf_paths, workers=INGEST_WORKERS):
+    """Extract text and tables from a list of PDF files.
+
+    Args:
+        pdf_paths (list): The paths to the PDF files.
+        workers (int, optional): Number of worker processes. Defaults to INGEST_WORKERS.
 
     Returns:
         tuple: A tuple containing all extracted text documents and tables.
     """
     list_text_docs = []
     list_tables = []
-    for file_name in os.listdir(path_to_data_folder):
-        if file_name.endswith(".pdf"):
-            pdf_path = os.path.join(path_to_data_folder, file_name)
-            logger.info(f"Processing file: {file_name}")
-            text_docs, tables = extract_text_and_tables(pdf_path)
-            logger.info(f"Extracted {len(text_docs)} text documents and {len(tables)} tables from {file_name}")
-            list_text_docs.extend(text_docs)
-            list_tables.extend(tables)
+    for _, text_docs, tables in iter_extracted_files(pdf_paths, workers):
+        list_text_docs.extend(text_docs)
+        list_tables.extend(tables)
     return list_text_docs, list_tables
 
 
@@ -101,6 +329,10 @@ def split_text_data(text_docs):
 def split_table_data(list_of_tables):
     """Split table data into smaller chunks.
 
+    Large tables are split into row groups that repeat the header row (see
+    ``split_table``); each chunk records the rows it covers and the position
+    of its table on the page, so groups of different tables are never joined.
+
     Args:
         list_of_tables (list): A list of tables.
 
@@ -109,11 +341,19 @@ def split_table_data(list_of_tables):
     """
     table_docs = []
     for table in list_of_tables:
-        table_md = table_to_markdown(table["table"])
-        table_docs.append({
-            "page": table["page"],
-            "content": table_md
-        })
+        if not table["table"]:
+            continue
+        total_rows = len(table["table"]) - 1
+        for table_md, row_start, row_end in split_table(table["table"]):
+            table_docs.append({
+                "source": table["source"],
+                "page": table["page"],
+                "table_index": table["index"],
+                "content": table_md,
+                "row_start": row_start,
+                "row_end": row_end,
+                "table_rows": total_rows,
+            })
     return table_docs
 
 
@@ -140,33 +380,348 @@ def get_split_data(text_docs, tables):
 
     # Add tables
     for t in split_tables:
-        all_docs.append(Document(page_content=t["content"], metadata={"page": t["page"], "type": "table"}))
+        all_docs.append(Document(page_content=t["content"], metadata={
+            "source": t["source"],
+            "page": t["page"],
+            "type": "table",
+            "table_index": t["table_index"],
+            "row_start": t["row_start"],
+            "row_end": t["row_end"],
+            "table_rows": t["table_rows"],
+        }))
     return all_docs
 
 
 @timeit
-def create_vector_store(all_docs, embedding_model, persist_directory):
-    vs = Chroma.from_documents(documents=all_docs, embedding=embedding_model, persist_directory=persist_directory)
-    return vs
+def create_vector_store(embedding_model, persist_directory, collection_name=CHROMA_COLLECTION):
+    """Open the Chroma collection used for ingestion, creating it with the configured HNSW parameters if needed.
+
+    Args:
+        embedding_model (Embeddings): The embedding model.
+        persist_directory (str): The path to the directory for persisting the vector store.
+        collection_name (str, optional): The collection to ingest into. Defaults to CHROMA_COLLECTION.
+
+    Returns:
+        Chroma: The vector store.
+    """
+    return open_chroma(persist_directory, embedding_model, collection_name)
+
+
+def file_sha256(path):
+    """Return the SHA-256 hex digest of a file's content."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_manifest(persist_directory):
+    """Load the ingestion manifest ({file name: {sha256, mtime, size, chunk_ids}})."""
+    try:
+        with open(os.path.join(persist_directory, INGEST_MANIFEST_FILE)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def save_manifest(manifest, persist_directory):
+    """Atomically write the ingestion manifest."""
+    os.makedirs(persist_directory, exist_ok=True)
+    path = os.path.join(persist_directory, INGEST_MANIFEST_FILE)
+    with open(path + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+def assign_chunk_ids(docs, seen=None):
+    """Give each chunk a deterministic ID derived from its file name and content.
+
+    A repeated chunk inside the same file gets an occurrence suffix, so IDs stay
+    stable when unrelated parts of the file change.
+
+    Args:
+        docs (list): The chunks of one or more files.
+        seen (dict, optional): Occurrences counted so far, to pass again with the next chunks of the same files.
+
+    Returns:
+        list: One ID per chunk.
+    """
+    seen = {} if seen is None else seen
+    ids = []
+    for doc in docs:
+        name = os.path.basename(doc.metadata.get("source", ""))
+        digest = hashlib.sha1(f"{name}\x00{doc.metadata.get('type', 'text')}\x00{doc.page_content}".encode()).hexdigest()
+        seen[digest] = seen.get(digest, -1) + 1
+        ids.append(f"{digest}-{seen[digest]}")
+    return ids
+
+
+def plan_incremental_ingest(pdf_paths, manifest):
+    """Compare the PDF files on disk with the manifest.
+
+    Files whose size and mtime match the manifest are not hashed again. Files
+    chunked by an older CHUNKER_VERSION count as changed.
+
+    Args:
+        pdf_paths (list): The paths to the PDF files currently on disk.
+        manifest (dict): The manifest of the last ingestion.
+
+    Returns:
+        tuple: The changed or new files as {name: (path, entry)} and the names of removed files.
+    """
+    changed = {}
+    for pdf_path in pdf_paths:
+        name = os.path.basename(pdf_path)
+        stat = os.stat(pdf_path)
+        entry = {"sha256": None, "mtime": stat.st_mtime, "size": stat.st_size, "chunker": CHUNKER_VERSION}
+        old = manifest.get(name)
+        # Entries without chunk_ids belong to a file whose ingestion was interrupted, and
+        # entries from an older chunker need splitting again even if the file did not change
+        complete = old is not None and "chunk_ids" in old and old.get("chunker", 1) == CHUNKER_VERSION
+        if complete and old["mtime"] == entry["mtime"] and old["size"] == entry["size"]:
+            continue
+        entry["sha256"] = file_sha256(pdf_path)
+        if complete and old["sha256"] == entry["sha256"]:
+            # Touched but not modified, only refresh the stat fields
+            old.update(mtime=entry["mtime"], size=entry["size"])
+            continue
+        changed[name] = (pdf_path, entry)
+    present = {os.path.basename(p) for p in pdf_paths}
+    removed = [name for name in manifest if name not in present]
+    return changed, removed
+
+
+def embed_and_store(files, vs, embedding_model, manifest, persist_directory,
+                    batch_size=EMBED_BATCH_SIZE, max_in_flight=EMBED_MAX_IN_FLIGHT):
+    """Embed chunks in batches and write them to Chroma as the batches complete.
+
+    ``files`` is consumed lazily, so extraction of the next pages overlaps with
+    embedding. Up to ``max_in_flight`` batches are being embedded at once, and
+    finished batches are written in submission order. Once every batch of a
+    file is stored, its stale chunks are deleted and the manifest is saved, so
+    an interrupted run resumes after the last completed file.
+
+    Args:
+        files (iterable): Tuples of (file name, manifest entry, chunks, chunk IDs), one or more consecutive ones per file.
+        vs (Chroma): The vector store to write to.
+        embedding_model (Embeddings): The embedding model.
+        manifest (dict): The ingestion manifest, updated in place.
+        persist_directory (str): The directory the manifest is saved to.
+        batch_size (int, optional): Chunks per embedding request. Defaults to EMBED_BATCH_SIZE.
+        max_in_flight (int, optional): Concurrent embedding requests. Defaults to EMBED_MAX_IN_FLIGHT.
+
+    Returns:
+        int: The number of chunks stored.
+    """
+    in_flight = deque()
+    # file name -> [batches not written yet, manifest entry, chunk IDs, every part submitted]
+    remaining = {}
+    stored = 0
+    start = time.perf_counter()
+
+    def finish_file(name, entry, ids):
+        old = manifest.get(name, {})
+        stale = set(old.get("chunk_ids", [])) | set(old.get("pending_chunk_ids", []))
+        stale -= set(ids)
+        if stale:
+            vs.delete(ids=list(stale))
+        manifest[name] = entry | {"chunk_ids": ids}
+        save_manifest(manifest, persist_directory)
+        elapsed = time.perf_counter() - start
+        logger.info(f"Stored {len(ids)} chunks of {name} ({stored} total, {stored / elapsed:.1f} chunks/sec)")
+
+    def finish_if_stored(name):
+        batches, entry, ids, submitted = remaining[name]
+        if batches == 0 and submitted:
+            del remaining[name]
+            finish_file(name, entry, ids)
+
+    def write_oldest():
+        nonlocal stored
+        name, docs, ids, future = in_flight.popleft()
+        vs._collection.upsert(
+            ids=ids,
+            embeddings=future.result(),
+            documents=[d.page_content for d in docs],
+            metadatas=[d.metadata for d in docs],
+        )
+        stored += len(ids)
+        remaining[name][0] -= 1
+        finish_if_stored(name)
+
+    def submitted(name):
+        remaining[name][3] = True
+        finish_if_stored(name)
+
+    with ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="ingest-embed") as executor:
+        current = None
+        for name, entry, docs, ids in files:
+            if name != current:
+                if current is not None:
+                    submitted(current)
+                current = name
+                remaining[name] = [0, entry, [], False]
+            # Record the IDs first so a crash mid-file still knows which chunks may exist
+            previous = manifest.setdefault(name, {})
+            previous["pending_chunk_ids"] = sorted(set(previous.get("pending_chunk_ids", [])) | set(ids))
+            save_manifest(manifest, persist_directory)
+            remaining[name][2].extend(ids)
+            for i in range(0, len(docs), batch_size):
+                while len(in_flight) >= max_in_flight:
+                    write_oldest()
+                batch_docs = docs[i:i + batch_size]
+                future = executor.submit(embedding_model.embed_documents, [d.page_content for d in batch_docs])
+                remaining[name][0] += 1
+                in_flight.append((name, batch_docs, ids[i:i + batch_size], future))
+        if current is not None:
+            submitted(current)
+        while in_flight:
+            write_oldest()
+
+    elapsed = time.perf_counter() - start
+    logger.info(f"Embedded and stored {stored} chunks in {elapsed:.1f}s ({stored / elapsed if elapsed else 0:.1f} chunks/sec)")
+    return stored
+
+
+@timeit
+def build_lexical_index(vs, persist_directory):
+    """Build the BM25 index over every chunk in the collection and save it next to Chroma.
+
+    Args:
+        vs (Chroma): The vector store.
+        persist_directory (str): The directory the index is saved to.
+
+    Returns:
+        BM25Index: The index.
+    """
+    data = vs.get(include=["documents", "metadatas"])
+    index = BM25Index.build(data["ids"], data["documents"], data["metadatas"])
+    index.save(os.path.join(persist_directory, BM25_INDEX_FILE))
+    logger.info(f"Built BM25 index over {len(index)} chunks with {len(index.postings)} terms")
+    return index
 
 
 @timeit
-def ingest_data(path_to_data_folder=DATA_FOLDER, persist_directory=PERSIST_DIRECTORY):
-    """Ingest data from PDF files and create a vector store.
+def export_snapshot(vs, persist_directory):
+    """Export the collection as a memory-mapped embedding snapshot for in-process search.
+
+    Args:
+        vs (Chroma): The vector store.
+        persist_directory (str): The directory the snapshot is saved to.
+
+    Returns:
+        str: The snapshot folder.
+    """
+    path = SnapshotIndex.export(vs, persist_directory, get_corpus_version(persist_directory))
+    snapshot = SnapshotIndex.load(persist_directory)
+    logger.info(f"Exported snapshot of {len(snapshot)} chunks ({snapshot.manifest['dtype']}) to {path}")
+    return path
+
+
+@timeit
+def ingest_data(path_to_data_folder=DATA_FOLDER, persist_directory=PERSIST_DIRECTORY, incremental=True,
+                collection_name=CHROMA_COLLECTION, snapshot=RETRIEVAL_BACKEND == "snapshot"):
+    """Ingest data from PDF files and create or update the vector store.
+
+    In incremental mode only new or modified PDFs are parsed and embedded:
+    their chunks are upserted under deterministic IDs, chunks that no longer
+    exist are deleted, and chunks of removed PDFs are purged. Otherwise the
+    collection is emptied and every PDF is ingested again.
+
+    Files stream page range by page range through extraction, splitting,
+    batched embedding and storage, so neither the corpus nor a whole file is
+    held in memory.
+
+    The BM25 index, and with ``snapshot`` the embedding snapshot used by the
+    "snapshot" retrieval backend, are rebuilt at the end whenever the corpus
+    changed.
 
     Args:
         path_to_data_folder (str, optional): The path to the folder containing PDF files. Defaults to DATA_FOLDER.
         persist_directory (str, optional): The path to the directory for persisting the vector store. Defaults to PERSIST_DIRECTORY.
+        incremental (bool, optional): Only ingest changes since the last run. Defaults to True.
+        collection_name (str, optional): The collection to ingest into, created if needed. Defaults to CHROMA_COLLECTION.
+        snapshot (bool, optional): Export the embedding snapshot. Defaults to True when RETRIEVAL_BACKEND is "snapshot".
     """
-    text_docs, tables = read_all_data(path_to_data_folder)
-    all_docs = get_split_data(text_docs, tables)
     embedding_model = get_embedding_model()
-    create_vector_store(all_docs, embedding_model, persist_directory)
+    vs = create_vector_store(embedding_model, persist_directory, collection_name)
+    # Manifest, BM25 index and corpus version are kept per collection
+    directory = collection_directory(collection_name, persist_directory)
+    pdf_paths = list_pdf_files(path_to_data_folder)
+    manifest = load_manifest(directory) if incremental else {}
+    if incremental and not manifest and vs._collection.count() > 0:
+        # Built before the manifest existed, its random chunk IDs cannot be reconciled
+        logger.info("Vector store has no ingestion manifest, rebuilding it from scratch")
+        incremental = False
+    if not incremental:
+        vs.reset_collection()
+    changed, removed = plan_incremental_ingest(pdf_paths, manifest)
+    logger.info(f"Ingesting {len(changed)} new or changed files, purging {len(removed)} removed files, "
+                f"skipping {len(pdf_paths) - len(changed)} unchanged files")
+
+    stale_ids = []
+    for name in removed:
+        entry = manifest.pop(name)
+        stale_ids.extend(entry.get("chunk_ids", []) + entry.get("pending_chunk_ids", []))
+    if stale_ids:
+        vs.delete(ids=stale_ids)
+    save_manifest(manifest, directory)
+
+    def split_files():
+        current, seen = None, {}
+        for pdf_path, text_docs, tables in iter_extracted_files([path for path, _ in changed.values()]):
+            name = os.path.basename(pdf_path)
+            if name != current:
+                # Occurrences of repeated chunks are counted over the whole file
+                current, seen = name, {}
+            docs = get_split_data(text_docs, tables)
+            yield name, changed[name][1], docs, assign_chunk_ids(docs, seen)
+
+    embed_and_store(split_files(), vs, embedding_model, manifest, directory)
+    index_path = os.path.join(directory, BM25_INDEX_FILE)
+    if changed or removed or not incremental or not os.path.exists(index_path):
+        build_lexical_index(vs, directory)
+    if changed or removed or not incremental:
+        # Invalidate answers cached against the previous corpus
+        bump_corpus_version(directory)
+    if snapshot:
+        current = SnapshotIndex.load(directory)
+        if current is None or current.corpus_version != get_corpus_version(directory):
+            export_snapshot(vs, directory)
     return
 
+
+async def grant_collection_access(user_ids, collection_name=CHROMA_COLLECTION):
+    """Let the given users search a collection.
+
+    Args:
+        user_ids (list): IDs of the users granted access.
+        collection_name (str, optional): The collection. Defaults to CHROMA_COLLECTION.
+    """
+    async with engine.begin() as conn:
+        await conn.run_sync(CollectionAccess.__table__.create, checkfirst=True)
+    async with AsyncSessionLocal() as db:
+        for user_id in user_ids:
+            await db.merge(CollectionAccess(user_id=user_id, collection=collection_name))
+        await db.commit()
+    logger.info(f"Granted {len(user_ids)} users access to collection '{collection_name}'")
+
+
 def test():
     logger.info("Starting test...")
     
 
 if __name__ == "__main__":
-    ingest_data()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Ingest the PDFs of a folder into a vector store collection.")
+    parser.add_argument("--data-folder", default=DATA_FOLDER, help="folder containing the PDF files")
+    parser.add_argument("--collection", default=CHROMA_COLLECTION, help="collection to ingest into, created if needed")
+    parser.add_argument("--full", action="store_true", help="re-ingest every file instead of only the changes")
+    parser.add_argument("--snapshot", action="store_true", default=RETRIEVAL_BACKEND == "snapshot",
+                        help="export the embedding snapshot, on by default when RETRIEVAL_BACKEND is snapshot")
+    parser.add_argument("--grant", nargs="+", default=[], metavar="USER_ID",
+                        help="users allowed to search the collection, the default collection is open to all")
+    args = parser.parse_args()
+    ingest_data(args.data_folder, incremental=not args.full, collection_name=args.collection, snapshot=args.snapshot)
+    if args.grant:
+        asyncio.run(grant_collection_access(args.grant, args.collection))
\ No newline at end of file
@@ -1,22 +1,173 @@
-from utils.constants import PERSIST_DIRECTORY, DATABASE_URL
-from utils.utils import get_embedding_model, timeit
+from utils.constants import (PERSIST_DIRECTORY, DATABASE_URL, CORPUS_VERSION_FILE, CORPUS_VERSION_CHECK_SECONDS,
+                             CHROMA_COLLECTION, COLLECTIONS_FOLDER, HNSW_SPACE, HNSW_M, HNSW_CONSTRUCTION_EF,
+                             HNSW_SEARCH_EF, VECTOR_STORE_MEMORY_MB,
+                             DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE,
+                             SQLITE_JOURNAL_MODE, SQLITE_SYNCHRONOUS, SQLITE_BUSY_TIMEOUT_MS, SQLITE_CACHE_SIZE_KB)
+from utils.utils import get_embedding_model, get_logger, timeit
 
-from langchain_chroma import Chroma
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy import event, inspect
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
-from typing import AsyncGenerator
+from typing import TYPE_CHECKING, AsyncGenerator, List, Optional
+import os
+import threading
+import time
+import uuid
 
-engine = create_async_engine(DATABASE_URL, future=True, echo=False)
+if TYPE_CHECKING:
+    from langchain_chroma import Chroma
+
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    """Apply the SQLite pragmas to a new connection (``connect`` event listener)."""
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+    cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    # Negative values are a size in KiB rather than a number of pages
+    cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}")
+    cursor.close()
+
+
+def create_database_engine(url: str = DATABASE_URL, pool_size: int = DB_POOL_SIZE,
+                           max_overflow: int = DB_MAX_OVERFLOW) -> AsyncEngine:
+    """Create the async engine with pool settings and, for SQLite, the tuned pragmas.
+
+    Args:
+        url (str, optional): The database URL. Defaults to DATABASE_URL.
+        pool_size (int, optional): Connections kept in the pool. Defaults to DB_POOL_SIZE.
+        max_overflow (int, optional): Extra connections allowed under load. Defaults to DB_MAX_OVERFLOW.
+
+    Returns:
+        AsyncEngine: The engine.
+    """
+    db_url = make_url(url)
+    kwargs = {}
+    # In-memory SQLite uses a single static connection, pool settings do not apply
+    if db_url.database not in (None, "", ":memory:"):
+        kwargs = {
+            "pool_size": pool_size,
+            "max_overflow": max_overflow,
+            "pool_timeout": DB_POOL_TIMEOUT,
+            "pool_recycle": DB_POOL_RECYCLE,
+            "pool_pre_ping": db_url.get_backend_name() != "sqlite",
+        }
+    db_engine = create_async_engine(url, future=True, echo=False, **kwargs)
+    if db_url.get_backend_name() == "sqlite":
+        event.listen(db_engine.sync_engine, "connect", set_sqlite_pragmas)
+    return db_engine
+
+
+engine = create_database_engine()
 AsyncSessionLocal = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
 Base = declarative_base()
+logger = get_logger()
+# Chroma clients of the same path share one instance, which is not safe to start from two threads at once
+_chroma_client_lock = threading.Lock()
+
+
+def get_chroma_settings():
+    """Get the settings of the Chroma clients, the same for every client of a path.
+
+    Chroma's segment cache is limited to VECTOR_STORE_MEMORY_MB and evicts the
+    least recently used collections itself. Chroma releases with the Rust
+    backend (1.x) ignore these two settings and keep open indexes up to a
+    count derived from the file handle limit instead.
+    """
+    from chromadb.config import Settings
+
+    return Settings(
+        chroma_segment_cache_policy="LRU",
+        chroma_memory_limit_bytes=VECTOR_STORE_MEMORY_MB * 1024 * 1024,
+    )
+
+
+def get_collection_metadata() -> dict:
+    """Get the HNSW parameters used when a Chroma collection is created."""
+    return {
+        "hnsw:space": HNSW_SPACE,
+        "hnsw:M": HNSW_M,
+        "hnsw:construction_ef": HNSW_CONSTRUCTION_EF,
+        "hnsw:search_ef": HNSW_SEARCH_EF,
+    }
+
+
+def open_chroma(persist_directory, embedding_model, collection_name=CHROMA_COLLECTION) -> "Chroma":
+    """Open a Chroma collection, creating it with the configured HNSW parameters.
+
+    The search_ef setting is also applied to existing collections. A warning is
+    logged when other parameters of an existing collection differ from the
+    configuration, since they can only change by rebuilding the collection.
+
+    Args:
+        persist_directory (str): The path to the directory for persisting the vector store.
+        embedding_model (Embeddings): The embedding model.
+        collection_name (str, optional): The collection name. Defaults to CHROMA_COLLECTION.
+
+    Returns:
+        Chroma: The vector store.
+    """
+    # Imported here since chromadb takes a while to load and most endpoints never need it
+    from langchain_chroma import Chroma
+
+    metadata = get_collection_metadata()
+    with _chroma_client_lock:
+        vs = Chroma(
+            persist_directory=persist_directory,
+            embedding_function=embedding_model,
+            collection_name=collection_name,
+            collection_metadata=metadata,
+            client_settings=get_chroma_settings(),
+        )
+    try:
+        hnsw = vs._collection.configuration["hnsw"]  # type: ignore[attr-defined]
+        built = {"hnsw:space": hnsw["space"], "hnsw:M": hnsw["max_neighbors"], "hnsw:construction_ef": hnsw["ef_construction"]}
+        mismatched = [key for key, value in built.items() if value != metadata[key]]
+        if mismatched:
+            logger.warning(f"Collection '{collection_name}' was built with {built}, run a full ingestion to apply the configured {mismatched}")
+        if hnsw["ef_search"] != HNSW_SEARCH_EF:
+            vs._collection.modify(configuration={"hnsw": {"ef_search": HNSW_SEARCH_EF}})  # type: ignore[attr-defined]
+    except Exception as e:
+        logger.warning(f"Could not check the HNSW configuration of collection '{collection_name}': {e}")
+    return vs
+
+
+def collection_directory(collection_name=CHROMA_COLLECTION, persist_directory=PERSIST_DIRECTORY) -> str:
+    """Get the directory holding the ingestion manifest, BM25 index and corpus version of a collection.
+
+    Every collection is stored by the same Chroma instance in ``persist_directory``.
+    The default collection keeps its files there too, so existing stores keep
+    working, and the others get a folder of their own under COLLECTIONS_FOLDER.
+
+    Args:
+        collection_name (str, optional): The collection name. Defaults to CHROMA_COLLECTION.
+        persist_directory (str, optional): The path to the directory for persisting the vector store. Defaults to PERSIST_DIRECTORY.
+
+    Returns:
+        str: The directory path.
+    """
+    if collection_name == CHROMA_COLLECTION:
+        return persist_directory
+    return os.path.join(persist_directory, COLLECTIONS_FOLDER, collection_name)
+
+
+def list_collections(persist_directory=PERSIST_DIRECTORY) -> List[str]:
+    """List the names of the Chroma collections stored in a directory."""
+    import chromadb
+
+    # Clients of the same path share one Chroma instance, so this opens nothing new
+    with _chroma_client_lock:
+        client = chromadb.PersistentClient(path=persist_directory, settings=get_chroma_settings())
+    return [collection.name for collection in client.list_collections()]
 
 
 @timeit
-def get_vector_store(persist_directory=PERSIST_DIRECTORY):
+def get_vector_store(persist_directory=PERSIST_DIRECTORY, collection_name=CHROMA_COLLECTION):
     """Get the vector store.
 
     Args:
         persist_directory (str, optional): The path to the directory for persisting the vector store. Defaults to PERSIST_DIRECTORY.
+        collection_name (str, optional): The collection name. Defaults to CHROMA_COLLECTION.
 
     Raises:
         RuntimeError: If the vector store cannot be opened.
@@ -26,23 +177,119 @@ def get_vector_store(persist_directory=PERSIST_DIRECTORY):
     """
     embedding_model = get_embedding_model()
     try:
-        vs = Chroma(
-            persist_directory=persist_directory,
-            embedding_function=embedding_model,
-            # collection_name=CHROMA_COLLECTION,
-        )
+        vs = open_chroma(persist_directory, embedding_model, collection_name)
     except Exception as e:
         raise RuntimeError(
         f"Failed to open Chroma at '{persist_directory}'. Ensure it's a valid Chroma persistence directory. Error: {e}"
         )
     # quick sanity check
     try:
-        # Perform a sanity check to ensure the collection is accessible; result is intentionally unused.
-        _ = vs._collection.count() # type: ignore[attr-defined]
+        count = vs._collection.count() # type: ignore[attr-defined]
+        logger.info(f"Opened collection '{collection_name}' of vector store '{persist_directory}' with {count} chunks")
+        if count == 0:
+            logger.warning(f"Collection '{collection_name}' is empty, run data ingestion first")
     except Exception:
         pass
     return vs
 
+def get_corpus_version(persist_directory=PERSIST_DIRECTORY) -> Optional[str]:
+    """Get the version of the corpus currently stored in the vector store.
+
+    Args:
+        persist_directory (str, optional): The path to the directory for persisting the vector store. Defaults to PERSIST_DIRECTORY.
+
+    Returns:
+        Optional[str]: The corpus version, or None if it was never ingested with versioning.
+    """
+    try:
+        with open(os.path.join(persist_directory, CORPUS_VERSION_FILE)) as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return None
+
+
+# persist directory -> (checked at, modification time, corpus version)
+_corpus_versions: dict[str, tuple] = {}
+
+
+def current_corpus_version(persist_directory=PERSIST_DIRECTORY,
+                           check_seconds: float = CORPUS_VERSION_CHECK_SECONDS) -> Optional[str]:
+    """Get the corpus version for the serving side, without reading the file on every query.
+
+    The file is looked at most every ``check_seconds`` and only read again
+    when its modification time changed, so a new ingestion is picked up
+    within ``check_seconds``.
+
+    Args:
+        persist_directory (str, optional): The path to the directory for persisting the vector store. Defaults to PERSIST_DIRECTORY.
+        check_seconds (float, optional): Seconds a version is trusted before checking the file. Defaults to CORPUS_VERSION_CHECK_SECONDS.
+
+    Returns:
+        Optional[str]: The corpus version, or None if it was never ingested with versioning.
+    """
+    now = time.monotonic()
+    cached = _corpus_versions.get(persist_directory)
+    if cached is not None and now - cached[0] < check_seconds:
+        return cached[2]
+    try:
+        mtime = os.stat(os.path.join(persist_directory, CORPUS_VERSION_FILE)).st_mtime_ns
+    except FileNotFoundError:
+        mtime = None
+    if cached is not None and cached[1] == mtime:
+        version = cached[2]
+    else:
+        version = get_corpus_version(persist_directory)
+    _corpus_versions[persist_directory] = (now, mtime, version)
+    return version
+
+
+def bump_corpus_version(persist_directory=PERSIST_DIRECTORY) -> str:
+    """Mark the vector store content as changed, invalidating caches built on it.
+
+    Args:
+        persist_directory (str, optional): The path to the directory for persisting the vector store. Defaults to PERSIST_DIRECTORY.
+
+    Returns:
+        str: The new corpus version.
+    """
+    version = uuid.uuid4().hex
+    os.makedirs(persist_directory, exist_ok=True)
+    with open(os.path.join(persist_directory, CORPUS_VERSION_FILE), "w") as f:
+        f.write(version)
+    return version
+
+
+def add_missing_columns(conn):
+    """Add columns declared on the models but missing from existing tables.
+
+    ``create_all`` only creates missing tables, so columns added to a model later
+    are added here with ``ALTER TABLE``. Meant to be run through ``conn.run_sync``.
+    """
+    inspector = inspect(conn)
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(conn.dialect)}"
+            if column.server_default is not None:
+                ddl += f" DEFAULT {column.server_default.arg}"
+            logger.info(f"Adding column {table.name}.{column.name}")
+            conn.exec_driver_sql(ddl)
+
+
+def add_missing_indexes(conn):
+    """Create indexes declared on the models but missing from existing tables.
+
+    Meant to be run through ``conn.run_sync``.
+    """
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
+
+
 async def get_async_session() -> AsyncGenerator[AsyncSession, None]:
     """
     Get a new asynchronous database session.
@@ -1,7 +1,7 @@
 from db.dbo import Base
 
 from sqlalchemy.orm import Mapped, mapped_column, relationship
-from sqlalchemy import String, Text, ForeignKey, DateTime, func, Enum
+from sqlalchemy import String, Text, ForeignKey, DateTime, Integer, Index, func, Enum
 
 import uuid
 import enum
@@ -38,13 +38,36 @@ class Session(TimeBaseClass):
     Fields:
         user_id: The ID of the user who owns the session.
         name: The name of the session.
+        summary: Rolling summary of the oldest messages of the session.
+        summary_message_count: Number of oldest messages covered by the summary.
+        collection: Vector store collection the session searches, None for the default one.
     """
     __tablename__ = "sessions"
     id: Mapped[str] = mapped_column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
     user_id: Mapped[str] = mapped_column(String, ForeignKey("users.id", ondelete="CASCADE"), index=True)
     name: Mapped[str] = mapped_column(String(128), default="New Session")
+    summary: Mapped[str | None] = mapped_column(Text, nullable=True)
+    summary_message_count: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+    collection: Mapped[str | None] = mapped_column(String(128), nullable=True)
     user: Mapped[User] = relationship("User", back_populates="sessions")
-    messages: Mapped[list["Message"]] = relationship("Message", back_populates="session", cascade="all, delete-orphan", order_by="Message.created_at")
+    messages: Mapped[list["Message"]] = relationship("Message", back_populates="session", cascade="all, delete-orphan", order_by="[Message.created_at, Message.id]")
+
+
+class CollectionAccess(Base):
+    """
+    Grants a user read access to a vector store collection.
+
+    The default collection is readable by every user, any other collection only
+    by the users granted access to it.
+
+    Fields:
+        user_id: The ID of the user granted access.
+        collection: The collection the user may search.
+    """
+    __tablename__ = "collection_access"
+    # Not a foreign key, access can be granted before the user first shows up
+    user_id: Mapped[str] = mapped_column(String, primary_key=True)
+    collection: Mapped[str] = mapped_column(String(128), primary_key=True)
 
 
 class RoleEnum(enum.Enum):
@@ -65,6 +88,8 @@ class Message(TimeBaseClass):
         content: The textual content of the message.
     """
     __tablename__ = "messages"
+    # Serves keyset pagination and "last N messages" queries within a session
+    __table_args__ = (Index("ix_messages_session_id_created_at", "session_id", "created_at", "id"),)
     id: Mapped[str] = mapped_column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
     session_id: Mapped[str] = mapped_column(String, ForeignKey("sessions.id", ondelete="CASCADE"), index=True)
     role: Mapped[RoleEnum] = mapped_column(Enum(RoleEnum, native_enum=False), nullable=False)
@@ -0,0 +1,40 @@
+from utils.metrics import HTTP_IN_FLIGHT, HTTP_REQUESTS, HTTP_REQUEST_SECONDS
+
+import time
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording request counts, durations and requests in flight.
+
+    Requests are labelled with their route template (e.g.
+    ``/sessions/{session_id}/history``) rather than the raw path. Durations
+    run until the last body chunk is sent, so streamed chat responses are
+    measured in full.
+    """
+
+    def __init__(self, app, skip_paths=("/metrics", "/metrics/")):
+        self.app = app
+        self.skip_paths = set(skip_paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.skip_paths:
+            await self.app(scope, receive, send)
+            return
+        status = "500"
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+            await send(message)
+
+        start = time.perf_counter()
+        HTTP_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_IN_FLIGHT.dec()
+            # Set by the router once it matched the request
+            route = getattr(scope.get("route"), "path", "unmatched")
+            HTTP_REQUESTS.labels(scope["method"], route, status).inc()
+            HTTP_REQUEST_SECONDS.labels(scope["method"], route).observe(time.perf_counter() - start)
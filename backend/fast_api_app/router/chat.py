@@ -1,38 +1,189 @@
 from fast_api_app.dependencies import get_db
 from db import models
 from schema import schemas
-from rag.rag import create_session_name, run_rag
+from db.dbo import AsyncSessionLocal
+from rag.rag import llm_gateway, open_collection, run_rag, run_rag_batch, stream_rag
+from rag.store_registry import UnknownCollectionError
+from rag.history import build_history, load_recent_messages
+from rag.session_naming import needs_name, schedule_session_naming
+from utils.utils import get_logger
+from utils.metrics import observe_stage
+from utils.constants import CHROMA_COLLECTION
 
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
 from fast_api_app.router.log_decorator import log_response
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
-from sqlalchemy.orm import selectinload
+
+from datetime import datetime, timedelta, timezone
+import json
+
+logger = get_logger()
 
 router = APIRouter(prefix="/chat", tags=["chat"])
 
+
+def new_turn(session_id: str, question: str, answer: str, now: datetime | None = None):
+    """Create the user and assistant messages of one chat turn.
+
+    Both rows are inserted together, so they get explicit increasing
+    timestamps instead of sharing the same server default.
+    """
+    now = now or datetime.now(timezone.utc)
+    return [
+        models.Message(session_id=session_id, role="user", content=question, created_at=now),
+        models.Message(session_id=session_id, role="assistant", content=answer, created_at=now + timedelta(microseconds=1)),
+    ]
+
+
+async def can_read_collection(db: AsyncSession, user_id: str, collection: str) -> bool:
+    """Whether a user may search a collection: the default one, or one they were granted access to."""
+    if collection == CHROMA_COLLECTION:
+        return True
+    res = await db.execute(select(models.CollectionAccess.user_id).where(
+        models.CollectionAccess.user_id == user_id, models.CollectionAccess.collection == collection))
+    return res.first() is not None
+
+
+async def resolve_collection(db: AsyncSession, user_id: str, requested: str | None,
+                             session: models.Session | None = None) -> str:
+    """Pick the collection of a request: the requested one, else the session's, else the default one.
+
+    Raises:
+        HTTPException: 403 if the user may not search the collection, 404 if it does not exist.
+    """
+    collection = requested or (session.collection if session else None) or CHROMA_COLLECTION
+    # Checked before opening, so collection names of other tenants are not revealed
+    if not await can_read_collection(db, user_id, collection):
+        raise HTTPException(status_code=403, detail=f"Not allowed to search collection '{collection}'")
+    try:
+        # Opens the collection now so an unknown name fails before anything is streamed
+        await open_collection(collection)
+    except UnknownCollectionError:
+        raise HTTPException(status_code=404, detail=f"Collection '{collection}' not found")
+    return collection
+
+
 @router.post("/", response_model=schemas.ChatResponse)
 @log_response
 async def chat(payload: schemas.ChatRequest, db: AsyncSession = Depends(get_db)):
-    stmt = select(models.Session).options(selectinload(models.Session.messages)).where(models.Session.id == payload.session_id)
-    result = await db.execute(stmt)
-    session = result.scalar_one_or_none()
-    if not session or session.user_id != payload.user_id:
-        raise HTTPException(status_code=404, detail="Session not found for user")
-    # Build chat history for LLM from stored messages
-    history = [(m.role, m.content) for m in session.messages]
+    with observe_stage("db_load"):
+        session = await db.get(models.Session, payload.session_id)
+        if not session or session.user_id != payload.user_id:
+            raise HTTPException(status_code=404, detail="Session not found for user")
+        # Build chat history for LLM from recent messages and the rolling summary
+        messages, total = await load_recent_messages(db, session.id)
+    collection = await resolve_collection(db, payload.user_id, payload.collection, session)
+    history = build_history(session, messages, offset=total - len(messages))
     # Run RAG
-    answer, sources = await run_rag(payload.query, history)
+    answer, sources = await run_rag(payload.query, history, collection)
     # Persist both user question and assistant answer
-    user_msg = models.Message(session_id=session.id, role="user", content=payload.query)
-    asst_msg = models.Message(session_id=session.id, role="assistant", content=answer)
+    user_msg, asst_msg = new_turn(session.id, payload.query, answer)
     db.add_all([user_msg, asst_msg])
-    # If session still has default name, try to auto-name from first messages
-    if session.name in ("New Session", "") and len(session.messages) > 3:
-        try:
-            session.name = create_session_name([user_msg, asst_msg] + list(session.messages))
-        except Exception:
-            pass
-        await db.flush()
+    with observe_stage("db_save"):
+        await db.commit()
+    # If session still has default name, name it in the background from its first messages
+    if needs_name(session, total + 2):
+        schedule_session_naming(session.id)
     sources = [schemas.SourceItem(**src) for src in sources]
-    return schemas.ChatResponse(answer=answer, sources=sources, session_id=session.id)
\ No newline at end of file
+    return schemas.ChatResponse(answer=answer, sources=sources, session_id=session.id)
+
+
+def format_sse(event: str, data) -> str:
+    """Format a single Server-Sent Event frame."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@router.post("/stream")
+async def chat_stream(payload: schemas.ChatRequest, db: AsyncSession = Depends(get_db)):
+    """Stream the answer as Server-Sent Events.
+
+    Emits a ``sources`` event once retrieval is done, one ``token`` event per
+    generated chunk and a final ``done`` event after both messages are saved.
+    """
+    with observe_stage("db_load"):
+        session = await db.get(models.Session, payload.session_id)
+        if not session or session.user_id != payload.user_id:
+            raise HTTPException(status_code=404, detail="Session not found for user")
+        messages, total = await load_recent_messages(db, session.id)
+    collection = await resolve_collection(db, payload.user_id, payload.collection, session)
+    history = build_history(session, messages, offset=total - len(messages))
+    # Answer 503 now rather than after the response started
+    llm_gateway.check_capacity("interactive")
+    session_id = session.id
+    name_after = needs_name(session, total + 2)
+
+    async def event_stream():
+        tokens = []
+        try:
+            async for event, data in stream_rag(payload.query, history, collection):
+                if event == "token":
+                    tokens.append(data)
+                elif event == "sources":
+                    data = [schemas.SourceItem(**src).model_dump() for src in data]
+                yield format_sse(event, data)
+        except Exception as e:
+            logger.exception("Streaming chat failed")
+            yield format_sse("error", {"detail": str(e)})
+            return
+        # The request scoped session is already closed once streaming starts,
+        # so the messages are persisted through a session of our own.
+        with observe_stage("db_save"):
+            async with AsyncSessionLocal() as stream_db:
+                stream_db.add_all(new_turn(session_id, payload.query, "".join(tokens)))
+                await stream_db.commit()
+        if name_after:
+            schedule_session_naming(session_id)
+        yield format_sse("done", {"session_id": session_id})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.post("/batch")
+async def chat_batch(payload: schemas.BatchChatRequest, db: AsyncSession = Depends(get_db)):
+    """Answer many independent questions, streamed back as JSON lines.
+
+    Each line is a ``BatchChatResult``, in completion order. Questions are
+    answered without history. When ``session_id`` is given, the answered
+    questions are saved to the session once the batch is done.
+    """
+    user = await db.get(models.User, payload.user_id)
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    session = None
+    if payload.session_id:
+        session = await db.get(models.Session, payload.session_id)
+        if not session or session.user_id != payload.user_id:
+            raise HTTPException(status_code=404, detail="Session not found for user")
+    session_id = session.id if session else None
+    collection = await resolve_collection(db, payload.user_id, payload.collection, session)
+    llm_gateway.check_capacity("batch")
+
+    async def result_stream():
+        answered = {}
+        async for index, answer, sources, error in run_rag_batch(payload.queries, collection=collection):
+            result = schemas.BatchChatResult(
+                index=index,
+                query=payload.queries[index],
+                answer=answer,
+                sources=[schemas.SourceItem(**src) for src in sources],
+                error=error,
+            )
+            if error is None:
+                answered[index] = answer
+            yield result.model_dump_json() + "\n"
+        if session_id and answered:
+            # Turns are saved in question order with strictly increasing timestamps
+            start = datetime.now(timezone.utc)
+            async with AsyncSessionLocal() as batch_db:
+                for n, index in enumerate(sorted(answered)):
+                    turn_time = start + timedelta(microseconds=2 * n)
+                    batch_db.add_all(new_turn(session_id, payload.queries[index], answered[index], turn_time))
+                await batch_db.commit()
+
+    return StreamingResponse(result_stream(), media_type="application/x-ndjson")
@@ -0,0 +1,17 @@
+from rag.rag import get_warm_up_state
+
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+
+router = APIRouter(prefix="/health", tags=["health"])
+
+@router.get("/live")
+async def live():
+    return {"status": "ok"}
+
+
+@router.get("/ready")
+async def ready():
+    # Ready once the vector store, retriever and model clients are loaded
+    state = get_warm_up_state()
+    return JSONResponse({"status": state}, status_code=200 if state == "ready" else 503)
@@ -1,7 +1,7 @@
 import functools
 import logging
 from fastapi import Request
-from utils.utils import get_logger
+from utils.utils import get_logger, log_payload
 
 logger = get_logger()
 
@@ -9,6 +9,6 @@ def log_response(func):
     @functools.wraps(func)
     async def wrapper(*args, **kwargs):
         response = await func(*args, **kwargs)
-        logger.info(f"Response from {func.__name__}: {response}")
+        log_payload("Response from %s: %s", func.__name__, response, level=logging.INFO)
         return response
     return wrapper
@@ -0,0 +1,6 @@
+from utils.metrics import REGISTRY
+
+from prometheus_client import make_asgi_app
+
+# Mounted at /metrics by main, serves the Prometheus text format (gzipped when asked)
+metrics_app = make_asgi_app(registry=REGISTRY)
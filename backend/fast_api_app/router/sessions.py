@@ -1,13 +1,16 @@
 from fast_api_app.dependencies import get_db
 from db import models
 from schema import schemas
-from rag.rag import create_session_name
+from rag.history import reset_summary
+from fast_api_app.router.chat import resolve_collection
 
-from fastapi import APIRouter, Depends, HTTPException
+from utils.constants import HISTORY_PAGE_SIZE, DEFAULT_SESSION_NAME
+
+from fastapi import APIRouter, Depends, HTTPException, Query
 from fast_api_app.router.log_decorator import log_response
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, delete, update
-from sqlalchemy.orm import selectinload
+from sqlalchemy import select, delete, and_, or_
+from typing import Optional
 
 
 router = APIRouter(prefix="/sessions", tags=["sessions"])
@@ -19,12 +22,14 @@ async def list_sessions(user_id: str, db: AsyncSession = Depends(get_db)):
     stmt = select(models.Session).where(models.Session.user_id == user_id).order_by(models.Session.updated_at.desc())
     res = await db.execute(stmt)
     sessions = res.scalars().all()
-    return [schemas.SessionOut(id=s.id, user_id=s.user_id, name=s.name) for s in sessions]
+    return [schemas.SessionOut(id=s.id, user_id=s.user_id, name=s.name, collection=s.collection) for s in sessions]
 
 
 @router.post("/", response_model=schemas.SessionOut)
 @log_response
 async def create_session(payload: schemas.SessionCreate, db: AsyncSession = Depends(get_db)):
+    if payload.collection:
+        await resolve_collection(db, payload.user_id, payload.collection)
     # Ensure user exists (create lightweight user row if not)
     user = await db.get(models.User, payload.user_id)
     if not user:
@@ -32,12 +37,13 @@ async def create_session(payload: schemas.SessionCreate, db: AsyncSession = Depe
         db.add(user)
         await db.commit()
     await db.flush()
-    session = models.Session(user_id=payload.user_id, name=payload.name or "New Session")
+    session = models.Session(user_id=payload.user_id, name=payload.name or DEFAULT_SESSION_NAME,
+                             collection=payload.collection)
     db.add(session)    
     await db.commit()
     await db.flush()
     # If no explicit name, try to name from first message when available (lazy)
-    return schemas.SessionOut(id=session.id, user_id=session.user_id, name=session.name)
+    return schemas.SessionOut(id=session.id, user_id=session.user_id, name=session.name, collection=session.collection)
 
 
 # @router.patch("/{session_id}", response_model=schemas.SessionOut)
@@ -54,41 +60,64 @@ async def create_session(payload: schemas.SessionCreate, db: AsyncSession = Depe
 @router.delete("/{session_id}")
 @log_response
 async def delete_session(session_id: str, db: AsyncSession = Depends(get_db)):
-    stmt = select(models.Session).options(selectinload(models.Session.messages)).where(models.Session.id == session_id)
-    result = await db.execute(stmt)
-    session = result.scalar_one_or_none()
+    session = await db.get(models.Session, session_id)
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
-    await db.delete(session)    
+    # Bulk delete instead of loading every message for the ORM cascade
+    await db.execute(delete(models.Message).where(models.Message.session_id == session_id))
+    await db.execute(delete(models.Session).where(models.Session.id == session_id))
     await db.commit()
     return {"ok": True}
 
 
 @router.get("/{session_id}/history", response_model=schemas.HistoryOut)
 @log_response
-async def get_history(session_id: str, db: AsyncSession = Depends(get_db)):
-    stmt = select(models.Session).options(selectinload(models.Session.messages)).where(models.Session.id == session_id)
-    result = await db.execute(stmt)
-    session = result.scalar_one_or_none()
+async def get_history(session_id: str,
+                      limit: Optional[int] = Query(None, ge=1, le=500,
+                                                   description="Page size, the whole history when neither limit nor before is set"),
+                      before: Optional[str] = Query(None, description="Cursor returned as next_cursor by the previous page"),
+                      db: AsyncSession = Depends(get_db)):
+    session = await db.get(models.Session, session_id)
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
+    if limit is None and before:
+        limit = HISTORY_PAGE_SIZE
+    # Keyset pagination over (created_at, id), newest page first
+    stmt = (
+        select(models.Message)
+        .where(models.Message.session_id == session_id)
+        .order_by(models.Message.created_at.desc(), models.Message.id.desc())
+    )
+    if limit is not None:
+        stmt = stmt.limit(limit + 1)
+    if before:
+        anchor = await db.get(models.Message, before)
+        if not anchor or anchor.session_id != session_id:
+            raise HTTPException(status_code=400, detail="Cursor does not belong to this session")
+        # Compare against the stored cursor row so timestamps never round-trip through Python
+        anchor_created_at = select(models.Message.created_at).where(models.Message.id == before).scalar_subquery()
+        stmt = stmt.where(or_(
+            models.Message.created_at < anchor_created_at,
+            and_(models.Message.created_at == anchor_created_at, models.Message.id < before),
+        ))
+    rows = (await db.execute(stmt)).scalars().all()
+    page = list(reversed(rows[:limit] if limit is not None else rows))
     messages = [
         schemas.MessageOut(id=m.id, role=m.role, content=m.content,
                            created_at=str(m.created_at))
-        for m in session.messages
+        for m in page
     ]
-    return schemas.HistoryOut(session_id=session.id, messages=messages)
+    next_cursor = page[0].id if limit is not None and len(rows) > limit else None
+    return schemas.HistoryOut(session_id=session.id, messages=messages, next_cursor=next_cursor)
 
 
 @router.delete("/{session_id}/history")
 @log_response
 async def delete_history(session_id: str, db: AsyncSession = Depends(get_db)):
-    stmt = select(models.Session).options(selectinload(models.Session.messages)).where(models.Session.id == session_id)
-    result = await db.execute(stmt)
-    session = result.scalar_one_or_none()
+    session = await db.get(models.Session, session_id)
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
-    for m in list(session.messages):
-        await db.delete(m)
+    await db.execute(delete(models.Message).where(models.Message.session_id == session_id))
+    reset_summary(session)
     await db.commit()
     return {"ok": True}
\ No newline at end of file
@@ -1,19 +1,44 @@
 import uvicorn
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import text
-from db.dbo import Base, engine
-from utils.constants import FRONTEND_ORIGIN, BACKEND_HOST, BACKEND_PORT
-from fast_api_app.router import sessions, chat, user
+from db.dbo import Base, engine, add_missing_columns, add_missing_indexes
+from utils.constants import FRONTEND_ORIGIN, BACKEND_HOST, BACKEND_PORT, LLM_RETRY_AFTER
+from fast_api_app.router import sessions, chat, user, metrics, health
+from fast_api_app.middleware import MetricsMiddleware
+from rag.rag import warm_up
+from rag.llm_gateway import LLMOverloadedError
+from rag.history import summary_queue
+from rag.session_naming import naming_queue
+from utils.utils import get_logger
 
 from contextlib import asynccontextmanager
+import asyncio
+
+logger = get_logger()
+
+
+async def llm_overloaded(request: Request, exc: LLMOverloadedError):
+    # Tell clients to back off instead of queueing behind a saturated LLM
+    return JSONResponse({"detail": str(exc)}, status_code=503, headers={"Retry-After": str(LLM_RETRY_AFTER)})
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(add_missing_columns)
+        await conn.run_sync(add_missing_indexes)
+    # Load the RAG components in the background so the other endpoints serve right away,
+    # /health/ready reports when chat is ready. Warm-up retries until Ollama and the vector store are up.
+    warm_up_task = asyncio.create_task(warm_up())
     yield
+    warm_up_task.cancel()
+    await naming_queue.stop()
+    await summary_queue.stop()
+    await engine.dispose()
 
 app = FastAPI(title="LangChain + Chroma RAG API", lifespan=lifespan)
 app.add_middleware(
@@ -23,10 +48,14 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(MetricsMiddleware)
+app.add_exception_handler(LLMOverloadedError, llm_overloaded)
 
 app.include_router(sessions.router)
 app.include_router(chat.router)
 app.include_router(user.router)
+app.include_router(health.router)
+app.mount("/metrics", metrics.metrics_app)
 
 if __name__ == "__main__":
     uvicorn.run("main:app", host=BACKEND_HOST, port=BACKEND_PORT, reload=True)
@@ -0,0 +1,82 @@
+from typing import List, Optional, Tuple
+import copy
+
+import numpy as np
+
+
+class AnswerCache:
+    """Semantic cache of answered questions.
+
+    Keeps the normalized question embeddings in a fixed size matrix and returns
+    the stored answer of the nearest question when its cosine similarity reaches
+    the threshold. Entries are overwritten oldest first once the cache is full,
+    and the whole cache is dropped when the corpus version changes.
+
+    Args:
+        threshold (float): Minimum cosine similarity for a hit.
+        max_size (int): Maximum number of cached answers. 0 disables the cache.
+    """
+
+    def __init__(self, threshold: float = 0.97, max_size: int = 1000):
+        self.threshold = threshold
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._corpus_version = None
+        self.clear()
+
+    def clear(self):
+        self._vectors: Optional[np.ndarray] = None
+        self._entries: List[Optional[Tuple[str, list]]] = [None] * self.max_size
+        self._size = 0
+        self._next = 0
+
+    def _check_version(self, corpus_version):
+        if corpus_version != self._corpus_version:
+            self.clear()
+            self._corpus_version = corpus_version
+
+    @staticmethod
+    def _normalize(embedding) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, embedding, corpus_version=None) -> Optional[Tuple[str, list]]:
+        """Return the (answer, sources) of the most similar cached question, if close enough."""
+        self._check_version(corpus_version)
+        if self._size == 0:
+            self.misses += 1
+            return None
+        scores = self._vectors[:self._size] @ self._normalize(embedding)
+        best = int(np.argmax(scores))
+        if scores[best] < self.threshold:
+            self.misses += 1
+            return None
+        self.hits += 1
+        answer, sources = self._entries[best]
+        return answer, copy.deepcopy(sources)
+
+    def add(self, embedding, answer: str, sources: list, corpus_version=None):
+        """Store an answer and its sources under the question embedding."""
+        if self.max_size <= 0:
+            return
+        self._check_version(corpus_version)
+        vector = self._normalize(embedding)
+        if self._vectors is None or self._vectors.shape[1] != vector.shape[0]:
+            self.clear()
+            self._vectors = np.zeros((self.max_size, vector.shape[0]), dtype=np.float32)
+        self._vectors[self._next] = vector
+        self._entries[self._next] = (answer, copy.deepcopy(sources))
+        self._next = (self._next + 1) % self.max_size
+        self._size = min(self._size + 1, self.max_size)
+
+    def stats(self) -> dict:
+        """Return the hit/miss counters and the number of cached answers."""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "size": self._size,
+        }
@@ -0,0 +1,107 @@
+from utils.constants import STOPWORDS
+
+from collections import Counter, defaultdict
+from typing import List, Tuple
+import heapq
+import json
+import math
+import os
+import re
+
+from langchain_core.documents import Document
+
+# Keeps tokens like "pm2.5", "no2" or "so2/nox" in one piece
+TOKEN_RE = re.compile(r"[a-z0-9]+(?:[./-][a-z0-9]+)*")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase and split text into terms, dropping stopwords."""
+    return [t for t in TOKEN_RE.findall(text.lower()) if t not in STOPWORDS]
+
+
+class BM25Index:
+    """BM25 inverted index over the ingested chunks.
+
+    Use ``BM25Index.build`` to index chunks and ``save``/``load`` to persist it.
+
+    Args:
+        ids (list): Chunk IDs (the Chroma IDs).
+        texts (list): Chunk texts.
+        metadatas (list): Chunk metadata.
+        postings (dict): Term to list of (chunk index, term frequency).
+        doc_len (list): Number of terms per chunk.
+        k1 (float): Term frequency saturation.
+        b (float): Length normalization.
+    """
+
+    def __init__(self, ids, texts, metadatas, postings, doc_len, k1: float = 1.5, b: float = 0.75):
+        self.ids = ids
+        self.texts = texts
+        self.metadatas = metadatas
+        self.postings = postings
+        self.doc_len = doc_len
+        self.k1 = k1
+        self.b = b
+        self.avgdl = sum(doc_len) / len(doc_len) if doc_len else 0.0
+
+    @classmethod
+    def build(cls, ids, texts, metadatas) -> "BM25Index":
+        """Tokenize the chunks and build the index."""
+        doc_len = []
+        postings = defaultdict(list)
+        for i, text in enumerate(texts):
+            terms = tokenize(text)
+            doc_len.append(len(terms))
+            for term, tf in Counter(terms).items():
+                postings[term].append((i, tf))
+        return cls(list(ids), list(texts), list(metadatas), dict(postings), doc_len)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def idf(self, term: str) -> float:
+        """Inverse document frequency of a term, 0 for terms not in the index."""
+        postings = self.postings.get(term)
+        if not postings:
+            return 0.0
+        return math.log(1 + (len(self.ids) - len(postings) + 0.5) / (len(postings) + 0.5))
+
+    def search(self, query: str, k: int = 4) -> List[Tuple[int, float]]:
+        """Return the (chunk index, score) pairs of the k best matching chunks."""
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = self.idf(term)
+            for i, tf in postings:
+                norm = self.k1 * (1 - self.b + self.b * self.doc_len[i] / self.avgdl)
+                scores[i] += idf * tf * (self.k1 + 1) / (tf + norm)
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+    def get_documents(self, query: str, k: int = 4) -> List[Document]:
+        """Return the k best matching chunks as Documents, with their BM25 score in the metadata."""
+        return [
+            Document(id=self.ids[i], page_content=self.texts[i], metadata=self.metadatas[i] | {"bm25_score": score})
+            for i, score in self.search(query, k)
+        ]
+
+    def save(self, path: str):
+        """Atomically write the index to a JSON file."""
+        data = {
+            "ids": self.ids,
+            "texts": self.texts,
+            "metadatas": self.metadatas,
+            "postings": self.postings,
+            "doc_len": self.doc_len,
+        }
+        with open(path + ".tmp", "w") as f:
+            json.dump(data, f)
+        os.replace(path + ".tmp", path)
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        """Load an index written by ``save``."""
+        with open(path) as f:
+            data = json.load(f)
+        return cls(data["ids"], data["texts"], data["metadatas"], data["postings"], data["doc_len"])
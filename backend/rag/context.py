@@ -0,0 +1,211 @@
+from utils.constants import (CHARS_PER_TOKEN, CONTEXT_TOKEN_BUDGET, CONTEXT_DEDUP_THRESHOLD, CONTEXT_MIN_OVERLAP_CHARS,
+                             CONTEXT_MIN_TRUNCATE_TOKENS)
+from utils.metrics import observe_stage
+
+from typing import List, Optional
+import re
+
+from langchain_core.documents import Document
+
+WORD_RE = re.compile(r"\w+")
+
+
+def estimate_tokens(text: str) -> int:
+    """Roughly estimate the number of tokens of a text."""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def find_overlap(a: str, b: str, min_overlap: int = CONTEXT_MIN_OVERLAP_CHARS) -> int:
+    """Return the length of the longest suffix of ``a`` that is also a prefix of ``b``.
+
+    Overlaps shorter than ``min_overlap`` characters are ignored (0 is returned).
+    """
+    probe = b[:min_overlap]
+    if len(probe) < min_overlap:
+        return 0
+    start = a.find(probe, max(0, len(a) - len(b)))
+    while start != -1:
+        if b.startswith(a[start:]):
+            return len(a) - start
+        start = a.find(probe, start + 1)
+    return 0
+
+
+def merge_texts(a: str, b: str) -> Optional[str]:
+    """Merge two chunks when one contains the other or they overlap, else return None."""
+    if b in a:
+        return a
+    if a in b:
+        return b
+    overlap = find_overlap(a, b)
+    if overlap:
+        return a + b[overlap:]
+    overlap = find_overlap(b, a)
+    if overlap:
+        return b + a[overlap:]
+    return None
+
+
+def shingles(text: str, size: int = 3) -> set:
+    """Word n-grams of a text, used to compare passages."""
+    words = WORD_RE.findall(text.lower())
+    if len(words) <= size:
+        return {tuple(words)}
+    return {tuple(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def similarity(a: set, b: set) -> float:
+    """Jaccard similarity of two shingle sets."""
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def merge_table_groups(a: Document, b: Document) -> Optional[Document]:
+    """Join two consecutive row groups of the same table, keeping a single copy of the header.
+
+    The result keeps the ID and metadata of ``a`` with the row range widened,
+    or None when the chunks are not consecutive groups of the same table.
+    Tables are told apart by their position on the page (``table_index``),
+    chunks ingested without it are never merged.
+    """
+    if a.metadata.get("table_index") is None or a.metadata.get("table_index") != b.metadata.get("table_index"):
+        return None
+    first, second = sorted((a, b), key=lambda doc: doc.metadata.get("row_start", -1))
+    if "row_start" not in first.metadata or first.metadata.get("row_end", -2) + 1 != second.metadata.get("row_start"):
+        return None
+    # Each group starts with the header and separator lines of its table
+    first_lines = first.page_content.split("\n", 2)
+    second_lines = second.page_content.split("\n", 2)
+    if len(first_lines) < 3 or len(second_lines) < 3 or first_lines[:2] != second_lines[:2]:
+        return None
+    text = first.page_content.rstrip("\n") + "\n" + second_lines[2]
+    rows = {"row_start": first.metadata["row_start"], "row_end": second.metadata["row_end"]}
+    return Document(id=a.id, page_content=text, metadata=a.metadata | rows)
+
+
+def merge_pair(a: Document, b: Document) -> Optional[Document]:
+    """Merge two chunks of the same source and page, or return None.
+
+    Text chunks merge when one contains the other or they overlap, table
+    chunks when they are consecutive row groups of the same table. The result
+    keeps the ID and metadata of ``a``.
+    """
+    if (a.metadata.get("source"), a.metadata.get("page")) != (b.metadata.get("source"), b.metadata.get("page")):
+        return None
+    if a.metadata.get("type") == "table" or b.metadata.get("type") == "table":
+        if a.metadata.get("type") != b.metadata.get("type"):
+            return None
+        return merge_table_groups(a, b)
+    text = merge_texts(a.page_content, b.page_content)
+    if text is None:
+        return None
+    return Document(id=a.id, page_content=text, metadata=a.metadata)
+
+
+def merge_chunks(docs: List[Document]) -> List[Document]:
+    """Merge overlapping or adjacent chunks of the same source and page.
+
+    The splitter repeats up to ``chunk_overlap`` characters between
+    neighbouring text chunks, so two hits from the same page often share
+    text, and consecutive row groups of a table repeat its header. A merged
+    chunk keeps the position and metadata of its best ranked part.
+
+    Args:
+        docs (List[Document]): The retrieved documents, best first.
+
+    Returns:
+        List[Document]: The documents after merging, best first.
+    """
+    merged = list(docs)
+    changed = True
+    # Merging two chunks can make them overlap a third one, so repeat until stable
+    while changed:
+        changed = False
+        for i in range(len(merged)):
+            for j in range(i + 1, len(merged)):
+                combined = merge_pair(merged[i], merged[j])
+                if combined is not None:
+                    merged[i] = combined
+                    del merged[j]
+                    changed = True
+                    break
+            if changed:
+                break
+    return merged
+
+
+def remove_near_duplicates(docs: List[Document], threshold: float = CONTEXT_DEDUP_THRESHOLD) -> List[Document]:
+    """Drop passages too similar to a better ranked one (e.g. the same table ingested from two files).
+
+    Args:
+        docs (List[Document]): The documents, best first.
+        threshold (float, optional): Word 3-gram Jaccard similarity above which a passage is dropped. Defaults to CONTEXT_DEDUP_THRESHOLD.
+
+    Returns:
+        List[Document]: The kept documents, best first.
+    """
+    kept, kept_shingles = [], []
+    for doc in docs:
+        doc_shingles = shingles(doc.page_content)
+        if any(similarity(doc_shingles, other) >= threshold for other in kept_shingles):
+            continue
+        kept.append(doc)
+        kept_shingles.append(doc_shingles)
+    return kept
+
+
+def truncate_to_tokens(text: str, tokens: int) -> str:
+    """Cut a text to fit in ``tokens`` tokens, at a line or word boundary when possible."""
+    if estimate_tokens(text) <= tokens:
+        return text
+    # Room for the " ..." marker, and estimate_tokens counts one token more than len // CHARS_PER_TOKEN
+    limit = tokens * CHARS_PER_TOKEN - 5
+    cut = text[:limit]
+    boundary = max(cut.rfind("\n"), cut.rfind(" "))
+    if boundary > limit // 2:
+        cut = cut[:boundary]
+    return cut.rstrip() + " ..."
+
+
+def pack_context(docs: List[Document], budget: int = CONTEXT_TOKEN_BUDGET) -> List[Document]:
+    """Keep the best ranked documents that fit in the token budget.
+
+    Documents that do not fit are skipped so smaller, lower ranked ones can
+    still be used. A document is cut instead when at least
+    CONTEXT_MIN_TRUNCATE_TOKENS are left, so the best hit is never dropped
+    just for being long (e.g. a large table).
+
+    Args:
+        docs (List[Document]): The documents, best first.
+        budget (int, optional): Token budget of the context. Defaults to CONTEXT_TOKEN_BUDGET.
+
+    Returns:
+        List[Document]: The packed documents, best first.
+    """
+    packed = []
+    remaining = budget
+    for doc in docs:
+        cost = estimate_tokens(doc.page_content)
+        if cost <= remaining:
+            packed.append(doc)
+            remaining -= cost
+        elif remaining >= CONTEXT_MIN_TRUNCATE_TOKENS:
+            text = truncate_to_tokens(doc.page_content, remaining)
+            packed.append(Document(id=doc.id, page_content=text, metadata=doc.metadata | {"truncated": True}))
+            remaining -= estimate_tokens(text)
+    return packed
+
+
+def assemble_context(docs: List[Document], budget: int = CONTEXT_TOKEN_BUDGET) -> List[Document]:
+    """Merge overlapping chunks, drop near-duplicates and pack the result into the token budget.
+
+    Args:
+        docs (List[Document]): The retrieved documents, best first.
+        budget (int, optional): Token budget of the context. Defaults to CONTEXT_TOKEN_BUDGET.
+
+    Returns:
+        List[Document]: The documents to put in the prompt, best first.
+    """
+    with observe_stage("context_assembly"):
+        return pack_context(remove_near_duplicates(merge_chunks(docs)), budget)
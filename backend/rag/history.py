@@ -0,0 +1,132 @@
+from utils.utils import get_logger
+from utils.constants import (HISTORY_TOKEN_BUDGET, HISTORY_SUMMARY_MIN_MESSAGES, HISTORY_MAX_MESSAGES,
+                             BACKGROUND_LLM_WORKERS, BACKGROUND_QUEUE_SIZE)
+from utils.task_queue import KeyedTaskQueue
+from db.dbo import AsyncSessionLocal
+from db import models
+from rag.rag import summarize_history
+from rag.context import estimate_tokens
+
+from typing import List, Tuple
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+logger = get_logger()
+
+# Keyed by session id, so a session is only summarized once at a time
+summary_queue = KeyedTaskQueue("summary-refresh", BACKGROUND_LLM_WORKERS, BACKGROUND_QUEUE_SIZE)
+
+
+def window_start(messages: List[models.Message], budget: int = HISTORY_TOKEN_BUDGET) -> int:
+    """Find where the window of recent messages fitting in the token budget starts.
+
+    The latest message is always part of the window.
+
+    Args:
+        messages (List[models.Message]): The session messages, oldest first.
+        budget (int, optional): Token budget of the window. Defaults to HISTORY_TOKEN_BUDGET.
+
+    Returns:
+        int: Index of the oldest message of the window.
+    """
+    used = 0
+    start = len(messages)
+    while start > 0:
+        cost = estimate_tokens(messages[start - 1].content)
+        if used + cost > budget and start < len(messages):
+            break
+        used += cost
+        start -= 1
+    return start
+
+
+async def load_recent_messages(db: AsyncSession, session_id: str, limit: int = HISTORY_MAX_MESSAGES):
+    """Load the most recent messages of a session and the session's message count.
+
+    Args:
+        db (AsyncSession): The database session.
+        session_id (str): The session ID.
+        limit (int, optional): Maximum number of messages to load. Defaults to HISTORY_MAX_MESSAGES.
+
+    Returns:
+        tuple: The messages (oldest first) and the total number of messages in the session.
+    """
+    stmt = (
+        select(models.Message)
+        .where(models.Message.session_id == session_id)
+        .order_by(models.Message.created_at.desc(), models.Message.id.desc())
+        .limit(limit)
+    )
+    messages = list(reversed((await db.execute(stmt)).scalars().all()))
+    if len(messages) < limit:
+        return messages, len(messages)
+    total = await db.scalar(select(func.count()).select_from(models.Message).where(models.Message.session_id == session_id))
+    return messages, total
+
+
+def build_history(session: models.Session, messages: List[models.Message], offset: int = 0) -> List[Tuple[str, str]]:
+    """Build the (role, content) history sent to the LLM.
+
+    Recent messages are replayed as long as they fit in the token budget, and
+    older messages are represented by the session's rolling summary. When
+    enough messages fall outside both, a background refresh of the summary is
+    scheduled.
+
+    Args:
+        session (models.Session): The chat session.
+        messages (List[models.Message]): The latest session messages, oldest first.
+        offset (int, optional): Number of older messages of the session not included in ``messages``. Defaults to 0.
+
+    Returns:
+        List[Tuple[str, str]]: The history pairs.
+    """
+    local_start = window_start(messages)
+    start = offset + local_start
+    history = []
+    if session.summary and start > 0:
+        history.append(("system", f"Summary of the earlier conversation: {session.summary}"))
+    history.extend((m.role, m.content) for m in messages[local_start:])
+    if start - session.summary_message_count >= HISTORY_SUMMARY_MIN_MESSAGES:
+        schedule_summary_refresh(session.id, start)
+    return history
+
+
+async def refresh_summary(session_id: str, upto: int):
+    """Fold the messages before index ``upto`` into the session's rolling summary.
+
+    Runs in its own database session so it can outlive the request.
+
+    Args:
+        session_id (str): The session ID.
+        upto (int): Number of oldest messages the summary should cover.
+    """
+    async with AsyncSessionLocal() as db:
+        session = await db.get(models.Session, session_id)
+        if session is None or session.summary_message_count >= upto:
+            return
+        covered = session.summary_message_count
+        stmt = (
+            select(models.Message)
+            .where(models.Message.session_id == session_id)
+            .order_by(models.Message.created_at, models.Message.id)
+            .offset(covered)
+            .limit(upto - covered)
+        )
+        messages = (await db.execute(stmt)).scalars().all()
+        summary = await summarize_history(session.summary, [(m.role, m.content) for m in messages])
+        session.summary = summary
+        session.summary_message_count = covered + len(messages)
+        await db.commit()
+        logger.info(f"Summarized {session.summary_message_count} messages of session {session_id}")
+
+
+def schedule_summary_refresh(session_id: str, upto: int):
+    """Refresh the rolling summary of a session in the background, unless already pending."""
+    summary_queue.submit(session_id, lambda: refresh_summary(session_id, upto))
+
+
+def reset_summary(session: models.Session):
+    """Forget the rolling summary, e.g. after the session history was cleared."""
+    session.summary = None
+    session.summary_message_count = 0
@@ -0,0 +1,274 @@
+from utils.constants import LLM_MAX_CONCURRENCY, LLM_MAX_QUEUE, LLM_QUEUE_TIMEOUT
+from utils.metrics import LLM_IN_FLIGHT, LLM_QUEUE_SECONDS, LLM_REQUESTS
+
+from typing import TYPE_CHECKING, AsyncIterator, Callable, Dict, List, Optional, Tuple
+import asyncio
+import heapq
+import itertools
+import time
+
+if TYPE_CHECKING:
+    from langchain_core.language_models import BaseChatModel
+    from langchain_core.messages import BaseMessage
+
+# Lower ranks are served first
+PRIORITIES = {"interactive": 0, "batch": 1, "background": 2}
+
+
+class LLMOverloadedError(RuntimeError):
+    """Raised when an LLM request is rejected because too many requests are waiting."""
+
+
+def prompt_key(messages: List["BaseMessage"]) -> Tuple:
+    """Key identifying a prompt, equal for prompts generating the same answer."""
+    return tuple((m.type, str(m.content)) for m in messages)
+
+
+class _Generation:
+    """A generation shared by every caller that sent the same prompt.
+
+    The chunks are kept, so a caller joining a stream late replays it from
+    the start.
+    """
+
+    def __init__(self, priority: str):
+        self.priority = priority
+        # Queue entry while waiting for a slot, replaced when the priority is raised
+        self.waiter: Optional[list] = None
+        self.chunks: list = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.callers = 0
+        self.task: Optional[asyncio.Task] = None
+        self._changed = asyncio.Event()
+
+    def publish(self, chunk):
+        self.chunks.append(chunk)
+        self._notify()
+
+    def finish(self, error: Optional[BaseException] = None):
+        self.done = True
+        self.error = error
+        self._notify()
+
+    def _notify(self):
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def follow(self) -> AsyncIterator:
+        index = 0
+        while True:
+            # Taken before reading, so a chunk published while we yield wakes us up
+            changed = self._changed
+            while index < len(self.chunks):
+                yield self.chunks[index]
+                index += 1
+            if self.done:
+                if self.error is not None:
+                    raise self.error
+                return
+            await changed.wait()
+
+
+class LLMGateway:
+    """Single entry point of the LLM calls, limiting how many run at once.
+
+    At most ``max_concurrency`` generations are sent to Ollama together; the
+    other requests wait in a priority queue, interactive chat before batch
+    jobs before background jobs (session naming, summaries), first come first
+    served within a priority. When ``max_queue`` requests are already
+    waiting, a new request takes the place of the newest lower priority one,
+    or is rejected with LLMOverloadedError so the API can answer 503 right
+    away instead of letting every request slow down. Requests also give up
+    after waiting ``queue_timeout`` seconds.
+
+    Identical prompts in flight are coalesced: the later callers share the
+    earlier generation. While it waits for a slot, a shared generation takes
+    the highest priority of its callers, so a chat prompt joining a queued
+    background generation is not served behind the other batch and
+    background requests. A generation is cancelled once none of its callers
+    waits for it.
+
+    Must be used from a single event loop.
+
+    Args:
+        llm_factory (Callable[[], BaseChatModel]): Returns the chat model, called for each generation.
+        max_concurrency (int, optional): Generations running at once. Defaults to LLM_MAX_CONCURRENCY.
+        max_queue (int, optional): Requests waiting for a slot before new ones are rejected. Defaults to LLM_MAX_QUEUE.
+        queue_timeout (float, optional): Seconds a request waits for a slot, None waits forever. Defaults to LLM_QUEUE_TIMEOUT.
+    """
+
+    def __init__(self, llm_factory: Callable[[], "BaseChatModel"], max_concurrency: int = LLM_MAX_CONCURRENCY,
+                 max_queue: int = LLM_MAX_QUEUE, queue_timeout: Optional[float] = LLM_QUEUE_TIMEOUT):
+        self.llm_factory = llm_factory
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        # [rank, sequence, priority, future], entries of requests that gave up stay until popped,
+        # entries replaced by a higher priority one have no future
+        self._waiters: list = []
+        self._sequence = itertools.count()
+        self._depth: Dict[str, int] = {priority: 0 for priority in PRIORITIES}
+        self._generations: Dict[Tuple, _Generation] = {}
+
+    def queued(self) -> int:
+        """Number of requests waiting for a slot."""
+        return sum(self._depth.values())
+
+    def queue_depths(self) -> Dict[Tuple[str, ...], float]:
+        """Requests waiting for a slot by priority, in the format of ``Gauge.set_function``."""
+        return {(priority,): depth for priority, depth in self._depth.items()}
+
+    def check_capacity(self, priority: str = "interactive"):
+        """Raise LLMOverloadedError now if a request of this priority would be rejected.
+
+        Lets streaming endpoints answer 503 before the response starts.
+        """
+        if self.active < self.max_concurrency or self.queued() < self.max_queue:
+            return
+        if self._lowest_waiter(PRIORITIES[priority]) is None:
+            LLM_REQUESTS.labels(priority, "rejected").inc()
+            raise LLMOverloadedError(f"LLM is overloaded ({self.queued()} requests waiting)")
+
+    async def invoke(self, messages: List["BaseMessage"], priority: str = "interactive"):
+        """Generate the answer to a prompt.
+
+        Args:
+            messages (List[BaseMessage]): The prompt.
+            priority (str, optional): "interactive", "batch" or "background". Defaults to "interactive".
+
+        Raises:
+            LLMOverloadedError: If the request was rejected or waited too long for a slot.
+
+        Returns:
+            BaseMessage: The model's answer.
+        """
+        chunks = [chunk async for chunk in self._follow(messages, priority, stream=False)]
+        return chunks[0]
+
+    async def stream(self, messages: List["BaseMessage"], priority: str = "interactive") -> AsyncIterator:
+        """Generate the answer to a prompt, yielding the chunks as the model produces them.
+
+        Raises:
+            LLMOverloadedError: If the request was rejected or waited too long for a slot.
+        """
+        async for chunk in self._follow(messages, priority, stream=True):
+            yield chunk
+
+    async def _follow(self, messages: List["BaseMessage"], priority: str, stream: bool) -> AsyncIterator:
+        key = (stream, prompt_key(messages))
+        generation = self._generations.get(key)
+        if generation is None:
+            generation = self._generations[key] = _Generation(priority)
+            generation.task = asyncio.create_task(self._generate(key, generation, messages, stream))
+        else:
+            LLM_REQUESTS.labels(priority, "coalesced").inc()
+            self._promote(generation, priority)
+        generation.callers += 1
+        try:
+            async for chunk in generation.follow():
+                yield chunk
+        finally:
+            generation.callers -= 1
+            if generation.callers == 0 and not generation.done:
+                # Nobody waits for the answer any more, e.g. the client went away. Forget it now,
+                # an identical prompt arriving before the task has unwound must not join it
+                if self._generations.get(key) is generation:
+                    del self._generations[key]
+                generation.task.cancel()
+
+    async def _generate(self, key: Tuple, generation: _Generation, messages: List["BaseMessage"], stream: bool):
+        try:
+            await self._acquire(generation)
+            LLM_IN_FLIGHT.inc()
+            try:
+                llm = self.llm_factory()
+                if stream:
+                    async for chunk in llm.astream(messages):
+                        generation.publish(chunk)
+                else:
+                    generation.publish(await llm.ainvoke(messages))
+            finally:
+                LLM_IN_FLIGHT.dec()
+                self._release()
+        except asyncio.CancelledError as e:
+            generation.finish(e)
+            raise
+        except Exception as e:
+            if not isinstance(e, LLMOverloadedError):
+                LLM_REQUESTS.labels(generation.priority, "failed").inc()
+            generation.finish(e)
+        else:
+            LLM_REQUESTS.labels(generation.priority, "generated").inc()
+            generation.finish()
+        finally:
+            if self._generations.get(key) is generation:
+                del self._generations[key]
+
+    async def _acquire(self, generation: _Generation):
+        priority = generation.priority
+        start = time.perf_counter()
+        if self.active < self.max_concurrency and not self.queued():
+            self.active += 1
+            LLM_QUEUE_SECONDS.labels(priority).observe(0.0)
+            return
+        rank = PRIORITIES[priority]
+        if self.queued() >= self.max_queue:
+            victim = self._lowest_waiter(rank)
+            if victim is None:
+                LLM_REQUESTS.labels(priority, "rejected").inc()
+                raise LLMOverloadedError(f"LLM is overloaded ({self.queued()} requests waiting)")
+            victim[3].set_exception(LLMOverloadedError("LLM is overloaded, request preempted by a higher priority one"))
+        future = asyncio.get_running_loop().create_future()
+        generation.waiter = [rank, next(self._sequence), priority, future]
+        heapq.heappush(self._waiters, generation.waiter)
+        self._depth[priority] += 1
+        try:
+            await asyncio.wait_for(future, self.queue_timeout)
+        except BaseException as e:
+            if future.done() and not future.cancelled() and future.exception() is None:
+                # The slot was handed over just as we gave up, pass it on
+                self._release()
+            if isinstance(e, (TimeoutError, LLMOverloadedError)):
+                LLM_REQUESTS.labels(generation.priority, "rejected").inc()
+            if isinstance(e, TimeoutError):
+                raise LLMOverloadedError(f"LLM is overloaded, no slot within {self.queue_timeout}s") from None
+            raise
+        finally:
+            # The priority may have been raised while waiting
+            self._depth[generation.priority] -= 1
+            generation.waiter = None
+            LLM_QUEUE_SECONDS.labels(generation.priority).observe(time.perf_counter() - start)
+
+    def _promote(self, generation: _Generation, priority: str):
+        """Raise the priority of a generation to the one of a new caller, if higher."""
+        if PRIORITIES[priority] >= PRIORITIES[generation.priority]:
+            return
+        old = generation.priority
+        generation.priority = priority
+        waiter = generation.waiter
+        if waiter is None or waiter[3] is None or waiter[3].done():
+            # Not queued (yet, or any more), the new priority only labels its metrics
+            return
+        # Re-queued under the new rank; the old entry is emptied and skipped when popped
+        generation.waiter = [PRIORITIES[priority], next(self._sequence), priority, waiter[3]]
+        waiter[3] = None
+        heapq.heappush(self._waiters, generation.waiter)
+        self._depth[old] -= 1
+        self._depth[priority] += 1
+
+    def _release(self):
+        while self._waiters:
+            future = heapq.heappop(self._waiters)[3]
+            if future is not None and not future.done():
+                # The slot goes straight to the waiter, so ``active`` does not change
+                future.set_result(None)
+                return
+        self.active -= 1
+
+    def _lowest_waiter(self, rank: int):
+        """The newest waiting request of the lowest priority below ``rank``, or None."""
+        candidates = [waiter for waiter in self._waiters
+                      if waiter[0] > rank and waiter[3] is not None and not waiter[3].done()]
+        return max(candidates, key=lambda waiter: (waiter[0], waiter[1]), default=None)
@@ -0,0 +1,17 @@
+from utils.constants import SYSTEM_MSG, BASE_HUMAN_MSG, SUMMARY_SYSTEM_MSG, SUMMARY_HUMAN_MSG, SESSION_NAME_MSG
+
+from langchain_core.prompts import ChatPromptTemplate
+
+BASE_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", SYSTEM_MSG),
+    ("human", BASE_HUMAN_MSG),
+])
+
+SUMMARY_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", SUMMARY_SYSTEM_MSG),
+    ("human", SUMMARY_HUMAN_MSG),
+])
+
+SESSION_NAME_PROMPT = ChatPromptTemplate.from_messages([
+    ("user", SESSION_NAME_MSG)
+])
@@ -1,41 +1,187 @@
 
-from utils.utils import get_logger
-from db.dbo import get_vector_store
-from utils.constants import OLLAMA_LLM_MODEL, BASE_PROMPT, SESSION_NAME_PROMPT
+from utils.utils import get_embedding_model, get_logger, log_payload
+from utils.metrics import LLM_QUEUE_DEPTH, STAGE_SECONDS, observe_stage, register_cache
+from db.dbo import current_corpus_version
+from utils.constants import (OLLAMA_LLM_MODEL, RETRIEVAL_MAX_WORKERS, ANSWER_CACHE_SIZE, BATCH_LLM_CONCURRENCY, CHROMA_COLLECTION,
+                             RETRIEVAL_BACKEND, WARM_UP_RETRY_SECONDS, WARM_UP_MAX_RETRY_SECONDS)
 from db.models import Message
+from rag.context import assemble_context
+from rag.llm_gateway import LLMGateway
+from rag.store_registry import StoreHandle, VectorStoreRegistry
 
-from typing import List, Tuple
-from langchain.callbacks.base import BaseCallbackHandler
-from langchain_core.documents import Document
-from langchain_community.vectorstores import Chroma
-from langchain_ollama import ChatOllama
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, AsyncIterator, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    from langchain_core.documents import Document
+    from langchain_core.language_models import BaseChatModel
+    from langchain_core.retrievers import BaseRetriever
+    from langchain_core.vectorstores import VectorStore
 
 logger = get_logger()
 
-# Prepare vector store (read-only)
+# The vector stores, retrievers and LLM client are built on first use (or by
+# warm_up), and LangChain modules are imported there too, so importing this
+# module stays cheap and the non-chat endpoints can serve right away.
+_stores = VectorStoreRegistry()
+_llm: Optional["BaseChatModel"] = None
+_llm_lock = threading.Lock()
+# Retrieval (embedding HTTP call + Chroma query) is blocking, keep it off the event loop
+_retrieval_executor = ThreadPoolExecutor(max_workers=RETRIEVAL_MAX_WORKERS, thread_name_prefix="rag-retrieval")
+# "starting", "ready" or "failed", reported by the readiness probe
+_warm_up_state = "starting"
+
+register_cache("answer", _stores.answer_cache_stats)
+register_cache("vector_store", _stores.stats)
+
+
+def get_store(collection: str = CHROMA_COLLECTION) -> StoreHandle:
+    """Get an open collection, opening it on first use.
+
+    Raises:
+        UnknownCollectionError: If the collection does not exist.
+    """
+    return _stores.get(collection)
+
+
+def get_vectordb(collection: str = CHROMA_COLLECTION) -> "VectorStore":
+    """Get the vector store of a collection, opening it on first use."""
+    return get_store(collection).vectorstore
+
+
+def get_rag_retriever(collection: str = CHROMA_COLLECTION) -> "BaseRetriever":
+    """Get the retriever of a collection, building it on first use."""
+    return get_store(collection).retriever
+
+
+async def open_collection(collection: str = CHROMA_COLLECTION) -> StoreHandle:
+    """Open a collection without blocking the event loop.
+
+    Raises:
+        UnknownCollectionError: If the collection does not exist.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_retrieval_executor, get_store, collection)
+
+
+def get_llm() -> "BaseChatModel":
+    """Get the shared chat model client, creating it on first use."""
+    global _llm
+    with _llm_lock:
+        if _llm is None:
+            from langchain_ollama import ChatOllama
+            _llm = ChatOllama(model=OLLAMA_LLM_MODEL, temperature=0)
+        return _llm
+
 
-_vectordb = get_vector_store()
-_retriever = _vectordb.as_retriever(search_kwargs={"k": 4})
-_llm = ChatOllama(model=OLLAMA_LLM_MODEL, temperature=0)
+# Every LLM call goes through the gateway, which bounds and prioritizes the calls to Ollama
+llm_gateway = LLMGateway(get_llm)
+LLM_QUEUE_DEPTH.set_function(llm_gateway.queue_depths)
 
 
 def format_history(pairs: List[Tuple[str, str]]) -> str:
     lines = []
     for role, content in pairs:
+        # Roles loaded from the DB are RoleEnum members rather than plain strings
+        role = getattr(role, "value", role)
         lines.append(f"{role.title()}: {content}")
     return "\n".join(lines)
 
 
-async def run_rag(question: str, history: List[Tuple[str, str]]):
-    # Retrieve docs
-    docs: List[Document] = _retriever.get_relevant_documents(question)
-    context = "\n---\n".join([d.page_content for d in docs])
-    messages = BASE_PROMPT.format_messages(
-        context=context,
-        history=format_history(history),
-        question=question)
-    logger.info(f"RAG prompt: {messages}")
-    resp = await _llm.ainvoke(messages)
+async def retrieve(question: str, collection: str = CHROMA_COLLECTION,
+                   embedding: Optional[List[float]] = None) -> List["Document"]:
+    """Retrieve the documents relevant to a question without blocking the event loop.
+
+    Args:
+        question (str): The user question.
+        collection (str, optional): The collection searched. Defaults to CHROMA_COLLECTION.
+        embedding (List[float], optional): The question embedding, if already computed, so it is not embedded again.
+
+    Returns:
+        List[Document]: The retrieved documents.
+    """
+    def search():
+        retriever = get_rag_retriever(collection)
+        if embedding is None:
+            return retriever.invoke(question)
+        return retriever.retrieve_by_vector(question, embedding)
+
+    loop = asyncio.get_running_loop()
+    with observe_stage("retrieval"):
+        return await loop.run_in_executor(_retrieval_executor, search)
+
+
+def _warm_up_retrieval():
+    from rag.retrievers import load_bm25_index, load_snapshot
+    # Import the prompt templates now rather than during the first chat request
+    import rag.prompts  # noqa: F401
+    get_llm()
+    # Only the default collection is warmed up, the others open on their first request
+    store = get_store()
+    embedding_model = get_embedding_model()
+    # Call the underlying model so Ollama loads it even if "warm up" is already cached
+    vector = embedding_model.embeddings.embed_query("warm up")
+    count = store.vectorstore._collection.count()  # type: ignore[attr-defined]
+    if count:
+        # The first query loads the HNSW index from disk
+        store.vectorstore.similarity_search_by_vector(vector, k=1)
+    load_bm25_index(store.directory)
+    if RETRIEVAL_BACKEND == "snapshot":
+        load_snapshot(store.directory)
+    return count
+
+
+async def warm_up(retry_seconds: float = WARM_UP_RETRY_SECONDS, max_retry_seconds: float = WARM_UP_MAX_RETRY_SECONDS):
+    """Build the RAG components and load the embedding model, the HNSW index and the BM25 index.
+
+    Runs in the background at startup; the readiness probe reports its
+    progress. A failed attempt (e.g. Ollama not up yet) is retried with
+    exponential backoff until one succeeds, so the state moves from "failed"
+    to "ready" once the dependencies are available.
+
+    Args:
+        retry_seconds (float, optional): Delay before the first retry. Defaults to WARM_UP_RETRY_SECONDS.
+        max_retry_seconds (float, optional): Longest delay between attempts. Defaults to WARM_UP_MAX_RETRY_SECONDS.
+    """
+    global _warm_up_state
+    _warm_up_state = "starting"
+    loop = asyncio.get_running_loop()
+    delay = retry_seconds
+    while True:
+        start = time.perf_counter()
+        try:
+            count = await loop.run_in_executor(_retrieval_executor, _warm_up_retrieval)
+        except Exception as e:
+            _warm_up_state = "failed"
+            logger.warning(f"Retrieval warm-up failed, retrying in {delay:.0f}s: {e}")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, max_retry_seconds)
+            continue
+        _warm_up_state = "ready"
+        logger.info(f"Warmed up retrieval over {count} chunks in {time.perf_counter() - start:.2f}s")
+        return
+
+
+def get_warm_up_state() -> str:
+    """Get the warm-up state: "starting", "ready" or "failed"."""
+    return _warm_up_state
+
+
+def build_messages(question: str, history: List[Tuple[str, str]], docs: List["Document"]):
+    from rag.prompts import BASE_PROMPT
+
+    with observe_stage("prompt_build"):
+        context = "\n---\n".join([d.page_content for d in docs])
+        return BASE_PROMPT.format_messages(
+            context=context,
+            history=format_history(history),
+            question=question)
+
+
+def get_sources(docs: List["Document"]) -> List[dict]:
     # Gather metadata for sources
     sources = []
     for d in docs:
@@ -43,15 +189,182 @@ async def run_rag(question: str, history: List[Tuple[str, str]]):
             "id": d.metadata.get("id") or d.metadata.get("source") or "unknown",
             "source": d.metadata.get("source") or d.metadata.get("path") or "",
             "page": d.metadata.get("page") or d.metadata.get("loc") or None,
-            "score": d.metadata.get("score") or None,
+            "score": d.metadata.get("score"),
         }
         sources.append(src)
+    return sources
+
+
+async def lookup_answer_cache(question: str, history: List[Tuple[str, str]], collection: str = CHROMA_COLLECTION):
+    """Look up a cached answer for a question asked without history.
+
+    Returns:
+        tuple: ``(cached, embedding, corpus_version)`` where ``cached`` is the
+        ``(answer, sources)`` pair on a hit and ``embedding`` is None when the
+        cache does not apply.
+    """
+    if history or ANSWER_CACHE_SIZE <= 0:
+        return None, None, None
+    store = await open_collection(collection)
+    # Passed on to the retriever on a miss, so the question is embedded once
+    embedding = await get_embedding_model().aembed_query(question)
+    corpus_version = current_corpus_version(store.directory)
+    return store.answer_cache.lookup(embedding, corpus_version), embedding, corpus_version
+
+
+def cache_answer(collection: str, embedding, answer: str, sources: List[dict], corpus_version):
+    """Store an answer in the answer cache of its collection, if the collection is still open."""
+    store = _stores.peek(collection)
+    if store is not None:
+        store.answer_cache.add(embedding, answer, sources, corpus_version)
+
+
+async def run_rag(question: str, history: List[Tuple[str, str]], collection: str = CHROMA_COLLECTION):
+    cached, embedding, corpus_version = await lookup_answer_cache(question, history, collection)
+    if cached:
+        return cached
+    # Retrieve docs
+    docs = assemble_context(await retrieve(question, collection, embedding))
+    messages = build_messages(question, history, docs)
+    log_payload("RAG prompt: %s", messages)
+    with observe_stage("llm_total"):
+        resp = await llm_gateway.invoke(messages, priority="interactive")
+    sources = get_sources(docs)
+    if embedding is not None:
+        cache_answer(collection, embedding, resp.content, sources, corpus_version)
     return resp.content, sources
 
 
+async def run_rag_batch(questions: List[str], max_concurrency: int = BATCH_LLM_CONCURRENCY,
+                        collection: str = CHROMA_COLLECTION):
+    """Answer many independent questions (without history) together.
+
+    Identical questions are answered once. All questions are embedded in one
+    batched call and their vector searches run as a single Chroma query. The
+    answers are generated with at most ``max_concurrency`` LLM calls in flight,
+    at batch priority so interactive chat is served first.
+
+    Args:
+        questions (List[str]): The questions.
+        max_concurrency (int, optional): Maximum concurrent LLM calls. Defaults to BATCH_LLM_CONCURRENCY.
+        collection (str, optional): The collection searched. Defaults to CHROMA_COLLECTION.
+
+    Yields:
+        tuple: ``(index, answer, sources, error)`` for each question, in completion order.
+        ``index`` is the position in ``questions``; ``error`` is None on success.
+    """
+    from rag.retrievers import retrieve_batch
+
+    positions: dict[str, List[int]] = {}
+    for i, question in enumerate(questions):
+        positions.setdefault(question.strip(), []).append(i)
+    texts = list(positions)
+    if not texts:
+        return
+    store = await open_collection(collection)
+    # The embeddings land in the embedding cache, so nothing is embedded twice
+    embeddings = await get_embedding_model().aembed_documents(texts)
+    corpus_version = current_corpus_version(store.directory)
+    pending = []
+    for text, embedding in zip(texts, embeddings):
+        cached = store.answer_cache.lookup(embedding, corpus_version) if ANSWER_CACHE_SIZE > 0 else None
+        if cached is None:
+            pending.append((text, embedding))
+            continue
+        for i in positions[text]:
+            yield i, cached[0], cached[1], None
+    if not pending:
+        return
+
+    loop = asyncio.get_running_loop()
+    with observe_stage("retrieval"):
+        all_docs = await loop.run_in_executor(
+            _retrieval_executor,
+            lambda: retrieve_batch(store.retriever, store.vectorstore, [t for t, _ in pending], [e for _, e in pending]),
+        )
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def generate(text, embedding, docs):
+        try:
+            async with semaphore:
+                messages = build_messages(text, [], docs)
+                with observe_stage("llm_total"):
+                    resp = await llm_gateway.invoke(messages, priority="batch")
+        except Exception as e:
+            logger.warning(f"Batch question failed: {e}")
+            return text, None, [], str(e)
+        sources = get_sources(docs)
+        store.answer_cache.add(embedding, resp.content, sources, corpus_version)
+        return text, resp.content, sources, None
+
+    tasks = [
+        asyncio.create_task(generate(text, embedding, assemble_context(docs)))
+        for (text, embedding), docs in zip(pending, all_docs)
+    ]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            text, answer, sources, error = await next_done
+            for i in positions[text]:
+                yield i, answer, sources, error
+    finally:
+        # Stop generating if the consumer went away
+        for task in tasks:
+            task.cancel()
+
+
+async def stream_rag(question: str, history: List[Tuple[str, str]],
+                     collection: str = CHROMA_COLLECTION) -> AsyncIterator[Tuple[str, object]]:
+    """Run RAG and yield results as they become available.
+
+    Yields a single ``("sources", list)`` event as soon as retrieval finishes,
+    followed by one ``("token", str)`` event per chunk produced by the LLM.
+
+    Args:
+        question (str): The user question.
+        history (List[Tuple[str, str]]): Previous (role, content) pairs of the session.
+        collection (str, optional): The collection searched. Defaults to CHROMA_COLLECTION.
+    """
+    cached, embedding, corpus_version = await lookup_answer_cache(question, history, collection)
+    if cached:
+        answer, sources = cached
+        yield "sources", sources
+        yield "token", answer
+        return
+    docs = assemble_context(await retrieve(question, collection, embedding))
+    sources = get_sources(docs)
+    yield "sources", sources
+    messages = build_messages(question, history, docs)
+    log_payload("RAG prompt: %s", messages)
+    tokens = []
+    start = time.perf_counter()
+    async for chunk in llm_gateway.stream(messages, priority="interactive"):
+        if chunk.content:
+            if not tokens:
+                STAGE_SECONDS.labels("llm_first_token").observe(time.perf_counter() - start)
+            tokens.append(chunk.content)
+            yield "token", chunk.content
+    STAGE_SECONDS.labels("llm_total").observe(time.perf_counter() - start)
+    if embedding is not None:
+        cache_answer(collection, embedding, "".join(tokens), sources, corpus_version)
+
+
 async def create_session_name(messages: List[Message]) -> str:
+    from rag.prompts import SESSION_NAME_PROMPT
+
     prompt = SESSION_NAME_PROMPT.format_messages(
         messages=[msg.content for msg in messages[:6] if msg.role != "system"]
     )
-    resp = await _llm.ainvoke(prompt)
-    return resp.content.strip().strip('"').strip("'")
\ No newline at end of file
+    resp = await llm_gateway.invoke(prompt, priority="background")
+    lines = resp.content.strip().splitlines() or [""]
+    return lines[0].strip().strip('"').strip("'")
+
+
+async def summarize_history(summary: str | None, pairs: List[Tuple[str, str]]) -> str:
+    from rag.prompts import SUMMARY_PROMPT
+
+    prompt = SUMMARY_PROMPT.format_messages(
+        summary=summary or "(none)",
+        messages=format_history(pairs),
+    )
+    resp = await llm_gateway.invoke(prompt, priority="background")
+    return resp.content.strip()
@@ -0,0 +1,159 @@
+from utils.constants import (RERANKER, RERANK_MODEL, RERANK_BATCH_SIZE, RERANK_SIMILARITY_WEIGHT, RERANK_MIN_SCORE,
+                             RERANK_RELATIVE_CUTOFF, RETRIEVAL_K, RETRIEVAL_MIN_K)
+from rag.bm25 import BM25Index, tokenize
+from utils.utils import get_logger
+
+from typing import List, Optional
+import threading
+
+import numpy as np
+from langchain_core.documents import Document
+
+logger = get_logger()
+
+
+def cosine_similarities(query_embedding: List[float], embeddings: List[List[float]]) -> np.ndarray:
+    """Cosine similarity of a query embedding to each of the given embeddings."""
+    query = np.asarray(query_embedding, dtype=np.float32)
+    matrix = np.asarray(embeddings, dtype=np.float32).reshape(len(embeddings), -1)
+    norms = np.linalg.norm(matrix, axis=1) * (np.linalg.norm(query) or 1.0)
+    norms[norms == 0] = 1.0
+    return matrix @ query / norms
+
+
+class FeatureReranker:
+    """CPU-only reranker mixing embedding similarity with query term coverage.
+
+    The term coverage is the IDF-weighted share of the query terms found in a
+    passage, which favours passages mentioning the rare terms of the question
+    (years, pollutant names, places). Each batch of passages is scored with one
+    matrix product.
+
+    Args:
+        similarity_weight (float, optional): Weight of the embedding similarity, the rest goes to term coverage. Defaults to RERANK_SIMILARITY_WEIGHT.
+        batch_size (int, optional): Passages scored together. Defaults to RERANK_BATCH_SIZE.
+    """
+
+    def __init__(self, similarity_weight: float = RERANK_SIMILARITY_WEIGHT, batch_size: int = RERANK_BATCH_SIZE):
+        self.similarity_weight = similarity_weight
+        self.batch_size = batch_size
+
+    def score(self, query: str, docs: List[Document], index: Optional[BM25Index] = None) -> np.ndarray:
+        """Score passages against a query, in [0, 1].
+
+        Args:
+            query (str): The query.
+            docs (List[Document]): The passages, with their embedding similarity in the ``similarity`` metadata.
+            index (BM25Index, optional): Index providing the term IDFs. All terms weigh the same without it.
+
+        Returns:
+            np.ndarray: The score of each passage.
+        """
+        terms = sorted(set(tokenize(query)))
+        weights = np.array([index.idf(t) if index is not None else 1.0 for t in terms], dtype=np.float32)
+        if weights.sum() > 0:
+            weights /= weights.sum()
+        similarity = np.clip([d.metadata.get("similarity", 0.0) for d in docs], 0.0, 1.0)
+        coverage = np.zeros(len(docs), dtype=np.float32)
+        for start in range(0, len(docs), self.batch_size):
+            batch = docs[start:start + self.batch_size]
+            present = np.array(
+                [[term in doc_terms for term in terms] for doc_terms in (set(tokenize(d.page_content)) for d in batch)],
+                dtype=np.float32,
+            ).reshape(len(batch), len(terms))
+            coverage[start:start + len(batch)] = present @ weights
+        return self.similarity_weight * similarity + (1 - self.similarity_weight) * coverage
+
+
+class CrossEncoderReranker:
+    """Reranker running a local cross-encoder (e.g. an MS MARCO MiniLM model) over (query, passage) pairs.
+
+    Args:
+        model_name (str, optional): Hugging Face model name or path. Defaults to RERANK_MODEL.
+        batch_size (int, optional): Pairs per forward pass. Defaults to RERANK_BATCH_SIZE.
+    """
+
+    def __init__(self, model_name: str = RERANK_MODEL, batch_size: int = RERANK_BATCH_SIZE):
+        # Imported here since torch is optional and slow to load
+        from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        self.model = AutoModelForSequenceClassification.from_pretrained(model_name).eval()
+        self.batch_size = batch_size
+
+    def score(self, query: str, docs: List[Document], index: Optional[BM25Index] = None) -> np.ndarray:
+        """Score passages against a query, in [0, 1]."""
+        import torch
+
+        scores = []
+        for start in range(0, len(docs), self.batch_size):
+            batch = docs[start:start + self.batch_size]
+            inputs = self.tokenizer(
+                [query] * len(batch), [d.page_content for d in batch],
+                padding=True, truncation=True, max_length=512, return_tensors="pt",
+            )
+            with torch.inference_mode():
+                logits = self.model(**inputs).logits
+            # Relevance models have a single logit, squashed to [0, 1] so the cutoffs apply
+            scores.append(torch.sigmoid(logits[:, 0]).float().numpy())
+        return np.concatenate(scores) if scores else np.zeros(0, dtype=np.float32)
+
+
+_reranker = None
+_reranker_lock = threading.Lock()
+
+
+def get_reranker(kind: str = RERANKER):
+    """Get the shared reranker, creating it on first use. Returns None when reranking is disabled ("none").
+
+    Falls back to the FeatureReranker when the cross-encoder cannot be loaded,
+    e.g. transformers is not installed or the model is not downloaded.
+    """
+    global _reranker
+    if kind == "none":
+        return None
+    with _reranker_lock:
+        if _reranker is None:
+            if kind == "cross-encoder":
+                try:
+                    _reranker = CrossEncoderReranker()
+                except (ImportError, OSError) as e:
+                    logger.warning(f"Cross-encoder '{RERANK_MODEL}' is not available, reranking with features: {e}")
+                    _reranker = FeatureReranker()
+            else:
+                _reranker = FeatureReranker()
+        return _reranker
+
+
+def select_passages(docs: List[Document], scores: np.ndarray, max_k: int = RETRIEVAL_K, min_k: int = RETRIEVAL_MIN_K,
+                    min_score: float = RERANK_MIN_SCORE,
+                    relative_cutoff: float = RERANK_RELATIVE_CUTOFF) -> List[Document]:
+    """Keep the best passages, as many as clear both cutoffs.
+
+    A passage is kept if it scores at least ``min_score`` and at least
+    ``relative_cutoff`` times the best score, so an easy question is answered
+    from its one or two strong passages while a broad one gets up to
+    ``max_k``. The ``min_k`` best passages are always kept.
+
+    Args:
+        docs (List[Document]): The candidate passages.
+        scores (np.ndarray): Their rerank scores.
+        max_k (int, optional): Maximum passages kept. Defaults to RETRIEVAL_K.
+        min_k (int, optional): Passages kept regardless of the cutoffs. Defaults to RETRIEVAL_MIN_K.
+        min_score (float, optional): Absolute score cutoff. Defaults to RERANK_MIN_SCORE.
+        relative_cutoff (float, optional): Cutoff as a share of the best score. Defaults to RERANK_RELATIVE_CUTOFF.
+
+    Returns:
+        List[Document]: The kept passages, best first, with their score in the ``score`` metadata.
+    """
+    if not docs:
+        return []
+    order = np.argsort(-np.asarray(scores), kind="stable")
+    cutoff = max(min_score, float(scores[order[0]]) * relative_cutoff)
+    selected = []
+    for rank, i in enumerate(order[:max_k]):
+        if rank >= min_k and scores[i] < cutoff:
+            break
+        doc = docs[i]
+        selected.append(Document(id=doc.id, page_content=doc.page_content, metadata=doc.metadata | {"score": float(scores[i])}))
+    return selected
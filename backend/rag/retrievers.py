@@ -0,0 +1,292 @@
+from utils.constants import (PERSIST_DIRECTORY, BM25_INDEX_FILE, RETRIEVAL_MODE, RETRIEVAL_K, HYBRID_FETCH_K, RRF_K, RERANKER,
+                             RETRIEVAL_BACKEND)
+from db.dbo import current_corpus_version
+from rag.bm25 import BM25Index
+from rag.rerank import cosine_similarities, get_reranker, select_passages
+from rag.snapshot import SnapshotIndex
+from utils.metrics import observe_stage
+from utils.utils import get_logger
+
+from typing import List, Optional, Tuple
+import os
+import threading
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.vectorstores import VectorStore
+
+logger = get_logger()
+
+# path -> (corpus version, index)
+_bm25_indexes: dict[str, Tuple[Optional[str], Optional[BM25Index]]] = {}
+# collection directory -> (corpus version, snapshot)
+_snapshots: dict[str, Tuple[Optional[str], Optional[SnapshotIndex]]] = {}
+# Retrieval runs on worker threads, so only one of them loads a given index
+_load_lock = threading.Lock()
+
+
+def load_bm25_index(persist_directory=PERSIST_DIRECTORY) -> Optional[BM25Index]:
+    """Load the BM25 index stored next to the vector store.
+
+    The index is cached and reloaded when the corpus version changes, which is
+    noticed within CORPUS_VERSION_CHECK_SECONDS.
+
+    Args:
+        persist_directory (str, optional): The path to the directory for persisting the vector store. Defaults to PERSIST_DIRECTORY.
+
+    Returns:
+        Optional[BM25Index]: The index, or None if ingestion did not build one.
+    """
+    path = os.path.join(persist_directory, BM25_INDEX_FILE)
+    version = current_corpus_version(persist_directory)
+    cached = _bm25_indexes.get(path)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    with _load_lock:
+        cached = _bm25_indexes.get(path)
+        if cached is not None and cached[0] == version:
+            # Loaded by another thread while we waited
+            return cached[1]
+        index = BM25Index.load(path) if os.path.exists(path) else None
+        _bm25_indexes[path] = (version, index)
+    return index
+
+
+def load_snapshot(persist_directory=PERSIST_DIRECTORY) -> Optional[SnapshotIndex]:
+    """Load the embedding snapshot exported by ingestion next to the vector store.
+
+    The snapshot is cached and reloaded when the corpus version changes, which
+    is noticed within CORPUS_VERSION_CHECK_SECONDS. A snapshot exported from
+    another corpus version is ignored.
+
+    Args:
+        persist_directory (str, optional): The path to the directory for persisting the vector store. Defaults to PERSIST_DIRECTORY.
+
+    Returns:
+        Optional[SnapshotIndex]: The snapshot, or None if there is no up-to-date one.
+    """
+    version = current_corpus_version(persist_directory)
+    cached = _snapshots.get(persist_directory)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    with _load_lock:
+        cached = _snapshots.get(persist_directory)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        snapshot = SnapshotIndex.load(persist_directory)
+        if snapshot is not None and snapshot.corpus_version != version:
+            logger.warning(f"Snapshot in '{persist_directory}' is out of date, searching Chroma until the next ingestion")
+            snapshot = None
+        _snapshots[persist_directory] = (version, snapshot)
+    return snapshot
+
+
+def forget_indexes(persist_directory=PERSIST_DIRECTORY):
+    """Drop the cached BM25 index and snapshot of a directory, e.g. when its collection is closed."""
+    with _load_lock:
+        _bm25_indexes.pop(os.path.join(persist_directory, BM25_INDEX_FILE), None)
+        _snapshots.pop(persist_directory, None)
+
+
+def reciprocal_rank_fusion(result_lists: List[List[Document]], k: int = RRF_K) -> List[Tuple[Document, float]]:
+    """Fuse ranked result lists with reciprocal rank fusion.
+
+    Args:
+        result_lists (List[List[Document]]): Ranked results of each retriever.
+        k (int, optional): RRF constant, higher values flatten the rank weights. Defaults to RRF_K.
+
+    Returns:
+        List[Tuple[Document, float]]: The distinct documents with their fused score, best first.
+    """
+    scores = {}
+    docs = {}
+    for results in result_lists:
+        for rank, doc in enumerate(results):
+            key = doc.id or doc.page_content
+            scores[key] = scores.get(key, 0.0) + 1 / (k + rank + 1)
+            docs.setdefault(key, doc)
+    return sorted(((docs[key], score) for key, score in scores.items()), key=lambda item: item[1], reverse=True)
+
+
+def dense_search_batch(vectorstore: VectorStore, embeddings: List[List[float]], k: int) -> List[List[Document]]:
+    """Run the dense searches of several queries in a single Chroma query.
+
+    Args:
+        vectorstore (VectorStore): The Chroma vector store.
+        embeddings (List[List[float]]): The query embeddings.
+        k (int): Number of documents per query.
+
+    Returns:
+        List[List[Document]]: The ranked documents of each query, with their relevance score in the ``similarity`` metadata.
+    """
+    if not embeddings:
+        return []
+    results = vectorstore._collection.query(  # type: ignore[attr-defined]
+        query_embeddings=embeddings, n_results=k, include=["documents", "metadatas", "distances"]
+    )
+    relevance = vectorstore._select_relevance_score_fn()
+    return [
+        [
+            Document(id=id_, page_content=text, metadata=(metadata or {}) | {"similarity": relevance(distance)})
+            for id_, text, metadata, distance in zip(ids, texts, metadatas, distances)
+        ]
+        for ids, texts, metadatas, distances in zip(results["ids"], results["documents"], results["metadatas"],
+                                                     results["distances"])
+    ]
+
+
+def snapshot_search_batch(snapshot: SnapshotIndex, embeddings: List[List[float]], k: int) -> List[List[Document]]:
+    """Run the dense searches of several queries on an embedding snapshot.
+
+    Returns:
+        List[List[Document]]: The ranked documents of each query, with their cosine similarity in the ``similarity`` metadata.
+    """
+    return [[snapshot.document(row, score) for row, score in rows] for rows in snapshot.search(embeddings, k)]
+
+
+def add_similarities(vectorstore: VectorStore, docs: List[Document], embedding: List[float],
+                     snapshot: Optional[SnapshotIndex] = None) -> List[Document]:
+    """Set the ``similarity`` metadata of documents found by BM25 only, from their stored embeddings.
+
+    Args:
+        vectorstore (VectorStore): The Chroma vector store.
+        docs (List[Document]): The candidate documents.
+        embedding (List[float]): The query embedding.
+        snapshot (SnapshotIndex, optional): Snapshot to read the embeddings from instead of Chroma.
+
+    Returns:
+        List[Document]: The documents, all with a ``similarity`` metadata.
+    """
+    missing = [doc.id for doc in docs if "similarity" not in doc.metadata]
+    if not missing:
+        return docs
+    if snapshot is not None:
+        similarities = snapshot.similarities(missing, embedding)
+    else:
+        stored = vectorstore._collection.get(ids=missing, include=["embeddings"])  # type: ignore[attr-defined]
+        # Collections use cosine space, where the relevance score is the cosine similarity
+        similarities = dict(zip(stored["ids"], cosine_similarities(embedding, stored["embeddings"]).tolist()))
+    return [
+        doc if "similarity" in doc.metadata
+        else Document(id=doc.id, page_content=doc.page_content, metadata=doc.metadata | {"similarity": similarities.get(doc.id, 0.0)})
+        for doc in docs
+    ]
+
+
+class HybridRetriever(BaseRetriever):
+    """Retriever fusing Chroma dense search with the BM25 lexical index, then reranking the candidates.
+
+    ``fetch_k`` candidates are taken from each retriever and fused, scored by
+    the reranker and cut to between RETRIEVAL_MIN_K and ``k`` documents by
+    ``select_passages``. Every returned document carries its relevance score
+    in the ``score`` metadata. Falls back to dense search only when no BM25
+    index was built or ``lexical`` is False.
+
+    With the "snapshot" backend, dense search runs in-process on the
+    memory-mapped snapshot exported by ingestion instead of Chroma.
+    """
+
+    vectorstore: VectorStore
+    persist_directory: str = PERSIST_DIRECTORY
+    k: int = RETRIEVAL_K
+    fetch_k: int = HYBRID_FETCH_K
+    rrf_k: int = RRF_K
+    lexical: bool = True
+    reranker: str = RERANKER
+    backend: str = RETRIEVAL_BACKEND
+
+    def _snapshot(self) -> Optional[SnapshotIndex]:
+        return load_snapshot(self.persist_directory) if self.backend == "snapshot" else None
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        return self.retrieve_by_vector(query, self.vectorstore.embeddings.embed_query(query))
+
+    def retrieve_by_vector(self, query: str, embedding: List[float]) -> List[Document]:
+        """Retrieve the documents of a query whose embedding is already computed."""
+        snapshot = self._snapshot()
+        with observe_stage("vector_search"):
+            if snapshot is not None:
+                dense = snapshot_search_batch(snapshot, [embedding], self.fetch_k)[0]
+            else:
+                results = self.vectorstore.similarity_search_by_vector_with_relevance_scores(  # type: ignore[attr-defined]
+                    embedding, k=self.fetch_k
+                )
+                # Despite the name, Chroma returns distances here
+                relevance = self.vectorstore._select_relevance_score_fn()
+                dense = [
+                    Document(id=doc.id, page_content=doc.page_content, metadata=doc.metadata | {"similarity": relevance(distance)})
+                    for doc, distance in results
+                ]
+        return self._rank(query, embedding, dense, snapshot)
+
+    def _rank(self, query: str, embedding: List[float], dense: List[Document],
+              snapshot: Optional[SnapshotIndex] = None) -> List[Document]:
+        index = load_bm25_index(self.persist_directory) if self.lexical else None
+        candidates = dense
+        if index is not None:
+            with observe_stage("lexical_search"):
+                lexical = index.get_documents(query, k=self.fetch_k)
+            candidates = [
+                Document(id=doc.id, page_content=doc.page_content, metadata=doc.metadata | {"rrf_score": score})
+                for doc, score in reciprocal_rank_fusion([dense, lexical], k=self.rrf_k)
+            ]
+        reranker = get_reranker(self.reranker)
+        if reranker is None:
+            return [
+                Document(id=doc.id, page_content=doc.page_content, metadata=doc.metadata | {"score": doc.metadata.get("similarity")})
+                for doc in candidates[:self.k]
+            ]
+        if any("similarity" not in doc.metadata for doc in candidates):
+            candidates = add_similarities(self.vectorstore, candidates, embedding, snapshot)
+        with observe_stage("rerank"):
+            scores = reranker.score(query, candidates, index)
+        return select_passages(candidates, scores, max_k=self.k)
+
+    def retrieve_batch(self, queries: List[str], embeddings: List[List[float]]) -> List[List[Document]]:
+        """Retrieve the documents of several queries whose embeddings are already computed."""
+        snapshot = self._snapshot()
+        with observe_stage("vector_search"):
+            if snapshot is not None:
+                dense = snapshot_search_batch(snapshot, embeddings, self.fetch_k)
+            else:
+                dense = dense_search_batch(self.vectorstore, embeddings, self.fetch_k)
+        return [
+            self._rank(query, embedding, docs, snapshot) for query, embedding, docs in zip(queries, embeddings, dense)
+        ]
+
+
+def retrieve_batch(retriever: BaseRetriever, vectorstore: VectorStore, queries: List[str],
+                   embeddings: List[List[float]], k: int = RETRIEVAL_K) -> List[List[Document]]:
+    """Retrieve the documents of several queries with the configured retriever.
+
+    Args:
+        retriever (BaseRetriever): The retriever built by ``get_retriever``.
+        vectorstore (VectorStore): The vector store behind it.
+        queries (List[str]): The queries.
+        embeddings (List[List[float]]): The query embeddings, in the same order.
+        k (int, optional): Number of documents per query for dense retrieval. Defaults to RETRIEVAL_K.
+
+    Returns:
+        List[List[Document]]: The documents of each query.
+    """
+    if isinstance(retriever, HybridRetriever):
+        return retriever.retrieve_batch(queries, embeddings)
+    with observe_stage("vector_search"):
+        return dense_search_batch(vectorstore, embeddings, k)
+
+
+def get_retriever(vectordb: VectorStore, mode: str = RETRIEVAL_MODE, k: int = RETRIEVAL_K,
+                  persist_directory: str = PERSIST_DIRECTORY) -> BaseRetriever:
+    """Build the retriever used by the RAG chain.
+
+    Args:
+        vectordb (VectorStore): The vector store.
+        mode (str, optional): "dense" for vector search only, "hybrid" to fuse it with BM25. Both are reranked. Defaults to RETRIEVAL_MODE.
+        k (int, optional): Number of documents to return. Defaults to RETRIEVAL_K.
+        persist_directory (str, optional): The directory holding the collection's BM25 index. Defaults to PERSIST_DIRECTORY.
+
+    Returns:
+        BaseRetriever: The retriever.
+    """
+    return HybridRetriever(vectorstore=vectordb, k=k, persist_directory=persist_directory, lexical=mode == "hybrid")
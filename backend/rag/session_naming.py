@@ -0,0 +1,55 @@
+from utils.utils import get_logger
+from utils.constants import DEFAULT_SESSION_NAME, SESSION_NAMING_MIN_MESSAGES, BACKGROUND_LLM_WORKERS, BACKGROUND_QUEUE_SIZE
+from utils.task_queue import KeyedTaskQueue
+from db.dbo import AsyncSessionLocal
+from db import models
+from rag.rag import create_session_name
+
+from sqlalchemy import select, update
+
+logger = get_logger()
+
+naming_queue = KeyedTaskQueue("session-naming", BACKGROUND_LLM_WORKERS, BACKGROUND_QUEUE_SIZE)
+
+
+def needs_name(session: models.Session, message_count: int) -> bool:
+    """Whether a session still has the default name and enough messages to be named."""
+    return session.name in (DEFAULT_SESSION_NAME, "") and message_count >= SESSION_NAMING_MIN_MESSAGES
+
+
+async def name_session(session_id: str):
+    """Generate a name for a session from its first messages and save it.
+
+    Runs in its own database session, after the chat response was sent. The
+    name is only written if the session still has the default name, so a
+    rename done in the meantime is kept.
+
+    Args:
+        session_id (str): The session ID.
+    """
+    async with AsyncSessionLocal() as db:
+        stmt = (
+            select(models.Message)
+            .where(models.Message.session_id == session_id)
+            .order_by(models.Message.created_at, models.Message.id)
+            .limit(6)
+        )
+        messages = (await db.execute(stmt)).scalars().all()
+        if not messages:
+            return
+        name = (await create_session_name(messages))[:128]
+        if not name:
+            return
+        result = await db.execute(
+            update(models.Session)
+            .where(models.Session.id == session_id, models.Session.name.in_((DEFAULT_SESSION_NAME, "")))
+            .values(name=name)
+        )
+        await db.commit()
+        if result.rowcount:
+            logger.info(f"Named session {session_id}: {name}")
+
+
+def schedule_session_naming(session_id: str) -> bool:
+    """Name a session in the background; requests for a session already being named are merged."""
+    return naming_queue.submit(session_id, lambda: name_session(session_id))
@@ -0,0 +1,242 @@
+from utils.constants import (SNAPSHOT_FOLDER, SNAPSHOT_DTYPE, SNAPSHOT_EXACT_RERANK, SNAPSHOT_RERANK_FACTOR,
+                             SNAPSHOT_BLOCK_ROWS, SNAPSHOT_EXPORT_BATCH)
+
+from typing import List, Optional, Tuple
+import json
+import os
+import shutil
+
+import numpy as np
+from langchain_core.documents import Document
+
+# Name of the file holding the folder name of the current snapshot
+CURRENT_FILE = "current"
+# Queries scored together, bounds the (queries x chunks) score matrix of large batches
+QUERY_BLOCK = 64
+
+
+def write_strings(path: str, strings: List[str]):
+    """Write UTF-8 strings back to back in ``path``.bin with their byte offsets in ``path``_offsets.npy."""
+    offsets = np.zeros(len(strings) + 1, dtype=np.int64)
+    with open(path + ".bin", "wb") as f:
+        for i, text in enumerate(strings):
+            data = text.encode("utf-8")
+            f.write(data)
+            offsets[i + 1] = offsets[i] + len(data)
+    np.save(path + "_offsets.npy", offsets)
+
+
+class StringTable:
+    """Memory-mapped strings written by ``write_strings``."""
+
+    def __init__(self, path: str):
+        self.offsets = np.load(path + "_offsets.npy", mmap_mode="r")
+        # np.memmap cannot map an empty file
+        self.data = np.memmap(path + ".bin", dtype=np.uint8, mode="r") if self.offsets[-1] else np.zeros(0, np.uint8)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> str:
+        return self.data[self.offsets[i]:self.offsets[i + 1]].tobytes().decode("utf-8")
+
+
+def quantize(vectors: np.ndarray, dtype: str = SNAPSHOT_DTYPE) -> Tuple[np.ndarray, np.ndarray]:
+    """Quantize normalized vectors.
+
+    Args:
+        vectors (np.ndarray): Float32 vectors, one per row.
+        dtype (str, optional): "int8" (symmetric, one scale per row) or "float16". Defaults to SNAPSHOT_DTYPE.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: The quantized vectors and the per-row scales (all 1 for float16).
+    """
+    if dtype == "float16":
+        return vectors.astype(np.float16), np.ones(len(vectors), dtype=np.float32)
+    scales = np.abs(vectors).max(axis=1) / 127
+    scales[scales == 0] = 1.0
+    return np.round(vectors / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class SnapshotIndex:
+    """Read-only, memory-mapped copy of a collection for in-process dense search.
+
+    Holds the normalized embeddings quantized to int8 or float16, optionally
+    the float32 embeddings to rescore the best candidates exactly, and the
+    chunk IDs, texts and metadata as UTF-8 blobs with offsets. Every file is
+    memory-mapped, so worker processes share the same pages and only the
+    rows that are touched are read from disk.
+
+    Use ``SnapshotIndex.export`` at the end of ingestion and ``load`` to open it.
+
+    Args:
+        path (str): The snapshot folder.
+    """
+
+    def __init__(self, path: str):
+        with open(os.path.join(path, "manifest.json")) as f:
+            self.manifest = json.load(f)
+        self.path = path
+        self.corpus_version = self.manifest["corpus_version"]
+        self.vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+        self.scales = np.load(os.path.join(path, "scales.npy"), mmap_mode="r")
+        exact = os.path.join(path, "vectors_f32.npy")
+        self.exact = np.load(exact, mmap_mode="r") if os.path.exists(exact) else None
+        self.ids = StringTable(os.path.join(path, "ids"))
+        self.texts = StringTable(os.path.join(path, "texts"))
+        self.metadatas = StringTable(os.path.join(path, "metadatas"))
+        self._rows: Optional[dict] = None
+
+    def __len__(self):
+        return len(self.vectors)
+
+    @classmethod
+    def export(cls, vs, directory: str, corpus_version: Optional[str], dtype: str = SNAPSHOT_DTYPE,
+               exact: bool = SNAPSHOT_EXACT_RERANK, batch_size: int = SNAPSHOT_EXPORT_BATCH) -> str:
+        """Write a snapshot of a Chroma collection and make it the current one.
+
+        Chunks are read from Chroma in batches, so the corpus is never held in
+        memory as float32 as a whole. Older snapshots are deleted; processes
+        still mapping them keep their pages until they reload.
+
+        Args:
+            vs (Chroma): The vector store.
+            directory (str): The collection directory, the snapshot goes to its SNAPSHOT_FOLDER.
+            corpus_version (str, optional): Corpus version the snapshot is built from.
+            dtype (str, optional): "int8" or "float16". Defaults to SNAPSHOT_DTYPE.
+            exact (bool, optional): Also store float32 vectors for exact rescoring. Defaults to SNAPSHOT_EXACT_RERANK.
+            batch_size (int, optional): Chunks read from Chroma at a time. Defaults to SNAPSHOT_EXPORT_BATCH.
+
+        Returns:
+            str: The snapshot folder.
+        """
+        root = os.path.join(directory, SNAPSHOT_FOLDER)
+        name = corpus_version or "unversioned"
+        path = os.path.join(root, name)
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path)
+        count = vs._collection.count()
+        ids, texts, metadatas = [], [], []
+        vectors = scales = full = None
+        for offset in range(0, count, batch_size):
+            batch = vs._collection.get(limit=batch_size, offset=offset, include=["embeddings", "documents", "metadatas"])
+            embeddings = normalize(np.asarray(batch["embeddings"], dtype=np.float32))
+            if vectors is None:
+                # Created once the dimension is known
+                vector_dtype = np.float16 if dtype == "float16" else np.int8
+                vectors = np.lib.format.open_memmap(os.path.join(path, "vectors.npy"), "w+", vector_dtype, (count, embeddings.shape[1]))
+                scales = np.lib.format.open_memmap(os.path.join(path, "scales.npy"), "w+", np.float32, (count,))
+                if exact:
+                    full = np.lib.format.open_memmap(os.path.join(path, "vectors_f32.npy"), "w+", np.float32, (count, embeddings.shape[1]))
+            end = offset + len(embeddings)
+            vectors[offset:end], scales[offset:end] = quantize(embeddings, dtype)
+            if full is not None:
+                full[offset:end] = embeddings
+            ids.extend(batch["ids"])
+            texts.extend(batch["documents"])
+            metadatas.extend(json.dumps(m or {}) for m in batch["metadatas"])
+        for array in (vectors, scales, full):
+            if array is not None:
+                array.flush()
+        if vectors is None:
+            np.save(os.path.join(path, "vectors.npy"), np.zeros((0, 0), dtype=np.int8))
+            np.save(os.path.join(path, "scales.npy"), np.zeros(0, dtype=np.float32))
+        write_strings(os.path.join(path, "ids"), ids)
+        write_strings(os.path.join(path, "texts"), texts)
+        write_strings(os.path.join(path, "metadatas"), metadatas)
+        with open(os.path.join(path, "manifest.json"), "w") as f:
+            json.dump({"corpus_version": corpus_version, "dtype": dtype, "count": len(ids)}, f)
+        with open(os.path.join(root, CURRENT_FILE + ".tmp"), "w") as f:
+            f.write(name)
+        os.replace(os.path.join(root, CURRENT_FILE + ".tmp"), os.path.join(root, CURRENT_FILE))
+        for old in os.listdir(root):
+            if old not in (name, CURRENT_FILE) and os.path.isdir(os.path.join(root, old)):
+                shutil.rmtree(os.path.join(root, old), ignore_errors=True)
+        return path
+
+    @classmethod
+    def load(cls, directory: str) -> Optional["SnapshotIndex"]:
+        """Open the current snapshot of a collection directory, or return None if there is none."""
+        root = os.path.join(directory, SNAPSHOT_FOLDER)
+        try:
+            with open(os.path.join(root, CURRENT_FILE)) as f:
+                name = f.read().strip()
+        except FileNotFoundError:
+            return None
+        return cls(os.path.join(root, name))
+
+    def scores(self, queries: np.ndarray, block_rows: int = SNAPSHOT_BLOCK_ROWS) -> np.ndarray:
+        """Approximate cosine similarities of normalized queries to every chunk, one row per query.
+
+        The quantized vectors are converted to float32 a block of rows at a
+        time, so the temporary memory stays bounded whatever the corpus size.
+        """
+        result = np.empty((len(queries), len(self)), dtype=np.float32)
+        for start in range(0, len(self), block_rows):
+            block = np.asarray(self.vectors[start:start + block_rows], dtype=np.float32)
+            result[:, start:start + len(block)] = (queries @ block.T) * self.scales[start:start + len(block)]
+        return result
+
+    def search(self, embeddings: List[List[float]], k: int,
+               rerank_factor: int = SNAPSHOT_RERANK_FACTOR) -> List[List[Tuple[int, float]]]:
+        """Find the k most similar chunks of each query.
+
+        Candidates are selected on the quantized vectors with ``argpartition``
+        and, when the float32 vectors were exported, ``k * rerank_factor`` of
+        them are rescored at full precision.
+
+        Args:
+            embeddings (List[List[float]]): The query embeddings.
+            k (int): Number of chunks per query.
+            rerank_factor (int, optional): Candidates rescored exactly per result. Defaults to SNAPSHOT_RERANK_FACTOR.
+
+        Returns:
+            List[List[Tuple[int, float]]]: The (row, cosine similarity) pairs of each query, best first.
+        """
+        if not embeddings or len(self) == 0:
+            return [[] for _ in embeddings]
+        queries = normalize(np.asarray(embeddings, dtype=np.float32))
+        fetch = min(len(self), k * rerank_factor if self.exact is not None else k)
+        results = []
+        for start in range(0, len(queries), QUERY_BLOCK):
+            block = queries[start:start + QUERY_BLOCK]
+            results.extend(self._top_k(query, row_scores, k, fetch) for query, row_scores in zip(block, self.scores(block)))
+        return results
+
+    def _top_k(self, query: np.ndarray, row_scores: np.ndarray, k: int, fetch: int) -> List[Tuple[int, float]]:
+        candidates = np.argpartition(-row_scores, fetch - 1)[:fetch]
+        if self.exact is not None:
+            # Sorted rows read the memory map in file order
+            candidates = np.sort(candidates)
+            candidate_scores = np.asarray(self.exact[candidates]) @ query
+        else:
+            candidate_scores = row_scores[candidates]
+        best = np.argsort(-candidate_scores, kind="stable")[:k]
+        return [(int(candidates[i]), float(candidate_scores[i])) for i in best]
+
+    def document(self, row: int, similarity: Optional[float] = None) -> Document:
+        """Build the Document of a row, with its similarity in the ``similarity`` metadata when given."""
+        metadata = json.loads(self.metadatas[row])
+        if similarity is not None:
+            metadata["similarity"] = similarity
+        return Document(id=self.ids[row], page_content=self.texts[row], metadata=metadata)
+
+    def similarities(self, ids: List[str], embedding: List[float]) -> dict:
+        """Cosine similarity of a query to the chunks with the given IDs, for the IDs found in the snapshot."""
+        if self._rows is None:
+            self._rows = {self.ids[i]: i for i in range(len(self))}
+        rows = [self._rows[id_] for id_ in ids if id_ in self._rows]
+        if not rows:
+            return {}
+        query = normalize(np.asarray(embedding, dtype=np.float32))
+        vectors = self.exact if self.exact is not None else self.vectors
+        scores = np.asarray(vectors[rows], dtype=np.float32) @ query
+        if self.exact is None:
+            scores *= self.scales[rows]
+        return {self.ids[row]: float(score) for row, score in zip(rows, scores)}
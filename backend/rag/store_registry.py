@@ -0,0 +1,188 @@
+from utils.constants import (PERSIST_DIRECTORY, CHROMA_COLLECTION, VECTOR_STORE_MAX_OPEN, VECTOR_STORE_MEMORY_MB,
+                             VECTOR_STORE_BYTES_PER_CHUNK, ANSWER_CACHE_SIZE, ANSWER_CACHE_THRESHOLD)
+from utils.utils import get_logger
+from db.dbo import collection_directory, get_vector_store, list_collections
+from rag.answer_cache import AnswerCache
+
+from collections import OrderedDict
+from typing import TYPE_CHECKING, List, Optional
+import threading
+
+if TYPE_CHECKING:
+    from langchain_core.retrievers import BaseRetriever
+    from langchain_core.vectorstores import VectorStore
+
+logger = get_logger()
+
+
+class UnknownCollectionError(KeyError):
+    """Raised when a collection that was never ingested is requested."""
+
+
+class StoreHandle:
+    """An open collection with the retriever and answer cache built on it.
+
+    Args:
+        collection (str): The collection name.
+        directory (str): The directory holding the collection's manifest, BM25 index and corpus version.
+        vectorstore (VectorStore): The vector store.
+        retriever (BaseRetriever): The retriever over the vector store.
+        chunks (int): Number of chunks in the collection when it was opened.
+    """
+
+    def __init__(self, collection: str, directory: str, vectorstore: "VectorStore", retriever: "BaseRetriever",
+                 chunks: int):
+        self.collection = collection
+        self.directory = directory
+        self.vectorstore = vectorstore
+        self.retriever = retriever
+        self.chunks = chunks
+        self.answer_cache = AnswerCache(threshold=ANSWER_CACHE_THRESHOLD, max_size=ANSWER_CACHE_SIZE)
+
+    @property
+    def memory_bytes(self) -> int:
+        """Estimated memory held by the open collection."""
+        return self.chunks * VECTOR_STORE_BYTES_PER_CHUNK
+
+
+class VectorStoreRegistry:
+    """Vector stores of several collections, opened on first use and closed least recently used first.
+
+    Every collection lives in the same Chroma directory, so they share one
+    Chroma instance, embedding model and process. A collection is closed once
+    more than ``max_open`` are open or their estimated memory exceeds
+    ``memory_limit_bytes``; the most recently used one always stays open.
+
+    Closing a collection frees its retriever, BM25 index, snapshot and answer
+    cache. The HNSW indexes belong to the shared Chroma client, whose own
+    segment cache is limited to VECTOR_STORE_MEMORY_MB (see
+    ``get_chroma_settings``); with Chroma's Rust backend that limit is not
+    applied, so the memory cap is advisory for the vectors themselves.
+
+    Args:
+        persist_directory (str, optional): The Chroma persistence directory. Defaults to PERSIST_DIRECTORY.
+        max_open (int, optional): Maximum number of open collections. Defaults to VECTOR_STORE_MAX_OPEN.
+        memory_limit_bytes (int, optional): Estimated memory of the open collections before one is closed. Defaults to VECTOR_STORE_MEMORY_MB.
+    """
+
+    def __init__(self, persist_directory: str = PERSIST_DIRECTORY, max_open: int = VECTOR_STORE_MAX_OPEN,
+                 memory_limit_bytes: int = VECTOR_STORE_MEMORY_MB * 1024 * 1024):
+        self.persist_directory = persist_directory
+        self.max_open = max_open
+        self.memory_limit_bytes = memory_limit_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Answer cache lookups of the closed collections, so the totals never go down
+        self._closed_answer_hits = 0
+        self._closed_answer_misses = 0
+        self._handles: OrderedDict[str, StoreHandle] = OrderedDict()
+        self._lock = threading.Lock()
+        # One lock per collection being opened, so opening one does not block lookups of the others
+        self._open_locks: dict[str, threading.Lock] = {}
+
+    def get(self, collection: str = CHROMA_COLLECTION) -> StoreHandle:
+        """Get an open collection, opening it if needed.
+
+        Args:
+            collection (str, optional): The collection name. Defaults to CHROMA_COLLECTION.
+
+        Raises:
+            UnknownCollectionError: If the collection does not exist. The default collection is always opened.
+
+        Returns:
+            StoreHandle: The open collection.
+        """
+        with self._lock:
+            handle = self._lookup(collection)
+            if handle is not None:
+                self.hits += 1
+                return handle
+            open_lock = self._open_locks.setdefault(collection, threading.Lock())
+        with open_lock:
+            with self._lock:
+                # Another thread may have opened it while we waited
+                handle = self._lookup(collection)
+                if handle is not None:
+                    self.hits += 1
+                    return handle
+                self.misses += 1
+            try:
+                handle = self._open(collection)
+                with self._lock:
+                    # Stored before the open lock goes, so a thread arriving now finds it
+                    self._handles[collection] = handle
+                    self._evict()
+            finally:
+                with self._lock:
+                    self._open_locks.pop(collection, None)
+        return handle
+
+    def _lookup(self, collection: str):
+        handle = self._handles.get(collection)
+        if handle is not None:
+            self._handles.move_to_end(collection)
+        return handle
+
+    def _open(self, collection: str) -> StoreHandle:
+        from rag.retrievers import get_retriever
+
+        if collection != CHROMA_COLLECTION and collection not in list_collections(self.persist_directory):
+            raise UnknownCollectionError(collection)
+        directory = collection_directory(collection, self.persist_directory)
+        vectorstore = get_vector_store(self.persist_directory, collection)
+        retriever = get_retriever(vectorstore, persist_directory=directory)
+        chunks = vectorstore._collection.count()  # type: ignore[attr-defined]
+        return StoreHandle(collection, directory, vectorstore, retriever, chunks)
+
+    def _evict(self):
+        from rag.retrievers import forget_indexes
+
+        while len(self._handles) > 1 and (
+            len(self._handles) > self.max_open or self.memory_bytes() > self.memory_limit_bytes
+        ):
+            collection, handle = self._handles.popitem(last=False)
+            self._closed_answer_hits += handle.answer_cache.hits
+            self._closed_answer_misses += handle.answer_cache.misses
+            forget_indexes(handle.directory)
+            self.evictions += 1
+            logger.info(f"Closed collection '{collection}' ({handle.chunks} chunks), least recently used")
+
+    def memory_bytes(self) -> int:
+        """Estimated memory held by the open collections."""
+        return sum(handle.memory_bytes for handle in list(self._handles.values()))
+
+    def peek(self, collection: str) -> Optional[StoreHandle]:
+        """Get a collection if it is open, without opening it or marking it as used."""
+        with self._lock:
+            return self._handles.get(collection)
+
+    def handles(self) -> List[StoreHandle]:
+        """The open collections, least recently used first."""
+        with self._lock:
+            return list(self._handles.values())
+
+    def answer_cache_stats(self) -> dict:
+        """Combined stats of the answer caches, the hits and misses of closed collections included."""
+        with self._lock:
+            stats = [handle.answer_cache.stats() for handle in self._handles.values()]
+            hits = self._closed_answer_hits + sum(s["hits"] for s in stats)
+            misses = self._closed_answer_misses + sum(s["misses"] for s in stats)
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+            "size": sum(s["size"] for s in stats),
+        }
+
+    def stats(self) -> dict:
+        """Return the hit/miss counters and the number of open collections."""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "size": len(self._handles),
+            "evictions": self.evictions,
+            "memory_bytes": self.memory_bytes(),
+        }
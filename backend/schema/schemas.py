@@ -2,6 +2,8 @@ from typing import Optional, List
 from pydantic import BaseModel
 from pydantic import Field
 
+from utils.constants import BATCH_MAX_QUESTIONS, COLLECTION_NAME_PATTERN
+
 
 class MessageIn(BaseModel):
     role: str
@@ -16,6 +18,9 @@ class MessageOut(MessageIn):
 class SessionCreate(BaseModel):
     user_id: str
     name: Optional[str] = "New Session"
+    # Vector store collection searched by the session, the default collection when not set.
+    # Any other collection needs the user to be granted access (data_ingest --grant).
+    collection: Optional[str] = Field(None, pattern=COLLECTION_NAME_PATTERN)
 
 
 # class SessionUpdate(BaseModel):
@@ -29,12 +34,26 @@ class SessionOut(BaseModel):
     name: str
     user_id: str
     name: str
+    # None when the session searches the default collection
+    collection: Optional[str] = None
 
 
 class ChatRequest(BaseModel):
     user_id: str
     session_id: str
     query: str
+    # Overrides the session's collection for this question, the user needs access to it
+    collection: Optional[str] = Field(None, pattern=COLLECTION_NAME_PATTERN)
+
+
+class BatchChatRequest(BaseModel):
+    user_id: str
+    queries: List[str] = Field(..., min_length=1, max_length=BATCH_MAX_QUESTIONS)
+    # Optional session the answered questions are saved to
+    session_id: Optional[str] = None
+    # Collection searched, defaults to the session's collection or the default collection.
+    # The user needs access to it.
+    collection: Optional[str] = Field(None, pattern=COLLECTION_NAME_PATTERN)
 
 
 class SourceItem(BaseModel):
@@ -51,9 +70,19 @@ class ChatResponse(BaseModel):
     session_id: str
 
 
+class BatchChatResult(BaseModel):
+    index: int = Field(..., description="Position of the question in the request's queries")
+    query: str
+    answer: Optional[str] = None
+    sources: List[SourceItem] = []
+    error: Optional[str] = None
+
+
 class HistoryOut(BaseModel):
     session_id: str
     messages: List[MessageOut]
+    # Pass as `before` to fetch the previous page, None when there are no older messages
+    next_cursor: Optional[str] = None
 
 
 class UserOut(BaseModel):
@@ -0,0 +1,59 @@
+import math
+
+from rag.answer_cache import AnswerCache
+
+
+def unit(angle_degrees):
+    """2-D embedding whose cosine similarity to (1, 0) is cos(angle)."""
+    angle = math.radians(angle_degrees)
+    return [math.cos(angle), math.sin(angle)]
+
+
+def test_close_questions_hit_and_far_ones_miss():
+    cache = AnswerCache(threshold=0.97)
+    cache.add([2.0, 0.0], "Delhi", [{"source": "report.pdf"}], "v1")
+    # cos(10°) = 0.985, cos(20°) = 0.940
+    assert cache.lookup(unit(10), "v1") == ("Delhi", [{"source": "report.pdf"}])
+    assert cache.lookup(unit(20), "v1") is None
+    assert cache.stats() == {"hits": 1, "misses": 1, "hit_rate": 0.5, "size": 1}
+
+
+def test_the_nearest_question_answers():
+    cache = AnswerCache(threshold=0.9)
+    cache.add(unit(0), "first", [], "v1")
+    cache.add(unit(15), "second", [], "v1")
+    assert cache.lookup(unit(12), "v1")[0] == "second"
+    assert cache.lookup(unit(3), "v1")[0] == "first"
+
+
+def test_returned_sources_are_copies():
+    cache = AnswerCache()
+    cache.add(unit(0), "answer", [{"page": 1}], "v1")
+    cache.lookup(unit(0), "v1")[1][0]["page"] = 2
+    assert cache.lookup(unit(0), "v1")[1] == [{"page": 1}]
+
+
+def test_a_new_corpus_version_drops_the_cache():
+    cache = AnswerCache()
+    cache.add(unit(0), "old answer", [], "v1")
+    assert cache.lookup(unit(0), "v2") is None
+    assert cache.stats()["size"] == 0
+    # Going back does not bring the old answers back either
+    assert cache.lookup(unit(0), "v1") is None
+    cache.add(unit(0), "new answer", [], "v1")
+    assert cache.lookup(unit(0), "v1")[0] == "new answer"
+
+
+def test_the_oldest_answer_is_overwritten_when_full():
+    cache = AnswerCache(threshold=0.99, max_size=2)
+    for i, angle in enumerate([0, 30, 60]):
+        cache.add(unit(angle), f"a{i}", [], "v1")
+    assert cache.lookup(unit(0), "v1") is None
+    assert [cache.lookup(unit(angle), "v1")[0] for angle in [30, 60]] == ["a1", "a2"]
+    assert cache.stats()["size"] == 2
+
+
+def test_a_zero_size_cache_stores_nothing():
+    cache = AnswerCache(max_size=0)
+    cache.add(unit(0), "answer", [], "v1")
+    assert cache.lookup(unit(0), "v1") is None
@@ -0,0 +1,65 @@
+import math
+
+import pytest
+
+from rag.bm25 import BM25Index, tokenize
+
+CORPUS = [
+    "Ozone levels rise in summer afternoons.",
+    "PM2.5 and PM10 come from traffic and heating.",
+    "PM2.5 exposure: PM2.5 is the most harmful pollutant.",
+    "NO2 is emitted by diesel traffic.",
+]
+
+
+def build():
+    return BM25Index.build([f"c{i}" for i in range(len(CORPUS))], CORPUS, [{"page": i} for i in range(len(CORPUS))])
+
+
+def test_tokenize_keeps_pollutant_names_and_drops_stopwords():
+    assert tokenize("The PM2.5 and NO2/NOx levels of the city") == ["pm2.5", "no2/nox", "levels", "city"]
+
+
+def test_score_matches_the_bm25_formula():
+    index = build()
+    # "pm2.5" is in chunks 1 (once, 6 terms) and 2 (twice, 6 terms)
+    avgdl = sum(index.doc_len) / len(CORPUS)
+    idf = math.log(1 + (4 - 2 + 0.5) / (2 + 0.5))
+
+    def expected(tf, dl):
+        return idf * tf * 2.5 / (tf + 1.5 * (1 - 0.75 + 0.75 * dl / avgdl))
+
+    results = index.search("pm2.5", k=4)
+    assert [i for i, _ in results] == [2, 1]
+    assert results[0][1] == pytest.approx(expected(2, index.doc_len[2]))
+    assert results[1][1] == pytest.approx(expected(1, index.doc_len[1]))
+
+
+def test_rare_terms_weigh_more_than_common_ones():
+    index = build()
+    assert index.idf("diesel") > index.idf("traffic") > 0
+    assert index.idf("unknown") == 0.0
+    # Both mention traffic, only chunk 3 mentions diesel
+    assert [i for i, _ in index.search("diesel traffic", k=4)] == [3, 1]
+
+
+def test_search_cuts_to_k_and_ignores_unknown_terms():
+    index = build()
+    assert len(index.search("pm2.5 ozone no2", k=2)) == 2
+    assert index.search("sulfur", k=4) == []
+
+
+def test_get_documents_carries_the_id_metadata_and_score():
+    doc = build().get_documents("ozone", k=1)[0]
+    assert doc.id == "c0"
+    assert doc.page_content == CORPUS[0]
+    assert doc.metadata["page"] == 0 and doc.metadata["bm25_score"] > 0
+
+
+def test_saved_index_searches_the_same(tmp_path):
+    index = build()
+    path = str(tmp_path / "bm25.json")
+    index.save(path)
+    loaded = BM25Index.load(path)
+    for query in ["pm2.5", "diesel traffic", "ozone summer"]:
+        assert loaded.search(query) == index.search(query)
@@ -0,0 +1,105 @@
+import asyncio
+import json
+
+from langchain_core.documents import Document
+from langchain_core.messages import AIMessageChunk
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+import fast_api_app.router.chat as chat
+import rag.rag as rag
+from db import models
+from db.dbo import Base
+from schema import schemas
+
+
+class FakeLLM:
+    """Chat model streaming a fixed answer, or failing after its first token."""
+
+    def __init__(self, tokens, fail=False):
+        self.tokens = tokens
+        self.fail = fail
+
+    async def astream(self, messages):
+        for token in self.tokens:
+            yield AIMessageChunk(content=token)
+            if self.fail:
+                raise RuntimeError("Ollama went away")
+
+
+def parse_sse(frame):
+    event, data = frame.strip().split("\n")
+    return event.removeprefix("event: "), json.loads(data.removeprefix("data: "))
+
+
+def stream_chat(monkeypatch, tmp_path, llm):
+    """Ask a question through ``/chat/stream`` and return its events and the messages saved after each one."""
+    async def main():
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'chat.db'}")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        session_factory = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+        monkeypatch.setattr(chat, "AsyncSessionLocal", session_factory)
+        monkeypatch.setattr(chat, "schedule_session_naming", lambda session_id: None)
+
+        async def open_collection(collection):
+            pass
+
+        async def retrieve(question, collection, embedding=None):
+            return [Document(page_content="PM2.5 in Delhi was 180.", metadata={"source": "report.pdf", "page": 3})]
+
+        async def lookup_answer_cache(question, history, collection):
+            return None, None, None
+
+        monkeypatch.setattr(chat, "open_collection", open_collection)
+        monkeypatch.setattr(rag, "retrieve", retrieve)
+        monkeypatch.setattr(rag, "lookup_answer_cache", lookup_answer_cache)
+        monkeypatch.setattr(rag.llm_gateway, "llm_factory", lambda: llm)
+
+        async def saved():
+            async with session_factory() as db:
+                return await db.scalar(select(func.count()).select_from(models.Message))
+
+        async with session_factory() as db:
+            db.add(models.User(id="u1", email="user@example.com", username="user"))
+            db.add(models.Session(id="s1", user_id="u1"))
+            await db.commit()
+            payload = schemas.ChatRequest(user_id="u1", session_id="s1", query="How bad was Delhi?")
+            response = await chat.chat_stream(payload, db)
+        events = []
+        async for frame in response.body_iterator:
+            events.append((*parse_sse(frame), await saved()))
+        async with session_factory() as db:
+            stmt = select(models.Message.role, models.Message.content).order_by(models.Message.created_at)
+            messages = (await db.execute(stmt)).all()
+        await engine.dispose()
+        return events, messages
+
+    return asyncio.run(main())
+
+
+def test_stream_sends_sources_then_tokens_then_done(monkeypatch, tmp_path):
+    events, _ = stream_chat(monkeypatch, tmp_path, FakeLLM(["It ", "was ", "180."]))
+    assert [(event, data) for event, data, _ in events] == [
+        ("sources", [{"source": "report.pdf", "page": 3, "score": None}]),
+        ("token", "It "),
+        ("token", "was "),
+        ("token", "180."),
+        ("done", {"session_id": "s1"}),
+    ]
+
+
+def test_turn_is_saved_once_the_answer_is_complete(monkeypatch, tmp_path):
+    events, messages = stream_chat(monkeypatch, tmp_path, FakeLLM(["It ", "was ", "180."]))
+    # Nothing is saved while tokens are streamed, the turn is there when "done" arrives
+    assert [count for event, _, count in events if event != "done"] == [0, 0, 0, 0]
+    assert events[-1][2] == 2
+    assert messages == [(models.RoleEnum.user, "How bad was Delhi?"), (models.RoleEnum.assistant, "It was 180.")]
+
+
+def test_failed_generation_sends_an_error_and_saves_nothing(monkeypatch, tmp_path):
+    events, messages = stream_chat(monkeypatch, tmp_path, FakeLLM(["It ", "was "], fail=True))
+    assert [event for event, _, _ in events] == ["sources", "token", "error"]
+    assert events[-1][1] == {"detail": "Ollama went away"}
+    assert messages == []
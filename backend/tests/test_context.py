@@ -0,0 +1,84 @@
+from langchain_core.documents import Document
+
+from rag.context import estimate_tokens, merge_pair, merge_texts, pack_context, remove_near_duplicates
+from utils.constants import CONTEXT_MIN_TRUNCATE_TOKENS
+
+HEADER = "| City | PM2.5 |\n| --- | --- |\n"
+
+
+def table_group(rows, row_start, table_index=0, page=1):
+    return Document(
+        page_content=HEADER + "".join(f"| {city} | {value} |\n" for city, value in rows),
+        metadata={"source": "report.pdf", "page": page, "type": "table", "table_index": table_index,
+                  "row_start": row_start, "row_end": row_start + len(rows) - 1},
+    )
+
+
+def test_consecutive_groups_of_a_table_are_merged():
+    merged = merge_pair(table_group([("Delhi", 180)], 1), table_group([("Pune", 60)], 2))
+    assert merged.page_content == HEADER + "| Delhi | 180 |\n| Pune | 60 |\n"
+    assert (merged.metadata["row_start"], merged.metadata["row_end"]) == (1, 2)
+
+
+def test_groups_of_different_tables_on_a_page_are_not_merged():
+    # Same header and contiguous row numbers, but two tables of the page
+    assert merge_pair(table_group([("Delhi", 180)], 1, table_index=0),
+                      table_group([("Pune", 60)], 2, table_index=1)) is None
+
+
+def test_groups_without_table_index_are_not_merged():
+    a, b = table_group([("Delhi", 180)], 1), table_group([("Pune", 60)], 2)
+    del a.metadata["table_index"], b.metadata["table_index"]
+    assert merge_pair(a, b) is None
+
+
+def text_of_tokens(tokens, word="pm25"):
+    """Text of length 4 * tokens - 1, which estimate_tokens counts as exactly ``tokens``."""
+    text = " ".join([word] * tokens)[:4 * tokens - 1]
+    assert estimate_tokens(text) == tokens
+    return text
+
+
+def test_overlapping_chunks_are_joined_in_either_order():
+    a = "Delhi had severe AQI in November, mostly from crop burning."
+    b = "mostly from crop burning. Winds cleared the air in December."
+    joined = "Delhi had severe AQI in November, mostly from crop burning. Winds cleared the air in December."
+    assert merge_texts(a, b) == joined
+    assert merge_texts(b, a) == joined
+    assert merge_texts(a, "severe AQI in November") == a
+
+
+def test_short_overlaps_are_not_merged():
+    assert merge_texts("PM2.5 levels rose in the city.", "the city. Ozone fell.") is None
+
+
+def test_near_duplicates_of_a_better_passage_are_dropped():
+    words = [f"w{i}" for i in range(60)]
+    best = Document(id="best", page_content=" ".join(words))
+    copy = Document(id="copy", page_content=" ".join(words[:30] + ["changed"] + words[31:]))
+    other = Document(id="other", page_content=" ".join(reversed(words)))
+    assert [d.id for d in remove_near_duplicates([best, copy, other])] == ["best", "other"]
+    assert [d.id for d in remove_near_duplicates([copy, best])] == ["copy"]
+
+
+def test_documents_filling_the_budget_exactly_are_kept_whole():
+    docs = [Document(id="a", page_content=text_of_tokens(10)), Document(id="b", page_content=text_of_tokens(20)),
+            Document(id="c", page_content="x")]
+    packed = pack_context(docs, budget=30)
+    assert [d.page_content for d in packed] == [docs[0].page_content, docs[1].page_content]
+    assert [d.id for d in pack_context(docs, budget=29)] == ["a", "c"]
+
+
+def test_a_passage_larger_than_the_budget_is_cut_to_fit():
+    long = Document(id="table", page_content=text_of_tokens(1000), metadata={"type": "table"})
+    for budget in [100, 333, 500]:
+        packed = pack_context([long, Document(id="small", page_content="x")], budget=budget)
+        assert [d.id for d in packed] == ["table"]
+        assert packed[0].metadata == {"type": "table", "truncated": True}
+        assert packed[0].page_content.endswith(" ...")
+        assert estimate_tokens(packed[0].page_content) <= budget
+
+
+def test_a_passage_is_skipped_when_too_little_budget_is_left_to_cut_it():
+    long = Document(id="long", page_content=text_of_tokens(1000))
+    assert pack_context([long], budget=CONTEXT_MIN_TRUNCATE_TOKENS - 1) == []
@@ -0,0 +1,226 @@
+import hashlib
+import os
+
+import pypdf
+import pytest
+from langchain_core.documents import Document
+
+from data_ingestion.data_ingest import (assign_chunk_ids, embed_and_store, iter_pdf_pages, markdown_row,
+                                        plan_extraction_tasks, plan_incremental_ingest, split_table, split_table_data)
+from utils.constants import CHUNKER_VERSION
+
+HEADER = ["City", "Year", "PM2.5"]
+
+
+def table(rows, prefix="row"):
+    return [HEADER] + [[f"{prefix}{i}", "2020", str(i)] for i in range(1, rows + 1)]
+
+
+def test_every_row_group_repeats_the_header():
+    header = markdown_row(HEADER) + markdown_row(["---"] * len(HEADER))
+    chunks = split_table(table(40), chunk_size=200)
+    assert len(chunks) > 1
+    for text, _, _ in chunks:
+        assert text.startswith(header)
+
+
+def test_row_groups_respect_the_size_limit_and_cover_every_row_once():
+    chunks = split_table(table(40), chunk_size=200)
+    assert all(len(text) <= 200 for text, _, _ in chunks)
+    covered = [row for _, start, end in chunks for row in range(start, end + 1)]
+    assert covered == list(range(1, 41))
+    rows = [line for text, _, _ in chunks for line in text.splitlines()[2:]]
+    assert rows == [markdown_row(row).rstrip("\n") for row in table(40)[1:]]
+
+
+def test_a_row_longer_than_the_limit_gets_its_own_group():
+    long_row = [["x" * 300, "2020", "1"]]
+    chunks = split_table([HEADER] + long_row + [["short", "2021", "2"]], chunk_size=100)
+    assert [(start, end) for _, start, end in chunks] == [(1, 1), (2, 2)]
+
+
+def test_small_table_is_a_single_chunk():
+    assert [(start, end) for _, start, end in split_table(table(3))] == [(1, 3)]
+
+
+def test_rows_of_different_tables_never_share_a_chunk():
+    tables = [
+        {"table": table(30, prefix="first"), "index": 0, "page": 1, "source": "report.pdf"},
+        {"table": table(30, prefix="second"), "index": 1, "page": 1, "source": "report.pdf"},
+    ]
+    chunks = split_table_data(tables)
+    # Both tables fit in one chunk each, yet are never joined
+    assert len(chunks) == 2
+    for chunk in chunks:
+        rows = chunk["content"].splitlines()[2:]
+        assert all("first" in row for row in rows) or all("second" in row for row in rows)
+    assert {chunk["table_rows"] for chunk in chunks} == {30}
+
+
+def blank_pdf(path, pages):
+    writer = pypdf.PdfWriter()
+    for _ in range(pages):
+        writer.add_blank_page(width=200, height=200)
+    with open(path, "wb") as f:
+        writer.write(f)
+    return str(path)
+
+
+def test_page_range_tasks_carry_the_page_count(tmp_path):
+    long = blank_pdf(tmp_path / "long.pdf", 7)
+    short = blank_pdf(tmp_path / "short.pdf", 2)
+    empty = blank_pdf(tmp_path / "empty.pdf", 0)
+    assert plan_extraction_tasks([long, short, empty], pages_per_task=3) == [
+        (long, 0, 3, 7), (long, 3, 6, 7), (long, 6, 7, 7), (short, 0, 2, 2), (empty, 0, 0, 0),
+    ]
+
+
+def test_page_range_yields_only_its_pages(tmp_path):
+    path = blank_pdf(tmp_path / "report.pdf", 5)
+    pages = [text_doc.metadata for text_doc, _ in iter_pdf_pages(path, 2, 4, total_pages=5)]
+    assert pages == [
+        {"source": path, "total_pages": 5, "page": 2, "page_label": "3"},
+        {"source": path, "total_pages": 5, "page": 3, "page_label": "4"},
+    ]
+
+
+class FakeCollection:
+    def __init__(self):
+        self.chunks = {}
+
+    def upsert(self, ids, embeddings, documents, metadatas):
+        self.chunks.update(zip(ids, documents))
+
+
+class FakeVectorStore:
+    def __init__(self):
+        self._collection = FakeCollection()
+        self.deleted = []
+
+    def delete(self, ids):
+        self.deleted.extend(ids)
+
+
+class FakeEmbeddings:
+    def embed_documents(self, texts):
+        return [[float(len(text))] for text in texts]
+
+
+def part(name, ids):
+    return name, {"sha256": name}, [Document(page_content=f"text of {i}") for i in ids], ids
+
+
+def test_a_file_streamed_in_parts_is_finished_once_all_are_stored(tmp_path):
+    vs = FakeVectorStore()
+    manifest = {"a.pdf": {"sha256": "old", "chunk_ids": ["a0", "stale"]}}
+    parts = [part("a.pdf", ["a0", "a1", "a2"]), part("a.pdf", ["a3"]), part("b.pdf", ["b0", "b1"])]
+    stored = embed_and_store(iter(parts), vs, FakeEmbeddings(), manifest, str(tmp_path), batch_size=2, max_in_flight=2)
+    assert stored == 6
+    assert sorted(vs._collection.chunks) == ["a0", "a1", "a2", "a3", "b0", "b1"]
+    assert vs.deleted == ["stale"]
+    assert manifest == {
+        "a.pdf": {"sha256": "a.pdf", "chunk_ids": ["a0", "a1", "a2", "a3"]},
+        "b.pdf": {"sha256": "b.pdf", "chunk_ids": ["b0", "b1"]},
+    }
+
+
+def test_an_interrupted_file_keeps_the_ids_of_its_stored_parts_pending(tmp_path):
+    def parts():
+        yield part("a.pdf", ["a0", "a1"])
+        raise RuntimeError("extraction failed")
+
+    manifest = {}
+    with pytest.raises(RuntimeError):
+        embed_and_store(parts(), FakeVectorStore(), FakeEmbeddings(), manifest, str(tmp_path))
+    assert manifest == {"a.pdf": {"pending_chunk_ids": ["a0", "a1"]}}
+
+
+def write_pdf(folder, name, content):
+    path = folder / name
+    path.write_bytes(content)
+    return str(path)
+
+
+def ingested(manifest, folder):
+    """Record the files of a folder as fully ingested, as ingest_data does."""
+    changed, removed = plan_incremental_ingest(sorted(str(p) for p in folder.iterdir()), manifest)
+    for name in removed:
+        del manifest[name]
+    for name, (_, entry) in changed.items():
+        manifest[name] = entry | {"chunk_ids": [f"{name}-0"]}
+    return manifest
+
+
+def test_first_ingestion_sees_every_file_as_new(tmp_path):
+    paths = [write_pdf(tmp_path, "a.pdf", b"first"), write_pdf(tmp_path, "b.pdf", b"second")]
+    changed, removed = plan_incremental_ingest(paths, {})
+    assert sorted(changed) == ["a.pdf", "b.pdf"]
+    assert changed["a.pdf"][0] == paths[0]
+    assert changed["a.pdf"][1]["sha256"] == hashlib.sha256(b"first").hexdigest()
+    assert changed["a.pdf"][1]["chunker"] == CHUNKER_VERSION
+    assert removed == []
+
+
+def test_added_changed_and_removed_files_are_found(tmp_path):
+    write_pdf(tmp_path, "kept.pdf", b"kept")
+    write_pdf(tmp_path, "edited.pdf", b"before")
+    write_pdf(tmp_path, "deleted.pdf", b"deleted")
+    manifest = ingested({}, tmp_path)
+    (tmp_path / "deleted.pdf").unlink()
+    write_pdf(tmp_path, "edited.pdf", b"after, and longer")
+    write_pdf(tmp_path, "added.pdf", b"added")
+    changed, removed = plan_incremental_ingest(sorted(str(p) for p in tmp_path.iterdir()), manifest)
+    assert sorted(changed) == ["added.pdf", "edited.pdf"]
+    assert removed == ["deleted.pdf"]
+
+
+def test_touched_but_identical_files_are_skipped_and_their_stat_refreshed(tmp_path):
+    path = write_pdf(tmp_path, "a.pdf", b"content")
+    manifest = ingested({}, tmp_path)
+    os.utime(path, (1_000_000, 1_000_000))
+    assert plan_incremental_ingest([path], manifest) == ({}, [])
+    assert manifest["a.pdf"]["mtime"] == 1_000_000
+    assert manifest["a.pdf"]["chunk_ids"] == ["a.pdf-0"]
+
+
+def test_interrupted_or_outdated_files_are_ingested_again(tmp_path):
+    path = write_pdf(tmp_path, "a.pdf", b"content")
+    manifest = ingested({}, tmp_path)
+    del manifest["a.pdf"]["chunk_ids"]
+    assert list(plan_incremental_ingest([path], manifest)[0]) == ["a.pdf"]
+    manifest = ingested({}, tmp_path)
+    manifest["a.pdf"]["chunker"] = CHUNKER_VERSION - 1
+    assert list(plan_incremental_ingest([path], manifest)[0]) == ["a.pdf"]
+
+
+def chunk(text, source="data/report.pdf", type_=None):
+    metadata = {"source": source} | ({"type": type_} if type_ else {})
+    return Document(page_content=text, metadata=metadata)
+
+
+def test_chunk_ids_are_the_same_on_every_run():
+    docs = [chunk("PM2.5 rose"), chunk("| a | b |", type_="table"), chunk("Ozone fell")]
+    assert assign_chunk_ids(docs) == assign_chunk_ids([chunk(d.page_content, type_=d.metadata.get("type"))
+                                                       for d in docs])
+    # Only the file name counts, not the folder it was ingested from
+    assert assign_chunk_ids([chunk("PM2.5 rose", source="/elsewhere/report.pdf")])[0] == assign_chunk_ids(docs)[0]
+
+
+def test_chunk_ids_do_not_depend_on_the_other_chunks():
+    before = assign_chunk_ids([chunk("intro"), chunk("PM2.5 rose"), chunk("Ozone fell")])
+    after = assign_chunk_ids([chunk("new intro"), chunk("PM2.5 rose"), chunk("Ozone fell")])
+    assert before[0] != after[0]
+    assert before[1:] == after[1:]
+
+
+def test_repeated_chunks_get_distinct_ids_across_the_parts_of_a_file():
+    seen = {}
+    first = assign_chunk_ids([chunk("Page 1"), chunk("Source: CPCB")], seen)
+    second = assign_chunk_ids([chunk("Source: CPCB"), chunk("Source: CPCB", source="other.pdf")], seen)
+    assert first[1].endswith("-0") and second[0].endswith("-1")
+    assert second[0].rsplit("-", 1)[0] == first[1].rsplit("-", 1)[0]
+    assert second[1].endswith("-0")
+    assert first + second == assign_chunk_ids([chunk("Page 1"), chunk("Source: CPCB"), chunk("Source: CPCB"),
+                                               chunk("Source: CPCB", source="other.pdf")])
+    # Text and table chunks with the same content are different chunks
+    assert assign_chunk_ids([chunk("x")]) != assign_chunk_ids([chunk("x", type_="table")])
@@ -0,0 +1,122 @@
+import asyncio
+import sqlite3
+
+import pytest
+from langchain_core.embeddings import Embeddings
+
+from utils import embeddings as embeddings_module
+from utils.embeddings import CachedEmbeddings
+
+
+class CountingEmbeddings(Embeddings):
+    """Embedding model returning a vector derived from the text length, recording the embedded texts."""
+
+    def __init__(self):
+        self.calls = []
+
+    def embed_documents(self, texts):
+        self.calls.extend(texts)
+        return [[float(len(t)), 0.5] for t in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(embeddings_module.time, "time", lambda: now[0])
+    return now
+
+
+def cached(model, **kwargs):
+    return CachedEmbeddings(model, "test-model", **kwargs)
+
+
+def test_repeated_and_trivially_different_texts_are_embedded_once():
+    model = CountingEmbeddings()
+    cache = cached(model)
+    assert cache.embed_query("What is AQI?") == cache.embed_query("what  is aqi?") == [12.0, 0.5]
+    assert cache.embed_documents(["a", "b", "a"]) == [[1.0, 0.5], [1.0, 0.5], [1.0, 0.5]]
+    assert model.calls == ["What is AQI?", "a", "b"]
+    # Both copies of "a" missed the cache, even though it was embedded once
+    assert cache.stats() == {"hits": 1, "misses": 4, "hit_rate": 0.2, "size": 3}
+
+
+def test_least_recently_used_vector_is_evicted():
+    model = CountingEmbeddings()
+    cache = cached(model, max_size=2)
+    cache.embed_query("a")
+    cache.embed_query("b")
+    cache.embed_query("a")
+    cache.embed_query("c")
+    assert cache.stats()["size"] == 2
+    cache.embed_query("a")
+    cache.embed_query("b")
+    assert model.calls == ["a", "b", "c", "b"]
+
+
+def test_vectors_expire_after_the_ttl(clock):
+    model = CountingEmbeddings()
+    cache = cached(model, ttl=60)
+    cache.embed_query("ozone")
+    clock[0] += 59
+    cache.embed_query("ozone")
+    clock[0] += 2
+    cache.embed_query("ozone")
+    assert model.calls == ["ozone", "ozone"]
+
+
+def test_vectors_are_read_back_from_disk(tmp_path):
+    path = str(tmp_path / "cache.db")
+    first = CountingEmbeddings()
+    cached(first, persist_path=path).embed_documents(["pm2.5", "no2"])
+    second = CountingEmbeddings()
+    restarted = cached(second, persist_path=path)
+    assert restarted.embed_documents(["no2", "pm2.5", "ozone"]) == [[3.0, 0.5], [5.0, 0.5], [5.0, 0.5]]
+    assert second.calls == ["ozone"]
+    # Read back into memory as well
+    assert restarted.stats()["size"] == 3
+
+
+def test_other_models_do_not_share_the_disk_store(tmp_path):
+    path = str(tmp_path / "cache.db")
+    cached(CountingEmbeddings(), persist_path=path).embed_query("pm2.5")
+    model = CountingEmbeddings()
+    CachedEmbeddings(model, "other-model", persist_path=path).embed_query("pm2.5")
+    assert model.calls == ["pm2.5"]
+
+
+def test_expired_vectors_on_disk_are_not_used(tmp_path, clock):
+    path = str(tmp_path / "cache.db")
+    cached(CountingEmbeddings(), ttl=60, persist_path=path).embed_query("ozone")
+    clock[0] += 61
+    model = CountingEmbeddings()
+    cached(model, ttl=60, persist_path=path).embed_query("ozone")
+    assert model.calls == ["ozone"]
+
+
+def test_async_lookups_write_to_disk_in_the_background(tmp_path):
+    path = str(tmp_path / "cache.db")
+    cache = cached(CountingEmbeddings(), persist_path=path)
+
+    async def main():
+        return await cache.aembed_query("pm2.5"), await cache.aembed_documents(["no2", "pm2.5"])
+
+    assert asyncio.run(main()) == ([5.0, 0.5], [[3.0, 0.5], [5.0, 0.5]])
+    cache._disk_executor.shutdown(wait=True)
+    model = CountingEmbeddings()
+    cached(model, persist_path=path).embed_documents(["pm2.5", "no2"])
+    assert model.calls == []
+
+
+def test_disk_store_keeps_the_newest_max_rows(tmp_path, clock, monkeypatch):
+    monkeypatch.setattr(embeddings_module, "EMBEDDING_CACHE_PRUNE_ROWS", 2)
+    path = str(tmp_path / "cache.db")
+    cache = cached(CountingEmbeddings(), persist_path=path, max_rows=3)
+    for text in ["a", "b", "c", "d", "e", "f"]:
+        clock[0] += 1
+        cache.embed_query(text)
+    with sqlite3.connect(path) as db:
+        keys = sorted(key.split("\x00")[1] for key, in db.execute("SELECT key FROM embeddings"))
+    assert keys == ["d", "e", "f"]
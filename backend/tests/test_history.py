@@ -0,0 +1,104 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+import rag.history as history
+from db import models
+from db.dbo import Base
+from rag.history import build_history, refresh_summary, window_start
+from utils.constants import CHARS_PER_TOKEN, HISTORY_SUMMARY_MIN_MESSAGES, HISTORY_TOKEN_BUDGET
+
+
+def message(tokens, role="user", text="x"):
+    """Message estimated at ``tokens`` tokens."""
+    return models.Message(role=models.RoleEnum(role), content=text * ((tokens - 1) * CHARS_PER_TOKEN))
+
+
+def session(summary=None, summary_message_count=0):
+    return models.Session(id="s1", summary=summary, summary_message_count=summary_message_count)
+
+
+def scheduled_refreshes(monkeypatch):
+    calls = []
+    monkeypatch.setattr(history, "schedule_summary_refresh", lambda session_id, upto: calls.append((session_id, upto)))
+    return calls
+
+
+def test_window_keeps_the_recent_messages_fitting_in_the_budget():
+    messages = [message(40), message(30), message(30), message(30)]
+    assert window_start(messages, budget=90) == 1
+    assert window_start(messages, budget=89) == 2
+    assert window_start(messages, budget=1000) == 0
+
+
+def test_window_always_keeps_the_latest_message():
+    assert window_start([message(10), message(500)], budget=100) == 1
+    assert window_start([], budget=100) == 0
+
+
+def test_history_replays_the_window_after_the_summary(monkeypatch):
+    scheduled_refreshes(monkeypatch)
+    old, recent = message(HISTORY_TOKEN_BUDGET, text="o"), message(10, "assistant", text="r")
+    pairs = build_history(session(summary="Delhi was discussed"), [old, recent])
+    assert pairs == [("system", "Summary of the earlier conversation: Delhi was discussed"),
+                     (models.RoleEnum.assistant, recent.content)]
+
+
+def test_summary_is_left_out_while_every_message_fits(monkeypatch):
+    scheduled_refreshes(monkeypatch)
+    messages = [message(10), message(10)]
+    assert len(build_history(session(summary="stale"), messages)) == 2
+
+
+def test_summary_is_refreshed_once_enough_messages_fell_out_of_the_window(monkeypatch):
+    calls = scheduled_refreshes(monkeypatch)
+    messages = [message(HISTORY_TOKEN_BUDGET)] * HISTORY_SUMMARY_MIN_MESSAGES + [message(10)]
+    build_history(session(), messages[1:])
+    assert calls == []
+    build_history(session(), messages)
+    assert calls == [("s1", HISTORY_SUMMARY_MIN_MESSAGES)]
+
+
+def test_summary_refresh_counts_the_messages_already_summarized_and_not_loaded(monkeypatch):
+    calls = scheduled_refreshes(monkeypatch)
+    messages = [message(HISTORY_TOKEN_BUDGET), message(10)]
+    # 100 older messages were not loaded, 98 of them are already in the summary
+    build_history(session("summary", summary_message_count=98), messages, offset=100)
+    assert calls == []
+    build_history(session("summary", summary_message_count=101 - HISTORY_SUMMARY_MIN_MESSAGES), messages, offset=100)
+    assert calls == [("s1", 101)]
+
+
+def test_refresh_folds_only_the_new_messages_into_the_summary(monkeypatch, tmp_path):
+    async def main():
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'chat.db'}")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        session_factory = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+        monkeypatch.setattr(history, "AsyncSessionLocal", session_factory)
+        summarized = []
+
+        async def summarize_history(summary, pairs):
+            summarized.append((summary, [content for _, content in pairs]))
+            return f"{summary} + {len(pairs)}"
+
+        monkeypatch.setattr(history, "summarize_history", summarize_history)
+        start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+        async with session_factory() as db:
+            db.add(models.User(id="u1", email="user@example.com", username="user"))
+            db.add(models.Session(id="s1", user_id="u1", summary="old", summary_message_count=1))
+            db.add_all(models.Message(session_id="s1", role=models.RoleEnum.user, content=f"m{i}",
+                                      created_at=start + timedelta(seconds=i)) for i in range(5))
+            await db.commit()
+        await refresh_summary("s1", 3)
+        # Already covered, nothing to do
+        await refresh_summary("s1", 2)
+        async with session_factory() as db:
+            refreshed = await db.get(models.Session, "s1")
+        await engine.dispose()
+        assert summarized == [("old", ["m1", "m2"])]
+        assert (refreshed.summary, refreshed.summary_message_count) == ("old + 2", 3)
+
+    asyncio.run(main())
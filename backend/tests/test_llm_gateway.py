@@ -0,0 +1,218 @@
+import asyncio
+
+import pytest
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage
+
+from rag.llm_gateway import LLMGateway, LLMOverloadedError
+
+
+class FakeLLM:
+    """Chat model answering after ``delay`` seconds and recording what it was asked."""
+
+    def __init__(self, delay=0.05):
+        self.delay = delay
+        self.prompts = []
+        self.running = 0
+        self.peak = 0
+
+    async def ainvoke(self, messages):
+        self.prompts.append(messages[0].content)
+        self.running += 1
+        self.peak = max(self.peak, self.running)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.running -= 1
+        return AIMessage(content=f"answer to {messages[0].content}")
+
+    async def astream(self, messages):
+        self.prompts.append(messages[0].content)
+        for token in ["a", "b", "c"]:
+            await asyncio.sleep(self.delay / 3)
+            yield AIMessageChunk(content=token)
+
+
+def prompt(text):
+    return [HumanMessage(content=text)]
+
+
+def gateway(llm, **kwargs):
+    return LLMGateway(lambda: llm, **{"max_concurrency": 1, "max_queue": 8, "queue_timeout": 5.0} | kwargs)
+
+
+async def settle():
+    """Let the tasks created so far reach the gateway's queue."""
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_concurrency_is_capped():
+    async def main():
+        llm = FakeLLM()
+        gw = gateway(llm, max_concurrency=2)
+        answers = await asyncio.gather(*(gw.invoke(prompt(f"q{i}")) for i in range(6)))
+        assert [a.content for a in answers] == [f"answer to q{i}" for i in range(6)]
+        assert llm.peak == 2
+        assert gw.active == 0 and gw.queued() == 0
+
+    asyncio.run(main())
+
+
+def test_higher_priorities_are_served_first():
+    async def main():
+        llm = FakeLLM()
+        gw = gateway(llm)
+        tasks = [asyncio.create_task(gw.invoke(prompt("running"), "background"))]
+        await settle()
+        tasks += [asyncio.create_task(gw.invoke(prompt(f"bg{i}"), "background")) for i in range(2)]
+        tasks.append(asyncio.create_task(gw.invoke(prompt("batch"), "batch")))
+        tasks.append(asyncio.create_task(gw.invoke(prompt("chat"), "interactive")))
+        await settle()
+        assert gw.queue_depths() == {("interactive",): 1, ("batch",): 1, ("background",): 2}
+        await asyncio.gather(*tasks)
+        assert llm.prompts == ["running", "chat", "batch", "bg0", "bg1"]
+
+    asyncio.run(main())
+
+
+def test_full_queue_preempts_the_newest_lowest_priority_request():
+    async def main():
+        llm = FakeLLM()
+        gw = gateway(llm, max_queue=3)
+        running = asyncio.create_task(gw.invoke(prompt("running")))
+        await settle()
+        queued = {name: asyncio.create_task(gw.invoke(prompt(name), priority))
+                  for name, priority in [("batch", "batch"), ("bg0", "background"), ("bg1", "background")]}
+        await settle()
+        chat = asyncio.create_task(gw.invoke(prompt("chat")))
+        await settle()
+        with pytest.raises(LLMOverloadedError):
+            await queued["bg1"]
+        await asyncio.gather(running, chat, queued["batch"], queued["bg0"])
+        assert llm.prompts == ["running", "chat", "batch", "bg0"]
+
+    asyncio.run(main())
+
+
+def test_full_queue_rejects_when_nothing_can_be_preempted():
+    async def main():
+        gw = gateway(FakeLLM(), max_queue=2)
+        tasks = [asyncio.create_task(gw.invoke(prompt(f"q{i}"))) for i in range(3)]
+        await settle()
+        with pytest.raises(LLMOverloadedError):
+            gw.check_capacity()
+        with pytest.raises(LLMOverloadedError):
+            await gw.invoke(prompt("one too many"))
+        await asyncio.gather(*tasks)
+        gw.check_capacity()
+
+    asyncio.run(main())
+
+
+def test_identical_prompts_share_one_generation():
+    async def main():
+        llm = FakeLLM()
+        gw = gateway(llm)
+        answers = await asyncio.gather(*(gw.invoke(prompt("same")) for _ in range(3)))
+        assert [a.content for a in answers] == ["answer to same"] * 3
+        assert llm.prompts == ["same"]
+
+    asyncio.run(main())
+
+
+def test_late_stream_joiner_replays_from_the_start():
+    async def main():
+        llm = FakeLLM(delay=0.06)
+        gw = gateway(llm)
+
+        async def collect():
+            return "".join([chunk.content async for chunk in gw.stream(prompt("streamed"))])
+
+        first = asyncio.create_task(collect())
+        await asyncio.sleep(0.03)
+        second = asyncio.create_task(collect())
+        assert await first == await second == "abc"
+        assert llm.prompts == ["streamed"]
+
+    asyncio.run(main())
+
+
+def test_cancelling_every_caller_cancels_the_generation_and_frees_the_slot():
+    async def main():
+        llm = FakeLLM(delay=10)
+        gw = gateway(llm)
+        task = asyncio.create_task(gw.invoke(prompt("abandoned")))
+        await asyncio.sleep(0.01)
+        assert gw.active == 1
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        await settle()
+        assert gw.active == 0 and not gw._generations
+
+    asyncio.run(main())
+
+
+def test_identical_prompt_right_after_cancelling_gets_a_fresh_generation():
+    async def main():
+        llm = FakeLLM(delay=10)
+        gw = gateway(llm)
+
+        async def retry_once():
+            try:
+                return await gw.invoke(prompt("retried"))
+            except asyncio.CancelledError:
+                # Asks again before the cancelled generation has unwound
+                llm.delay = 0.01
+                return await gw.invoke(prompt("retried"))
+
+        task = asyncio.create_task(retry_once())
+        await asyncio.sleep(0.01)
+        task.cancel()
+        assert (await task).content == "answer to retried"
+        assert llm.prompts == ["retried", "retried"]
+        assert gw.active == 0 and not gw._generations
+
+    asyncio.run(main())
+
+
+def test_cancelling_one_caller_keeps_the_shared_generation():
+    async def main():
+        gw = gateway(FakeLLM())
+        leaving = asyncio.create_task(gw.invoke(prompt("shared")))
+        staying = asyncio.create_task(gw.invoke(prompt("shared")))
+        await settle()
+        leaving.cancel()
+        assert (await staying).content == "answer to shared"
+
+    asyncio.run(main())
+
+
+def test_waiting_too_long_is_rejected():
+    async def main():
+        gw = gateway(FakeLLM(), queue_timeout=0.01)
+        results = await asyncio.gather(gw.invoke(prompt("served")), gw.invoke(prompt("timed out")),
+                                       return_exceptions=True)
+        assert isinstance(results[0], AIMessage)
+        assert isinstance(results[1], LLMOverloadedError)
+        assert gw.active == 0 and gw.queued() == 0
+
+    asyncio.run(main())
+
+
+def test_joining_a_queued_generation_raises_its_priority():
+    async def main():
+        llm = FakeLLM()
+        gw = gateway(llm)
+        running = asyncio.create_task(gw.invoke(prompt("running")))
+        await settle()
+        batch = asyncio.create_task(gw.invoke(prompt("batch"), "batch"))
+        summary = asyncio.create_task(gw.invoke(prompt("summary"), "background"))
+        await settle()
+        chat = asyncio.create_task(gw.invoke(prompt("summary"), "interactive"))
+        await settle()
+        assert gw.queue_depths() == {("interactive",): 1, ("batch",): 1, ("background",): 0}
+        await asyncio.gather(running, batch, summary, chat)
+        assert llm.prompts == ["running", "summary", "batch"]
+        assert gw.queued() == 0
+
+    asyncio.run(main())
@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+
+from rag import rerank
+from rag.bm25 import BM25Index
+from rag.rerank import FeatureReranker, get_reranker, select_passages
+
+
+def passage(id_, text, similarity):
+    return Document(id=id_, page_content=text, metadata={"similarity": similarity})
+
+
+def test_feature_scores_mix_similarity_and_term_coverage():
+    docs = [
+        passage("both", "PM2.5 levels in Delhi", 0.6),
+        passage("similar", "Air quality in big cities", 0.6),
+        passage("close", "Air quality in big cities", 0.9),
+    ]
+    scores = FeatureReranker(similarity_weight=0.5).score("PM2.5 Delhi", docs)
+    assert scores == pytest.approx([0.5 * 0.6 + 0.5, 0.5 * 0.6, 0.5 * 0.9])
+    assert [docs[i].id for i in np.argsort(-scores)] == ["both", "close", "similar"]
+
+
+def test_rare_query_terms_weigh_more_with_an_index():
+    texts = ["ozone in 2019", "ozone in 2020", "ozone in 2021", "ozone trends"]
+    index = BM25Index.build(["a", "b", "c", "d"], texts, [{}] * 4)
+    docs = [passage("year", "report for 2019", 0.5), passage("common", "ozone report", 0.5)]
+    scores = FeatureReranker().score("ozone 2019", docs, index)
+    assert scores[0] > scores[1]
+
+
+def test_scores_do_not_depend_on_the_batch_size():
+    docs = [passage(str(i), f"pm2.5 station {i} ozone", i / 10) for i in range(10)]
+    one_batch = FeatureReranker(batch_size=32).score("ozone station 3", docs)
+    assert FeatureReranker(batch_size=3).score("ozone station 3", docs) == pytest.approx(one_batch)
+
+
+def test_passages_are_returned_best_first_with_their_score():
+    docs = [passage(id_, id_, 0.0) for id_ in "abcd"]
+    selected = select_passages(docs, np.array([0.5, 0.9, 0.7, 0.8]), max_k=4, min_score=0.0, relative_cutoff=0.0)
+    assert [d.id for d in selected] == ["b", "d", "c", "a"]
+    assert [d.metadata["score"] for d in selected] == pytest.approx([0.9, 0.8, 0.7, 0.5])
+
+
+def test_at_most_max_k_passages_are_kept():
+    docs = [passage(str(i), str(i), 0.0) for i in range(6)]
+    selected = select_passages(docs, np.full(6, 0.9), max_k=4, min_score=0.0, relative_cutoff=0.0)
+    assert [d.id for d in selected] == ["0", "1", "2", "3"]
+
+
+def test_passages_below_the_cutoffs_are_dropped():
+    docs = [passage(id_, id_, 0.0) for id_ in "abcd"]
+    scores = np.array([0.9, 0.75, 0.7, 0.3])
+    # 0.8 * 0.9 = 0.72 drops c, min_score drops d
+    assert [d.id for d in select_passages(docs, scores, max_k=4, min_k=1, min_score=0.35, relative_cutoff=0.8)] == ["a", "b"]
+    assert [d.id for d in select_passages(docs, scores, max_k=4, min_k=1, min_score=0.35, relative_cutoff=0.5)] == ["a", "b", "c"]
+
+
+def test_min_k_passages_are_kept_below_the_cutoffs():
+    docs = [passage(id_, id_, 0.0) for id_ in "abc"]
+    selected = select_passages(docs, np.array([0.1, 0.2, 0.05]), max_k=4, min_k=2, min_score=0.35)
+    assert [d.id for d in selected] == ["b", "a"]
+    assert select_passages([], np.array([])) == []
+
+
+def test_missing_cross_encoder_falls_back_to_features(monkeypatch):
+    def unavailable(*args, **kwargs):
+        raise ImportError("No module named 'transformers'")
+
+    monkeypatch.setattr(rerank, "_reranker", None)
+    monkeypatch.setattr(rerank, "CrossEncoderReranker", unavailable)
+    reranker = get_reranker("cross-encoder")
+    assert isinstance(reranker, FeatureReranker)
+    assert get_reranker("cross-encoder") is reranker
+    assert get_reranker("none") is None
@@ -0,0 +1,130 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+
+from rag import retrievers
+from rag.bm25 import BM25Index
+from rag.retrievers import HybridRetriever, forget_indexes, load_bm25_index, reciprocal_rank_fusion
+from utils.constants import BM25_INDEX_FILE
+
+TEXTS = {
+    "ozone": "Ozone peaks on hot summer afternoons.",
+    "pm25": "PM2.5 comes from traffic and wood heating.",
+    "no2": "NO2 is emitted by diesel traffic.",
+    "aqi": "The AQI summarises several pollutants.",
+}
+
+
+def doc(id_, **metadata):
+    return Document(id=id_, page_content=TEXTS[id_], metadata=metadata)
+
+
+class FakeVectorStore(VectorStore):
+    """Vector store returning the same ranked documents for every query, counting the embedded queries."""
+
+    def __init__(self, ranked):
+        self.ranked = ranked
+        self.embedded = []
+
+    @property
+    def embeddings(self):
+        return self
+
+    def embed_query(self, text):
+        self.embedded.append(text)
+        return [1.0, 0.0]
+
+    def _select_relevance_score_fn(self):
+        return lambda distance: 1.0 - distance
+
+    def similarity_search_by_vector_with_relevance_scores(self, embedding, k=4, **kwargs):
+        return [(d, 1.0 - similarity) for d, similarity in self.ranked[:k]]
+
+    def similarity_search(self, query, k=4, **kwargs):
+        return [d for d, _ in self.ranked[:k]]
+
+    @property
+    def _collection(self):
+        return self
+
+    def get(self, ids, include):
+        return {"ids": ids, "embeddings": [[0.0, 1.0] for _ in ids]}
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, **kwargs):
+        raise NotImplementedError
+
+
+def save_index(directory):
+    ids = list(TEXTS)
+    BM25Index.build(ids, [TEXTS[i] for i in ids], [{} for _ in ids]).save(str(directory / BM25_INDEX_FILE))
+
+
+def test_rrf_sums_the_reciprocal_ranks():
+    fused = reciprocal_rank_fusion([[doc("ozone"), doc("pm25"), doc("aqi")], [doc("aqi"), doc("ozone"), doc("no2")]],
+                                   k=60)
+    assert [(d.id, score) for d, score in fused] == [
+        ("ozone", pytest.approx(1 / 61 + 1 / 62)),
+        ("aqi", pytest.approx(1 / 63 + 1 / 61)),
+        ("pm25", pytest.approx(1 / 62)),
+        ("no2", pytest.approx(1 / 63)),
+    ]
+
+
+def test_rrf_keeps_the_first_copy_of_a_document():
+    fused = reciprocal_rank_fusion([[doc("ozone", similarity=0.9)], [doc("ozone", bm25_score=3.0)]])
+    assert len(fused) == 1
+    assert fused[0][0].metadata == {"similarity": 0.9}
+
+
+def test_hybrid_retriever_fuses_dense_and_lexical_results(tmp_path):
+    save_index(tmp_path)
+    # Dense search misses the lexical match "no2"
+    store = FakeVectorStore([(doc("aqi"), 0.8), (doc("ozone"), 0.7), (doc("pm25"), 0.6)])
+    retriever = HybridRetriever(vectorstore=store, persist_directory=str(tmp_path), k=3, fetch_k=3, reranker="none")
+    docs = retriever.invoke("diesel traffic NO2")
+    # no2 and pm25 both match the query, pm25 is also found by dense search
+    assert [d.id for d in docs] == ["pm25", "aqi", "no2"]
+    assert [d.metadata["score"] for d in docs] == [pytest.approx(0.6), pytest.approx(0.8), None]
+    assert all("rrf_score" in d.metadata for d in docs)
+    assert store.embedded == ["diesel traffic NO2"]
+
+
+def test_a_computed_embedding_is_not_embedded_again(tmp_path):
+    save_index(tmp_path)
+    store = FakeVectorStore([(doc("aqi"), 0.8), (doc("ozone"), 0.7), (doc("pm25"), 0.6)])
+    retriever = HybridRetriever(vectorstore=store, persist_directory=str(tmp_path), k=3, fetch_k=3)
+    docs = retriever.retrieve_by_vector("diesel traffic NO2", [1.0, 0.0])
+    # Reranking looked up the similarity of "no2", found by BM25 only, without embedding the query
+    assert store.embedded == []
+    assert docs and all("score" in d.metadata for d in docs)
+
+
+def test_without_an_index_the_dense_order_is_kept(tmp_path):
+    store = FakeVectorStore([(doc("aqi"), 0.8), (doc("ozone"), 0.7), (doc("pm25"), 0.6)])
+    retriever = HybridRetriever(vectorstore=store, persist_directory=str(tmp_path), k=2, reranker="none")
+    assert [d.id for d in retriever.invoke("diesel traffic NO2")] == ["aqi", "ozone"]
+
+
+def test_index_is_loaded_once_by_concurrent_threads(tmp_path, monkeypatch):
+    save_index(tmp_path)
+    loads = []
+    load = BM25Index.load
+
+    def slow_load(path):
+        loads.append(threading.current_thread().name)
+        time.sleep(0.05)
+        return load(path)
+
+    monkeypatch.setattr(retrievers.BM25Index, "load", slow_load)
+    with ThreadPoolExecutor(8) as pool:
+        indexes = list(pool.map(lambda _: load_bm25_index(str(tmp_path)), range(8)))
+    assert len(loads) == 1
+    assert all(index is indexes[0] for index in indexes)
+    forget_indexes(str(tmp_path))
+    assert load_bm25_index(str(tmp_path)) is not indexes[0]
+    assert len(loads) == 2
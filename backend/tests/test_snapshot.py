@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+
+from rag.snapshot import SnapshotIndex, normalize
+
+K = 5
+
+
+class FakeCollection:
+    def __init__(self, embeddings):
+        self.embeddings = embeddings
+
+    def count(self):
+        return len(self.embeddings)
+
+    def get(self, limit, offset, include):
+        rows = range(offset, min(offset + limit, len(self.embeddings)))
+        return {"ids": [f"c{i}" for i in rows], "embeddings": self.embeddings[offset:offset + limit].tolist(),
+                "documents": [f"chunk {i}" for i in rows], "metadatas": [{"row": i} for i in rows]}
+
+
+class FakeVectorStore:
+    def __init__(self, embeddings):
+        self._collection = FakeCollection(embeddings)
+
+
+def fixture(dim=64, rows=300, queries=8, seed=0):
+    """Random chunks, each query having K neighbours at clearly increasing distances."""
+    rng = np.random.default_rng(seed)
+    embeddings = rng.normal(size=(rows, dim)).astype(np.float32)
+    query_vectors = rng.normal(size=(queries, dim)).astype(np.float32)
+    for q, query in enumerate(normalize(query_vectors)):
+        for rank in range(K):
+            noise = rng.normal(size=dim).astype(np.float32)
+            # Orthogonal to the query, so the similarity only depends on the rank
+            noise -= (noise @ query) * query
+            embeddings[q * K + rank] = query + 0.25 * (rank + 1) * normalize(noise)
+    return embeddings, query_vectors
+
+
+def float32_top_k(embeddings, queries, k):
+    scores = normalize(queries) @ normalize(embeddings).T
+    return [list(np.argsort(-row, kind="stable")[:k]) for row in scores]
+
+
+@pytest.mark.parametrize("dtype,exact", [("int8", False), ("float16", False), ("int8", True), ("float16", True)])
+def test_quantized_search_finds_the_float32_top_k(tmp_path, dtype, exact):
+    embeddings, queries = fixture()
+    SnapshotIndex.export(FakeVectorStore(embeddings), str(tmp_path), "v1", dtype=dtype, exact=exact, batch_size=64)
+    index = SnapshotIndex.load(str(tmp_path))
+    results = index.search(queries.tolist(), K)
+    assert [[row for row, _ in result] for result in results] == float32_top_k(embeddings, queries, K)
+    expected = np.sort(normalize(queries) @ normalize(embeddings).T, axis=1)[:, ::-1][:, :K]
+    assert np.allclose([[score for _, score in result] for result in results], expected, atol=1e-5 if exact else 0.02)
+
+
+def test_search_returns_the_chunks_of_the_rows(tmp_path):
+    embeddings, queries = fixture(rows=40, queries=1)
+    SnapshotIndex.export(FakeVectorStore(embeddings), str(tmp_path), "v1", dtype="int8", exact=False, batch_size=16)
+    index = SnapshotIndex.load(str(tmp_path))
+    row, similarity = index.search(queries.tolist(), 1)[0][0]
+    document = index.document(row, similarity)
+    assert (document.id, document.page_content) == ("c0", "chunk 0")
+    assert document.metadata == {"row": 0, "similarity": similarity}
@@ -0,0 +1,70 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from rag.store_registry import StoreHandle, VectorStoreRegistry
+from utils.constants import VECTOR_STORE_BYTES_PER_CHUNK
+
+
+class FakeRegistry(VectorStoreRegistry):
+    """Registry opening fake collections of ``chunks`` chunks, slowly, recording what it opened."""
+
+    def __init__(self, chunks=10, open_seconds=0.0, **kwargs):
+        super().__init__(persist_directory="/nonexistent", **kwargs)
+        self.chunks = chunks
+        self.open_seconds = open_seconds
+        self.opened = []
+
+    def _open(self, collection):
+        self.opened.append(collection)
+        time.sleep(self.open_seconds)
+        return StoreHandle(collection, f"/nonexistent/{collection}", None, None, self.chunks)
+
+
+def test_concurrent_requests_open_a_collection_once():
+    registry = FakeRegistry(open_seconds=0.05)
+    start = threading.Barrier(4)
+
+    def get(delay):
+        start.wait()
+        # Some arrive while it is being opened, some right after
+        time.sleep(delay)
+        return registry.get("reports")
+
+    with ThreadPoolExecutor(4) as pool:
+        handles = list(pool.map(get, [0.0, 0.01, 0.05, 0.06] * 4))
+    assert registry.opened == ["reports"]
+    assert all(handle is handles[0] for handle in handles)
+    assert not registry._open_locks
+
+
+def test_least_recently_used_collection_is_closed():
+    registry = FakeRegistry(max_open=2)
+    registry.get("a")
+    registry.get("b")
+    registry.get("a")
+    registry.get("c")
+    assert [handle.collection for handle in registry.handles()] == ["a", "c"]
+    assert registry.stats()["evictions"] == 1
+
+
+def test_memory_limit_closes_collections_but_keeps_the_last_one():
+    registry = FakeRegistry(chunks=100, memory_limit_bytes=150 * VECTOR_STORE_BYTES_PER_CHUNK)
+    registry.get("a")
+    registry.get("b")
+    assert [handle.collection for handle in registry.handles()] == ["b"]
+    registry.chunks = 1000
+    registry.get("c")
+    assert [handle.collection for handle in registry.handles()] == ["c"]
+
+
+def test_answer_cache_totals_survive_closing_a_collection():
+    registry = FakeRegistry(max_open=1)
+    cache = registry.get("a").answer_cache
+    cache.add([1.0, 0.0], "answer", [])
+    cache.lookup([1.0, 0.0])
+    cache.lookup([0.0, 1.0])
+    assert registry.answer_cache_stats() == {"hits": 1, "misses": 1, "hit_rate": 0.5, "size": 1}
+    registry.get("b").answer_cache.lookup([1.0, 0.0])
+    assert registry.peek("a") is None
+    assert registry.answer_cache_stats() == {"hits": 1, "misses": 2, "hit_rate": 1 / 3, "size": 0}
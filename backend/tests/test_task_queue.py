@@ -0,0 +1,95 @@
+import asyncio
+
+from utils.task_queue import KeyedTaskQueue
+
+
+def test_repeated_submits_for_a_key_run_one_job():
+    async def main():
+        queue = KeyedTaskQueue("test", max_workers=1)
+        runs = []
+
+        def job(name):
+            async def run():
+                runs.append(name)
+            return run
+
+        assert queue.submit("s1", job("first"))
+        assert not queue.submit("s1", job("second"))
+        assert queue.submit("s2", job("other"))
+        assert queue.pending() == 2
+        await queue.join()
+        assert runs == ["first", "other"]
+        # Once the job has run, the key can be submitted again
+        assert queue.submit("s1", job("third"))
+        await queue.join()
+        assert runs == ["first", "other", "third"]
+        assert queue.pending() == 0
+        await queue.stop()
+
+    asyncio.run(main())
+
+
+def test_a_running_job_still_absorbs_new_submits_for_its_key():
+    async def main():
+        queue = KeyedTaskQueue("test", max_workers=1)
+        started, release = asyncio.Event(), asyncio.Event()
+        runs = []
+
+        async def slow():
+            started.set()
+            await release.wait()
+            runs.append("slow")
+
+        queue.submit("s1", slow)
+        await started.wait()
+        assert not queue.submit("s1", slow)
+        release.set()
+        await queue.join()
+        assert runs == ["slow"]
+        await queue.stop()
+
+    asyncio.run(main())
+
+
+def test_a_failing_job_does_not_stop_the_worker():
+    async def main():
+        queue = KeyedTaskQueue("test", max_workers=1)
+        runs = []
+
+        async def fail():
+            raise RuntimeError("LLM unavailable")
+
+        async def succeed():
+            runs.append("after")
+
+        queue.submit("s1", fail)
+        queue.submit("s2", succeed)
+        await queue.join()
+        assert runs == ["after"]
+        # The key of the failed job is released too
+        assert queue.pending() == 0
+        assert queue.submit("s1", succeed)
+        await queue.join()
+        assert runs == ["after", "after"]
+        await queue.stop()
+
+    asyncio.run(main())
+
+
+def test_a_full_queue_drops_new_jobs():
+    async def main():
+        queue = KeyedTaskQueue("test", max_workers=1, max_size=1)
+        release = asyncio.Event()
+
+        async def wait():
+            await release.wait()
+
+        assert queue.submit("s1", wait)
+        await asyncio.sleep(0)
+        assert queue.submit("s2", wait)
+        assert not queue.submit("s3", wait)
+        release.set()
+        await queue.join()
+        await queue.stop()
+
+    asyncio.run(main())
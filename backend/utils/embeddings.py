@@ -0,0 +1,237 @@
+from utils.constants import EMBEDDING_CACHE_MAX_ROWS, EMBEDDING_CACHE_PRUNE_ROWS
+from utils.metrics import observe_stage
+
+from langchain_core.embeddings import Embeddings
+
+from array import array
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+import asyncio
+import logging
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_text(text: str) -> str:
+    """Normalize text for cache lookups (case and whitespace insensitive)."""
+    return " ".join(text.split()).casefold()
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper with an in-memory LRU cache and an optional on-disk store.
+
+    Vectors are keyed on the model name and the normalized text, so repeated or
+    trivially different questions ("What is AQI?" / "what is  aqi?") skip the
+    embedding call entirely.
+
+    The async methods only touch the in-memory cache on the event loop; the
+    on-disk store is read and written on a dedicated thread. Expired vectors
+    are deleted from disk and at most ``max_rows`` are kept there, the oldest
+    going first.
+
+    Args:
+        embeddings (Embeddings): The underlying embedding model.
+        model_name (str): Name of the underlying model, part of the cache key.
+        max_size (int): Maximum number of vectors kept in memory.
+        ttl (float, optional): Seconds after which a cached vector expires. None disables expiry.
+        persist_path (str, optional): SQLite file that keeps vectors across restarts. None keeps the cache in memory only.
+        max_rows (int, optional): Maximum number of vectors kept on disk. Defaults to EMBEDDING_CACHE_MAX_ROWS.
+    """
+
+    def __init__(self, embeddings: Embeddings, model_name: str, max_size: int = 10000,
+                 ttl: Optional[float] = None, persist_path: Optional[str] = None,
+                 max_rows: int = EMBEDDING_CACHE_MAX_ROWS):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.max_size = max_size
+        self.ttl = ttl
+        self.max_rows = max_rows
+        self.hits = 0
+        self.misses = 0
+        self._cache: OrderedDict[str, tuple[float, List[float]]] = OrderedDict()
+        # Guards the in-memory cache only, never held during disk I/O
+        self._lock = threading.Lock()
+        self._db = None
+        self._db_lock = threading.Lock()
+        self._written_since_prune = 0
+        self._disk_executor = None
+        if persist_path:
+            self._db = sqlite3.connect(persist_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL, created_at REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS embeddings_created_at ON embeddings (created_at)")
+            self._db.commit()
+            self._disk_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embedding-cache")
+            self._disk_executor.submit(self._prune)
+
+    def _key(self, text: str) -> str:
+        return f"{self.model_name}\x00{normalize_text(text)}"
+
+    def _expired(self, created_at: float) -> bool:
+        return self.ttl is not None and time.time() - created_at > self.ttl
+
+    def _get_memory(self, key: str) -> Optional[List[float]]:
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is None:
+                return None
+            if self._expired(entry[0]):
+                del self._cache[key]
+                return None
+            self._cache.move_to_end(key)
+            return entry[1]
+
+    def _get_disk(self, keys: List[str]) -> dict[str, List[float]]:
+        """Read vectors from the on-disk store and copy them to memory."""
+        if self._db is None or not keys:
+            return {}
+        with self._db_lock:
+            placeholders = ",".join("?" * len(keys))
+            rows = self._db.execute(
+                f"SELECT key, vector, created_at FROM embeddings WHERE key IN ({placeholders})", keys
+            ).fetchall()
+        found = {}
+        with self._lock:
+            for key, blob, created_at in rows:
+                if not self._expired(created_at):
+                    found[key] = array("f", blob).tolist()
+                    self._put_memory(key, found[key], created_at)
+        return found
+
+    def _put_memory(self, key: str, vector: List[float], created_at: float):
+        self._cache[key] = (created_at, vector)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.max_size:
+            self._cache.popitem(last=False)
+
+    def _remember(self, items: dict[str, List[float]]) -> float:
+        now = time.time()
+        with self._lock:
+            for key, vector in items.items():
+                self._put_memory(key, vector, now)
+        return now
+
+    def _write_disk(self, items: dict[str, List[float]], created_at: float):
+        try:
+            with self._db_lock:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, vector, created_at) VALUES (?, ?, ?)",
+                    [(key, array("f", vector).tobytes(), created_at) for key, vector in items.items()],
+                )
+                self._db.commit()
+                self._written_since_prune += len(items)
+                prune = self._written_since_prune >= EMBEDDING_CACHE_PRUNE_ROWS
+            if prune:
+                self._prune()
+        except sqlite3.Error as e:
+            logger.warning(f"Could not write to the embedding cache: {e}")
+
+    def _prune(self):
+        """Delete expired vectors and the oldest ones beyond ``max_rows``."""
+        try:
+            with self._db_lock:
+                if self.ttl is not None:
+                    self._db.execute("DELETE FROM embeddings WHERE created_at < ?", (time.time() - self.ttl,))
+                excess = self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0] - self.max_rows
+                if excess > 0:
+                    self._db.execute(
+                        "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY created_at LIMIT ?)",
+                        (excess,),
+                    )
+                self._db.commit()
+                self._written_since_prune = 0
+        except sqlite3.Error as e:
+            logger.warning(f"Could not prune the embedding cache: {e}")
+
+    def _put_many(self, items: dict[str, List[float]]):
+        created_at = self._remember(items)
+        if self._db is not None:
+            self._write_disk(items, created_at)
+
+    def _put_many_background(self, items: dict[str, List[float]]):
+        created_at = self._remember(items)
+        if self._disk_executor is not None:
+            self._disk_executor.submit(self._write_disk, items, created_at)
+
+    def _count(self, hits: int, misses: int):
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+
+    def _lookup_memory(self, texts: List[str]):
+        keys = [self._key(t) for t in texts]
+        return keys, [self._get_memory(k) for k in keys]
+
+    def _finish_lookup(self, texts: List[str], keys: List[str], vectors: list, from_disk: dict):
+        vectors = [v if v is not None else from_disk.get(k) for k, v in zip(keys, vectors)]
+        # Embed each distinct missing text once, even if it repeats within the batch
+        missing = {}
+        for text, key, vector in zip(texts, keys, vectors):
+            if vector is None and key not in missing:
+                missing[key] = text
+        self._count(sum(v is not None for v in vectors), len(vectors) - sum(v is not None for v in vectors))
+        return vectors, missing
+
+    def _lookup(self, texts: List[str]):
+        keys, vectors = self._lookup_memory(texts)
+        from_disk = self._get_disk([k for k, v in zip(keys, vectors) if v is None])
+        return (keys, *self._finish_lookup(texts, keys, vectors, from_disk))
+
+    async def _alookup(self, texts: List[str]):
+        keys, vectors = self._lookup_memory(texts)
+        unknown = [k for k, v in zip(keys, vectors) if v is None]
+        from_disk = {}
+        if unknown and self._disk_executor is not None:
+            from_disk = await asyncio.get_running_loop().run_in_executor(self._disk_executor, self._get_disk, unknown)
+        return (keys, *self._finish_lookup(texts, keys, vectors, from_disk))
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys, vectors, missing = self._lookup(texts)
+        if missing:
+            with observe_stage("embed_documents"):
+                computed = dict(zip(missing, self.embeddings.embed_documents(list(missing.values()))))
+            self._put_many(computed)
+            vectors = [v if v is not None else computed[k] for k, v in zip(keys, vectors)]
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        keys, vectors, missing = self._lookup([text])
+        if missing:
+            with observe_stage("embedding"):
+                vector = self.embeddings.embed_query(text)
+            self._put_many({keys[0]: vector})
+            return vector
+        return vectors[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys, vectors, missing = await self._alookup(texts)
+        if missing:
+            with observe_stage("embed_documents"):
+                computed = dict(zip(missing, await self.embeddings.aembed_documents(list(missing.values()))))
+            self._put_many_background(computed)
+            vectors = [v if v is not None else computed[k] for k, v in zip(keys, vectors)]
+        return vectors
+
+    async def aembed_query(self, text: str) -> List[float]:
+        keys, vectors, missing = await self._alookup([text])
+        if missing:
+            with observe_stage("embedding"):
+                vector = await self.embeddings.aembed_query(text)
+            self._put_many_background({keys[0]: vector})
+            return vector
+        return vectors[0]
+
+    def stats(self) -> dict:
+        """Return the hit/miss counters and the current in-memory size."""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "size": len(self._cache),
+        }
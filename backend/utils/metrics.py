@@ -0,0 +1,155 @@
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from prometheus_client.registry import Collector
+
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+# Latency buckets in seconds, from cache hits to slow LLM generations
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Our own registry, so /metrics only exposes the metrics of this app
+REGISTRY = CollectorRegistry()
+
+
+class FunctionMetric(Collector):
+    """Labelled metric whose values are computed when scraped.
+
+    prometheus_client's ``set_function`` only covers metrics without labels.
+
+    Args:
+        family (type): CounterMetricFamily or GaugeMetricFamily.
+        name (str): Metric name.
+        documentation (str): Help text.
+        labelnames (Iterable[str]): Label names.
+        registry (CollectorRegistry, optional): Registry to register with. Defaults to REGISTRY.
+    """
+
+    def __init__(self, family, name: str, documentation: str, labelnames: Iterable[str],
+                 registry: CollectorRegistry = REGISTRY):
+        self.family = family
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = list(labelnames)
+        self._function: Optional[Callable[[], Dict[Tuple[str, ...], float]]] = None
+        registry.register(self)
+
+    def set_function(self, function: Callable[[], Dict[Tuple[str, ...], float]]):
+        """Compute the values when scraped. ``function`` maps label values to the metric value."""
+        self._function = function
+
+    def describe(self):
+        return [self.family(self.name, self.documentation, labels=self.labelnames)]
+
+    def collect(self):
+        metric = self.family(self.name, self.documentation, labels=self.labelnames)
+        if self._function is not None:
+            for labels, value in self._function().items():
+                metric.add_metric(list(labels), value)
+        yield metric
+
+
+STAGE_SECONDS = Histogram(
+    "rag_stage_duration_seconds",
+    "Time spent in each stage of a chat request",
+    ["stage"],
+    buckets=DEFAULT_BUCKETS,
+    registry=REGISTRY,
+)
+FUNCTION_SECONDS = Histogram(
+    "function_duration_seconds",
+    "Duration of functions decorated with timeit",
+    ["function"],
+    buckets=DEFAULT_BUCKETS,
+    registry=REGISTRY,
+)
+HTTP_REQUESTS = Counter(
+    "http_requests_total",
+    "HTTP requests served",
+    ["method", "route", "status"],
+    registry=REGISTRY,
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request duration until the last byte of the response was sent",
+    ["method", "route"],
+    buckets=DEFAULT_BUCKETS,
+    registry=REGISTRY,
+)
+HTTP_IN_FLIGHT = Gauge(
+    "http_requests_in_flight",
+    "HTTP requests currently being served",
+    registry=REGISTRY,
+)
+CACHE_REQUESTS = FunctionMetric(
+    CounterMetricFamily,
+    "cache_requests_total",
+    "Cache lookups, by cache and result",
+    ["cache", "result"],
+)
+CACHE_HIT_RATIO = FunctionMetric(
+    GaugeMetricFamily,
+    "cache_hit_ratio",
+    "Share of cache lookups that were hits",
+    ["cache"],
+)
+CACHE_ENTRIES = FunctionMetric(
+    GaugeMetricFamily,
+    "cache_entries",
+    "Entries currently held in memory by each cache",
+    ["cache"],
+)
+LLM_QUEUE_SECONDS = Histogram(
+    "llm_queue_wait_seconds",
+    "Time LLM requests waited for a generation slot, by priority",
+    ["priority"],
+    buckets=DEFAULT_BUCKETS,
+    registry=REGISTRY,
+)
+LLM_REQUESTS = Counter(
+    "llm_requests_total",
+    "LLM requests by priority and outcome (generated, coalesced, rejected, failed)",
+    ["priority", "result"],
+    registry=REGISTRY,
+)
+LLM_QUEUE_DEPTH = FunctionMetric(
+    GaugeMetricFamily,
+    "llm_queue_depth",
+    "LLM requests waiting for a generation slot, by priority",
+    ["priority"],
+)
+LLM_IN_FLIGHT = Gauge(
+    "llm_generations_in_flight",
+    "LLM generations currently running",
+    registry=REGISTRY,
+)
+
+# cache name -> function returning the cache's stats() dict
+_cache_stats: Dict[str, Callable[[], dict]] = {}
+
+
+def register_cache(name: str, stats: Callable[[], dict]):
+    """Export the ``hits``, ``misses``, ``hit_rate`` and ``size`` stats of a cache."""
+    _cache_stats[name] = stats
+
+
+def _collect_caches(field: str) -> Dict[Tuple[str, ...], float]:
+    return {(name,): stats()[field] for name, stats in list(_cache_stats.items())}
+
+
+def _collect_cache_requests() -> Dict[Tuple[str, ...], float]:
+    values = {}
+    for name, stats in list(_cache_stats.items()):
+        data = stats()
+        values[(name, "hit")] = data["hits"]
+        values[(name, "miss")] = data["misses"]
+    return values
+
+
+CACHE_REQUESTS.set_function(_collect_cache_requests)
+CACHE_HIT_RATIO.set_function(lambda: _collect_caches("hit_rate"))
+CACHE_ENTRIES.set_function(lambda: _collect_caches("size"))
+
+
+def observe_stage(stage: str):
+    """Context manager recording the duration of a chat request stage."""
+    return STAGE_SECONDS.labels(stage).time()
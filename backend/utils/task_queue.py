@@ -0,0 +1,88 @@
+from utils.utils import get_logger
+
+from typing import Awaitable, Callable, Hashable, Optional
+import asyncio
+
+logger = get_logger()
+
+
+class KeyedTaskQueue:
+    """In-process queue running background coroutines with bounded concurrency.
+
+    Jobs are identified by a key. Submitting a key that is already queued or
+    running is a no-op, so bursts of requests for the same session collapse
+    into a single job. Workers are started on the first submission.
+
+    Args:
+        name (str): Name used in log messages and worker task names.
+        max_workers (int): Maximum number of jobs running at the same time.
+        max_size (int): Maximum number of queued jobs, further submissions are dropped. 0 means unbounded.
+    """
+
+    def __init__(self, name: str, max_workers: int = 2, max_size: int = 0):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_size = max_size
+        self._queue: Optional[asyncio.Queue] = None
+        self._keys: set = set()
+        self._workers: list[asyncio.Task] = []
+
+    def submit(self, key: Hashable, job: Callable[[], Awaitable]) -> bool:
+        """Queue ``job()`` unless a job with the same key is already pending.
+
+        Must be called from the event loop.
+
+        Args:
+            key (Hashable): The job key, e.g. a session ID.
+            job (Callable[[], Awaitable]): Factory of the coroutine to run.
+
+        Returns:
+            bool: True if the job was queued, False if it was merged or dropped.
+        """
+        if key in self._keys:
+            return False
+        self._start()
+        try:
+            self._queue.put_nowait((key, job))
+        except asyncio.QueueFull:
+            logger.warning(f"{self.name} queue is full, dropping job {key}")
+            return False
+        self._keys.add(key)
+        return True
+
+    def _start(self):
+        if self._workers:
+            return
+        self._queue = asyncio.Queue(self.max_size)
+        self._workers = [
+            asyncio.create_task(self._work(), name=f"{self.name}-{i}") for i in range(self.max_workers)
+        ]
+
+    async def _work(self):
+        while True:
+            key, job = await self._queue.get()
+            try:
+                await job()
+            except Exception as e:
+                logger.warning(f"{self.name} job {key} failed: {e}")
+            finally:
+                self._keys.discard(key)
+                self._queue.task_done()
+
+    def pending(self) -> int:
+        """Number of jobs queued or running."""
+        return len(self._keys)
+
+    async def join(self):
+        """Wait until every submitted job has finished."""
+        if self._queue is not None:
+            await self._queue.join()
+
+    async def stop(self):
+        """Cancel the workers, dropping the jobs that did not run yet."""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._queue = None
+        self._keys.clear()
@@ -1,37 +1,232 @@
-from utils.constants import OLLAMA_EMBEDDING_MODEL
-
-from langchain_ollama import OllamaEmbeddings
+from utils.constants import (OLLAMA_EMBEDDING_MODEL, EMBEDDING_CACHE_SIZE, EMBEDDING_CACHE_TTL, EMBEDDING_CACHE_PATH,
+                             LOG_LEVEL, LOG_FORMAT, LOG_PAYLOAD_SAMPLE_RATE, LOG_PAYLOAD_MAX_CHARS)
+from utils.embeddings import CachedEmbeddings
+from utils.metrics import FUNCTION_SECONDS, register_cache
 
+import atexit
+import copy
+import functools
+import inspect
+import json
 import logging
+import logging.handlers
+import os
+import queue
+import random
+import threading
 import time
 from rich.logging import RichHandler
 
-logging.basicConfig(
-    level=logging.INFO,
-    format="[%(funcName)s]: %(message)s",
-    datefmt="%Y-%m-%d %H:%M:%S",
-    handlers=[RichHandler()]
-)
+
+class JsonFormatter(logging.Formatter):
+    """Format records as one JSON object per line."""
+
+    def format(self, record):
+        data = {
+            "time": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "function": record.funcName,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            data["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            data["exception"] = record.exc_text
+        return json.dumps(data, default=str)
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that leaves the expensive formatting to the listener thread.
+
+    The stock handler runs the whole formatter on the calling thread, which is
+    the event loop for most of our logs. Here only the message is rendered,
+    so the record no longer refers to its arguments, except for Payload
+    arguments rendered by the listener. Tracebacks are rendered to text so the
+    queued record does not keep the frames alive.
+    """
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        args = record.args if isinstance(record.args, tuple) else ()
+        if not any(isinstance(arg, Payload) for arg in args):
+            record.msg = record.getMessage()
+            record.args = None
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = _exception_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class ForkSafeQueueListener(logging.handlers.QueueListener):
+    """QueueListener that never writes a record while the process forks.
+
+    A child forked in the middle of a write would inherit the locks taken by
+    the handler (the console's, or the import lock of a module Rich loads on
+    first use) with no thread left to release them.
+    """
+
+    def handle(self, record):
+        with _fork_lock:
+            super().handle(record)
+
+
+class Payload:
+    """Log argument rendered lazily and truncated to ``max_chars``."""
+
+    __slots__ = ("value", "max_chars")
+
+    def __init__(self, value, max_chars: int = LOG_PAYLOAD_MAX_CHARS):
+        self.value = value
+        self.max_chars = max_chars
+
+    def __str__(self):
+        text = str(self.value)
+        if len(text) <= self.max_chars:
+            return text
+        return f"{text[:self.max_chars]}... [{len(text) - self.max_chars} more chars]"
+
+
+def build_log_handler(log_format: str = LOG_FORMAT) -> logging.Handler:
+    """Build the handler doing the actual output, Rich for the console or plain JSON lines."""
+    if log_format == "json":
+        handler = logging.StreamHandler()
+        handler.setFormatter(JsonFormatter())
+        return handler
+    handler = RichHandler()
+    handler.setFormatter(logging.Formatter("[%(funcName)s]: %(message)s", datefmt="%Y-%m-%d %H:%M:%S"))
+    return handler
+
+
+_exception_formatter = logging.Formatter()
+_listener = None
+_handler = None
+_hooks_registered = False
+# Held by the listener while it writes a record, and by the forking thread during a fork
+_fork_lock = threading.Lock()
+
+
+def _set_root_handler(handler: logging.Handler):
+    root = logging.getLogger()
+    for old in root.handlers[:]:
+        root.removeHandler(old)
+    root.addHandler(handler)
+
+
+def _start_listener(handler: logging.Handler):
+    global _listener
+    log_queue = queue.SimpleQueue()
+    _listener = ForkSafeQueueListener(log_queue, handler, respect_handler_level=True)
+    _listener.start()
+    _set_root_handler(DeferredQueueHandler(log_queue))
+
+
+def _stop_listener():
+    """Flush the queued records and stop the listener thread, if it was started."""
+    if _listener is not None and _listener._thread is not None:
+        _listener.stop()
+
+
+def _log_directly_in_child():
+    global _listener
+    # Forked processes (ingestion workers) do not inherit the listener thread, and pool
+    # workers leave through os._exit, which skips atexit, so they write their records themselves
+    _listener = None
+    _fork_lock.release()
+    _set_root_handler(_handler)
+
+
+def configure_logging(level: str = LOG_LEVEL, log_format: str = LOG_FORMAT):
+    """Route all logging through a queue so formatting and I/O happen on a background thread.
+
+    Args:
+        level (str, optional): Root log level. Defaults to LOG_LEVEL.
+        log_format (str, optional): "rich" or "json". Defaults to LOG_FORMAT.
+    """
+    global _handler, _hooks_registered
+    _stop_listener()
+    _handler = build_log_handler(log_format)
+    logging.getLogger().setLevel(level)
+    _start_listener(_handler)
+    if not _hooks_registered:
+        os.register_at_fork(before=_fork_lock.acquire, after_in_parent=_fork_lock.release,
+                            after_in_child=_log_directly_in_child)
+        atexit.register(_stop_listener)
+        _hooks_registered = True
+
+
+configure_logging()
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.DEBUG)
+
+
+def log_payload(message: str, *payloads, level: int = logging.DEBUG):
+    """Log large payloads (prompts, responses), sampled and truncated.
+
+    Only LOG_PAYLOAD_SAMPLE_RATE of the calls are logged and the payloads are
+    rendered by the logging thread.
+
+    Args:
+        message (str): %-style message with one placeholder per payload.
+        *payloads: The values to log.
+        level (int, optional): Log level. Defaults to logging.DEBUG.
+    """
+    if not logger.isEnabledFor(level) or random.random() >= LOG_PAYLOAD_SAMPLE_RATE:
+        return
+    logger.log(level, message, *(Payload(p) for p in payloads), stacklevel=2)
 
 
 def timeit(func):
-    """Decorator to time a function."""
+    """Decorator recording the duration of a sync or async function.
+
+    Durations go to the ``function_duration_seconds`` histogram, labelled with
+    the function name, and are exposed on ``/metrics``.
+    """
+    histogram = FUNCTION_SECONDS.labels(func.__name__)
+
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - start)
+        return async_wrapper
+
+    @functools.wraps(func)
     def wrapper(*args, **kwargs):
-        logger.info(f"Function '{func.__name__}' | Started ...")
         start = time.perf_counter()
-        result = func(*args, **kwargs)
-        end = time.perf_counter()
-        logger.info(f"Function '{func.__name__}' | Completed in {end - start:.4f} seconds.")
-        return result
+        try:
+            return func(*args, **kwargs)
+        finally:
+            histogram.observe(time.perf_counter() - start)
     return wrapper
 
 
 @timeit
+@functools.cache
 def get_embedding_model():
+    """Get the shared, cached embedding model.
+
+    The same instance is returned on every call so the vector store and
+    ingestion share one cache.
+
+    Returns:
+        CachedEmbeddings: OllamaEmbeddings wrapped with the query/document cache.
+    """
+    from langchain_ollama import OllamaEmbeddings
+
     embeddings = OllamaEmbeddings(model=OLLAMA_EMBEDDING_MODEL)
-    return embeddings
+    cached = CachedEmbeddings(
+        embeddings,
+        model_name=OLLAMA_EMBEDDING_MODEL,
+        max_size=EMBEDDING_CACHE_SIZE,
+        ttl=EMBEDDING_CACHE_TTL,
+        persist_path=EMBEDDING_CACHE_PATH,
+    )
+    register_cache("embedding", cached.stats)
+    return cached
 
 
 def get_logger():